@@ -2,32 +2,163 @@
 import warnings
 warnings.filterwarnings("ignore", category=UserWarning)
 
-from flask import Flask, render_template, request, redirect, url_for, flash, send_from_directory, session, jsonify, Response
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, Response
 import os
 import base64
 import io
 import csv
+import json
 import random
-from datetime import datetime
+from datetime import datetime, timedelta
 import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import uuid
+import time
 from functools import wraps
 try:
     # Try to use the new SQL database module first
     from database_sql import (
-        add_student, get_attendance, get_next_student_id, get_all_students, get_student_by_id, 
-        delete_student_by_id, verify_admin, update_student, KNOWN_FACES_DIR, get_student_attendance
+        add_student, add_new_student, get_all_students, get_student_by_id, 
+        delete_student_by_id, verify_admin, update_student, KNOWN_FACES_DIR,
+        get_dashboard_stats, get_recent_attendance, get_student_daily_attendance,
+        get_session_days, get_daily_headcount, get_faculty_attendance, get_students_below_days, get_latest_attendance_id,
+        search_students, get_students_page, get_data_version, create_tables
     )
     print("Using database_sql module")
 except ImportError:
     # Fallback to the original SQLite database module
     from database import (
-        add_student, get_attendance, get_next_student_id, get_all_students, get_student_by_id, 
-        delete_student_by_id, verify_admin, update_student, KNOWN_FACES_DIR, get_student_attendance
+        add_student, add_new_student, get_all_students, get_student_by_id, 
+        delete_student_by_id, verify_admin, update_student, KNOWN_FACES_DIR,
+        get_dashboard_stats, get_recent_attendance, get_student_daily_attendance,
+        get_session_days, get_daily_headcount, get_faculty_attendance, get_students_below_days, get_latest_attendance_id,
+        search_students, get_students_page, get_data_version, create_tables
     )
     print("Using database module")
+import face_store
+import metrics
+import response_cache
+from attendance_feed import AttendanceFeed
+import sampling_profiler
+from face_images import THUMBNAIL_SIZES, enroll_face_image
+from http_cache import file_version, send_cached_file
+
+# Sessions are signed cookies, so every server process must sign with the same key
+SECRET_KEY_FILE = os.environ.get('SECRET_KEY_FILE', os.path.join(os.path.dirname(os.path.abspath(__file__)), ".secret_key"))
+
+def load_secret_key():
+    """SECRET_KEY from the environment, or a random key created once in SECRET_KEY_FILE and reused by every process."""
+    if os.environ.get('SECRET_KEY'):
+        return os.environ['SECRET_KEY']
+    try:
+        # O_EXCL: of several processes starting at once, exactly one writes the key
+        fd = os.open(SECRET_KEY_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        for _ in range(50):
+            with open(SECRET_KEY_FILE, 'rb') as f:
+                key = f.read()
+            if key:
+                return key
+            # Created but not yet written by another process
+            time.sleep(0.01)
+        raise RuntimeError(f"{SECRET_KEY_FILE} is empty; delete it to generate a new session key.")
+    key = os.urandom(32)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(key)
+    return key
 
 app = Flask(__name__)
-app.secret_key = os.urandom(24)
+app.secret_key = load_secret_key()
+metrics.init_app(app)
+# Shared by all request threads; caught up with the database on each read.
+# Built on first use, so importing the app does not load NumPy.
+_attendance_log = None
+_attendance_log_lock = threading.Lock()
+# Largest page /api/attendance returns
+ATTENDANCE_PAGE_MAX = 1000
+# Largest page /api/search and /api/students return
+SEARCH_PAGE_MAX = 100
+# New attendance records for /api/attendance/stream, polled once for all clients
+attendance_feed = AttendanceFeed()
+# An event stream holds a server thread, so it ends after this long and the browser reconnects
+STREAM_SECONDS = 60
+STREAM_HEARTBEAT_SECONDS = 15
+LONG_POLL_MAX_SECONDS = 60
+# Event streams and long polls each hold a server thread while they wait, so only this many may wait at
+# once (default: a quarter of APP_THREADS); the rest are told to come back (503) or answered straight away
+HELD_REQUEST_SLOTS = int(os.environ.get('APP_STREAM_SLOTS', max(1, int(os.environ.get('APP_THREADS', 8)) // 4)))
+held_requests = threading.BoundedSemaphore(HELD_REQUEST_SLOTS)
+# Rendered pages, reused until students or attendance change (see cached_page)
+page_cache = response_cache.from_env()
+# Bulk enrollments run as `bulk_enroll.py --status` processes outside the web workers, one directory
+# per job holding the uploads, the log and status.json (progress, then the per-row report)
+BULK_JOBS_DIR = os.environ.get('BULK_JOBS_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), "bulk_jobs"))
+BULK_JOB_KEEP_SECONDS = 7 * 86400
+# A job whose process has not written its first status by then is reported as interrupted
+BULK_JOB_START_SECONDS = 60
+
+def get_attendance_log():
+    """The shared AttendanceSnapshot, created on first call."""
+    global _attendance_log
+    with _attendance_log_lock:
+        if _attendance_log is None:
+            from attendance_snapshot import AttendanceSnapshot
+            _attendance_log = AttendanceSnapshot()
+        return _attendance_log
+
+# --- HTTP caching --- #
+def face_file_location(size, filename):
+    """Directory and file name actually served for a face image (thumbnail or full image)."""
+    if size:
+        thumbs_dir = os.path.join(KNOWN_FACES_DIR, 'thumbs', size)
+        # Fall back to the full image if the thumbnail was never generated
+        if os.path.exists(os.path.join(thumbs_dir, os.path.basename(filename))):
+            return thumbs_dir, filename
+    return KNOWN_FACES_DIR, filename
+
+@app.url_defaults
+def add_file_version(endpoint, values):
+    """Append a content hash to static and face image URLs so they can be cached for a year."""
+    if 'v' in values or 'filename' not in values:
+        return
+    if endpoint == 'static':
+        directory, filename = app.static_folder, values['filename']
+    elif endpoint in ('known_face_image', 'known_face_thumbnail'):
+        directory, filename = face_file_location(values.get('size'), values['filename'])
+    else:
+        return
+    version = file_version(os.path.join(directory, filename))
+    if version:
+        values['v'] = version
+
+@app.template_global()
+def face_url(student, size=None):
+    """URL of a student's photo or thumbnail ('avatar' or 'icon')."""
+    image_hash = student.get('image_hash')
+    if image_hash:
+        return url_for('face_blob', image_hash=image_hash, size=size or 'full')
+    # Students whose images predate the face store
+    if size:
+        return url_for('known_face_thumbnail', size=size, filename=f"{student['id']}.jpg")
+    return url_for('known_face_image', filename=f"{student['id']}.jpg")
+
+def static_file(filename):
+    """Serve static assets with caching headers and precompressed variants."""
+    return send_cached_file(app.static_folder, filename, precompressed=True)
+
+app.view_functions['static'] = static_file
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus metrics for this process; requires `Authorization: Bearer $METRICS_TOKEN` if that is set."""
+    token = os.environ.get('METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != f"Bearer {token}":
+        return Response(status=401)
+    return Response(metrics.render(), mimetype=metrics.CONTENT_TYPE)
 
 # --- Authentication --- #
 def login_required(f):
@@ -46,6 +177,33 @@ def admin_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+# --- Response caching --- #
+def cached_page(f):
+    """Serve the view's response from `page_cache` until students or attendance change.
+
+    Responses are keyed on the URL, the viewer's role (with the admin ID the
+    admin header shows), today's date and get_data_version(). A request with
+    flashed messages waiting is rendered afresh, as those must show only once.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if page_cache is None or '_flashes' in session:
+            return f(*args, **kwargs)
+        role = f"admin:{session.get('admin_id')}" if 'admin_logged_in' in session else 'user'
+        key = '|'.join((request.full_path, role, datetime.now().strftime("%Y-%m-%d"), str(get_data_version())))
+        route = request.url_rule.rule
+        cached = page_cache.get(key)
+        if cached is not None:
+            metrics.RESPONSE_CACHE.inc(route=route, result='hit')
+            body, content_type = cached
+            return Response(body, content_type=content_type)
+        metrics.RESPONSE_CACHE.inc(route=route, result='miss')
+        response = app.make_response(f(*args, **kwargs))
+        if response.status_code == 200 and not response.direct_passthrough:
+            page_cache.set(key, response.get_data(), response.content_type)
+        return response
+    return decorated_function
+
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
@@ -72,25 +230,35 @@ def logout():
     flash('You were logged out.', 'info')
     return redirect(url_for('login'))
 
+def read_face_upload():
+    """Return the raw bytes of the face photo posted with a form, or None if none was sent."""
+    face_image_data = request.form.get('face_image_data')
+    face_image_file = request.files.get('face_image_file')
+    if face_image_data and face_image_data != 'data:,':
+        # Decode the base64 image from the live capture
+        img_data = re.sub('^data:image/.+;base64,', '', face_image_data)
+        return base64.b64decode(img_data)
+    if face_image_file:
+        return face_image_file.read()
+    return None
+
 # --- Web Pages --- #
 @app.route('/')
 @login_required
+@cached_page
 def index():
     """Render the main page with attendance records."""
-    all_students = get_all_students()
-    all_records = get_attendance()
     today_str = datetime.now().strftime("%Y-%m-%d")
-    
-    # Prepare dashboard stats
-    stats = {
-        'total_students': len(all_students),
-        'total_records': len(all_records),
-        'today_records': sum(1 for r in all_records if r['date'] == today_str)
-    }
-    return render_template('index.html', attendance=all_records[:10], **stats)
+    # Counts come from the daily rollup, so the page no longer reads the whole attendance log
+    stats = get_dashboard_stats(today_str)
+    # The page then follows the attendance feed from here; read first so no record falls in between
+    last_attendance_id = get_latest_attendance_id()
+    return render_template('index.html', attendance=get_recent_attendance(10), today=today_str,
+                           last_attendance_id=last_attendance_id, **stats)
 
 @app.route('/students')
 @login_required
+@cached_page
 def list_students():
     """Render the page that lists all students."""
     students = get_all_students()
@@ -99,15 +267,110 @@ def list_students():
 @app.route('/attendance')
 @login_required
 def list_attendance():
-    """Render a page with all attendance records, fully searchable."""
-    attendance_records = get_attendance()
-    return render_template('attendance.html', attendance=attendance_records)
+    """Render the attendance log page; rows are fetched page by page from /api/attendance."""
+    return render_template('attendance.html')
+
+def attendance_filters(query_arg):
+    """The search text and ?from=/?to= dates (YYYY-MM-DD) of an attendance log request."""
+    start, end = request.args.get('from') or None, request.args.get('to') or None
+    for value in (start, end):
+        if value:
+            datetime.strptime(value, "%Y-%m-%d")
+    return request.args.get(query_arg), start, end
+
+@app.route('/api/attendance')
+@login_required
+def api_attendance():
+    """One page of the attendance log in DataTables' server-side format.
+
+    Takes DataTables' draw/start/length/search[value]/order[0][...]
+    parameters plus optional `from` and `to` dates (YYYY-MM-DD).
+    """
+    try:
+        query, start, end = attendance_filters('search[value]')
+    except ValueError:
+        return jsonify({'success': False, 'message': "Dates must be YYYY-MM-DD."}), 400
+    offset = max(request.args.get('start', 0, type=int), 0)
+    length = request.args.get('length', 25, type=int)
+    if not 0 < length <= ATTENDANCE_PAGE_MAX:
+        length = ATTENDANCE_PAGE_MAX
+    # Table columns: Student ID, Name, Date, Time
+    column = request.args.get('order[0][column]', 2, type=int)
+    order = {0: 'student_id', 1: 'name'}.get(column, 'time')
+
+    attendance_log = get_attendance_log()
+    attendance_log.refresh()
+    # Selected and read in one go: a reload or delete by another thread would invalidate the positions
+    total, filtered, records = attendance_log.query(query, start, end, order=order,
+                                                    descending=request.args.get('order[0][dir]', 'desc') == 'desc',
+                                                    offset=offset, limit=length)
+    return jsonify({
+        'draw': request.args.get('draw', 0, type=int),
+        'recordsTotal': total,
+        'recordsFiltered': filtered,
+        'data': records,
+    })
+
+@app.route('/api/attendance/stream')
+@login_required
+def attendance_stream():
+    """New attendance records after ?since= (or the Last-Event-ID header), as server-sent events or a long poll.
+
+    EventSource clients get an event per record, with the record ID as the
+    event ID. Other clients get JSON {'last_id', 'records'} as soon as
+    there is at least one new record or after ?wait= seconds (default 25);
+    ?wait=0 answers at once, which is how the dashboard polls.
+    Without `since`, only records marked from now on are returned.
+
+    At most HELD_REQUEST_SLOTS requests wait at a time, so waiting clients
+    cannot take every server thread: beyond that, event streams get a 503
+    and long polls are answered without waiting.
+    """
+    since = request.headers.get('Last-Event-ID', request.args.get('since'))
+    since = int(since) if since and since.isdigit() else attendance_feed.latest_id()
+
+    if 'text/event-stream' not in request.headers.get('Accept', ''):
+        wait = min(max(request.args.get('wait', 25.0, type=float), 0.0), LONG_POLL_MAX_SECONDS)
+        held = wait > 0 and held_requests.acquire(blocking=False)
+        try:
+            records = attendance_feed.since(since, timeout=wait if held else 0)
+        finally:
+            if held:
+                held_requests.release()
+        return jsonify({'last_id': records[-1]['id'] if records else since, 'records': records})
+
+    if not held_requests.acquire(blocking=False):
+        return Response("Too many open attendance streams; poll ?wait=0 instead.\n", status=503,
+                        mimetype='text/plain', headers={'Retry-After': str(STREAM_SECONDS)})
+
+    def events(last_id):
+        yield f"retry: 2000\nid: {last_id}\n\n"
+        deadline = time.monotonic() + STREAM_SECONDS
+        while time.monotonic() < deadline:
+            records = attendance_feed.since(last_id, timeout=min(STREAM_HEARTBEAT_SECONDS, deadline - time.monotonic()))
+            if not records:
+                yield ": keep-alive\n\n"
+            for record in records:
+                last_id = record['id']
+                yield f"id: {last_id}\nevent: attendance\ndata: {json.dumps(record)}\n\n"
+
+    response = Response(events(since), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # Also runs when the client disconnects, or when the stream is closed before it started
+    response.call_on_close(held_requests.release)
+    return response
 
 @app.route('/attendance/export')
 @login_required
 def export_attendance():
-    """Export the full attendance log to a CSV file."""
-    attendance_records = get_attendance()
+    """Export the attendance log to a CSV file, optionally only rows matching ?q= between ?from= and ?to=."""
+    try:
+        query, start, end = attendance_filters('q')
+    except ValueError:
+        return jsonify({'success': False, 'message': "Dates must be YYYY-MM-DD."}), 400
+    attendance_log = get_attendance_log()
+    attendance_log.refresh()
+    _, _, attendance_records = attendance_log.query(query, start, end)
 
     # Use an in-memory string buffer to build the CSV
     output = io.StringIO()
@@ -133,10 +396,52 @@ def student_details(student_id):
         return redirect(url_for('list_students'))
     return render_template('student_detail.html', student=student)
 
+@app.route('/api/search')
+@login_required
+def api_search():
+    """Students matching ?q= by ID, name, email or faculty, best match first, a ?page= (from 1) of ?per_page= at a time."""
+    query = (request.args.get('q') or '').strip()
+    if not query:
+        return jsonify({'success': False, 'message': "Search query (q) is required."}), 400
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = request.args.get('per_page', 20, type=int)
+    if not 0 < per_page <= SEARCH_PAGE_MAX:
+        per_page = SEARCH_PAGE_MAX
+    total, students = search_students(query, limit=per_page, offset=(page - 1) * per_page)
+    results = [{
+        'id': student['id'],
+        'name': student['name'],
+        'faculty': student['faculty'],
+        'email': student['email'],
+        'score': round(float(student['score']), 4),
+        'url': url_for('student_details', student_id=student['id']),
+    } for student in students]
+    return jsonify({'query': query, 'page': page, 'per_page': per_page, 'total': total, 'results': results})
+
 @app.route('/known_faces/<filename>')
 def known_face_image(filename):
     """Serve images from the known_faces directory."""
-    return send_from_directory(KNOWN_FACES_DIR, filename)
+    return send_cached_file(KNOWN_FACES_DIR, filename)
+
+@app.route('/faces/<size>/<image_hash>.jpg')
+def face_blob(size, image_hash):
+    """Serve an image from the content-addressed face store; the URL changes whenever the image does."""
+    if (size != 'full' and size not in THUMBNAIL_SIZES) or not re.fullmatch(r'[0-9a-f]{64}', image_hash):
+        return Response(status=404)
+    path = face_store.blob_path(image_hash, None if size == 'full' else size)
+    if not os.path.exists(path) and size != 'full':
+        # Thumbnail missing; serve the canonical image rather than nothing, but revalidated on every
+        # use so the browser switches to the thumbnail once it is built
+        path = face_store.blob_path(image_hash)
+        return send_cached_file(os.path.dirname(path), os.path.basename(path))
+    return send_cached_file(os.path.dirname(path), os.path.basename(path), content_addressed=True)
+
+@app.route('/known_faces/thumbs/<size>/<filename>')
+def known_face_thumbnail(size, filename):
+    """Serve a pre-sized thumbnail, falling back to the full image if it was never generated."""
+    if size not in THUMBNAIL_SIZES:
+        return Response(status=404)
+    return send_cached_file(*face_file_location(size, filename))
 
 # --- Admin Panel Routes --- #
 @app.route('/admin/login', methods=['GET', 'POST'])
@@ -173,54 +478,82 @@ def admin_logout():
 
 @app.route('/admin')
 @admin_required
+@cached_page
 def admin_dashboard():
-    """Admin dashboard with student management overview."""
-    all_students = get_all_students()
-    all_records = get_attendance()
+    """Admin dashboard with student management overview; the student table is filled from /api/students."""
     today_str = datetime.now().strftime("%Y-%m-%d")
-    
-    stats = {
-        'total_students': len(all_students),
-        'total_records': len(all_records),
-        'today_records': sum(1 for r in all_records if r['date'] == today_str)
-    }
-    return render_template('admin_dashboard.html', students=all_students, **stats)
+    stats = get_dashboard_stats(today_str)
+    return render_template('admin_dashboard.html', **stats)
+
+@app.route('/api/students')
+@admin_required
+def api_students():
+    """A page of students by name, after the ?after_name=/?after_id= cursor of the previous page, optionally matching ?q=.
+
+    The response's `next` holds the cursor parameters for the following page, or null after the last one.
+    """
+    limit = request.args.get('limit', 50, type=int)
+    if not 0 < limit <= SEARCH_PAGE_MAX:
+        limit = SEARCH_PAGE_MAX
+    after_name = request.args.get('after_name')
+    # One extra row tells whether there is another page
+    students = get_students_page(after_name, request.args.get('after_id'), limit + 1,
+                                 (request.args.get('q') or '').strip() or None)
+    more = len(students) > limit
+    students = students[:limit]
+    results = [{
+        'id': student['id'],
+        'name': student['name'],
+        'faculty': student['faculty'],
+        'email': student['email'],
+        'icon': face_url(student, 'icon'),
+        'edit_url': url_for('admin_edit_student', student_id=student['id']),
+    } for student in students]
+    last = students[-1] if students else None
+    return jsonify({
+        'students': results,
+        'next': {'after_name': last['name'], 'after_id': last['id']} if more else None,
+    })
+
+@app.route('/admin/profile')
+@admin_required
+def admin_profile():
+    """Sample this server process for ?seconds= (default 10) and return collapsed stacks, or ?format=json for a per-thread summary."""
+    seconds = min(request.args.get('seconds', 10.0, type=float), sampling_profiler.MAX_SECONDS)
+    interval = request.args.get('interval_ms', sampling_profiler.DEFAULT_INTERVAL * 1000, type=float) / 1000
+    try:
+        result = sampling_profiler.profile(seconds, interval)
+    except RuntimeError as e:
+        return jsonify({'success': False, 'message': str(e)}), 409
+    collapsed_path, _ = result.save()
+    if request.args.get('format') == 'json':
+        return jsonify(result.summary())
+    return Response(result.collapsed(), mimetype='text/plain',
+                    headers={"Content-Disposition": f"attachment;filename={os.path.basename(collapsed_path)}"})
 
 @app.route('/admin/register', methods=['GET', 'POST'])
 @admin_required
 def admin_register():
     """Handle new student registration with live photo capture - Admin only."""
     if request.method == 'POST':
-        student_id = get_next_student_id()
         name = request.form['name']
         faculty = request.form.get('faculty', '')
         dob = request.form.get('dob', '')
         email = request.form.get('email', '')
         address = request.form.get('address', '')
 
-        # Add student record to the database first
-        add_student(student_id, name, faculty, dob, email, address)
-
-        face_image_data = request.form.get('face_image_data')
-        face_image_file = request.files.get('face_image_file')
-        face_path = os.path.join(KNOWN_FACES_DIR, f"{student_id}.jpg")
+        # Reserve an ID and add the student record to the database first
+        student_id = add_new_student(name, faculty, dob, email, address)
 
         try:
-            if face_image_data and face_image_data != 'data:,':
-                # Decode the base64 image from the live capture
-                img_data = re.sub('^data:image/.+;base64,', '', face_image_data)
-                img_binary = base64.b64decode(img_data)
-                with open(face_path, 'wb') as f:
-                    f.write(img_binary)
-            elif face_image_file:
-                # Save the uploaded file
-                face_image_file.save(face_path)
-            else:
+            img_binary = read_face_upload()
+            if img_binary is None:
                 # No image was provided, which should be caught by the frontend.
                 # As a fallback, delete the created student record and show an error.
                 flash("No face image was provided. Please capture or upload a photo.", "danger")
                 delete_student_by_id(student_id)
                 return redirect(url_for('admin_register'))
+            enroll_face_image(student_id, img_binary)
 
             flash(f"Student {name} registered successfully with ID: {student_id}", "success")
             return redirect(url_for('admin_dashboard'))
@@ -233,6 +566,115 @@ def admin_register():
 
     return render_template('admin_register.html')
 
+def start_bulk_job(roster_file, photos_zip, photos_dir):
+    """Save the uploads to a new job directory and start bulk_enroll.py on them; returns the job ID."""
+    os.makedirs(BULK_JOBS_DIR, exist_ok=True)
+    cutoff = time.time() - BULK_JOB_KEEP_SECONDS
+    for name in os.listdir(BULK_JOBS_DIR):
+        path = os.path.join(BULK_JOBS_DIR, name)
+        if os.path.isdir(path) and os.path.getmtime(path) < cutoff:
+            shutil.rmtree(path, ignore_errors=True)
+
+    job_id = uuid.uuid4().hex
+    job_dir = os.path.join(BULK_JOBS_DIR, job_id)
+    os.makedirs(job_dir)
+    roster_path = os.path.join(job_dir, 'roster.csv')
+    roster_file.save(roster_path)
+    if photos_zip and photos_zip.filename:
+        photos_path = os.path.join(job_dir, 'photos.zip')
+        photos_zip.save(photos_path)
+    else:
+        photos_path = photos_dir
+    command = [sys.executable, '-u', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bulk_enroll.py'),
+               roster_path, photos_path, '--status', os.path.join(job_dir, 'status.json')]
+    with open(os.path.join(job_dir, 'log.txt'), 'w') as log:
+        # Its own session, so a reload or restart of the web server does not stop the enrollment
+        process = subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT,
+                                   start_new_session=True)
+    # Reap the process when it exits
+    threading.Thread(target=process.wait, daemon=True).start()
+    return job_id
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, TypeError):
+        return pid is not None
+    return True
+
+def read_bulk_job(job_id):
+    """Status of a bulk enrollment job (state, message and, once done, report and summary), or None."""
+    if not re.fullmatch(r'[0-9a-f]{32}', job_id):
+        return None
+    job_dir = os.path.join(BULK_JOBS_DIR, job_id)
+    try:
+        with open(os.path.join(job_dir, 'status.json'), encoding='utf-8') as f:
+            job = json.load(f)
+    except FileNotFoundError:
+        if not os.path.isdir(job_dir):
+            return None
+        job = {'state': 'queued', 'message': "Starting..."}
+        if time.time() - os.path.getmtime(job_dir) > BULK_JOB_START_SECONDS:
+            job = {'state': 'interrupted', 'message': "The enrollment process did not start."}
+    else:
+        if job['state'] == 'running' and not _process_alive(job.get('pid')):
+            job.update(state='interrupted', message=f"The enrollment process stopped: {job['message']}")
+    if job['state'] not in ('queued', 'running'):
+        # The report is in status.json; the uploaded photos are no longer needed
+        try:
+            os.remove(os.path.join(job_dir, 'photos.zip'))
+        except FileNotFoundError:
+            pass
+    if job['state'] == 'interrupted':
+        job['message'] += f" See {os.path.join(job_dir, 'log.txt')}."
+    return job
+
+@app.route('/admin/register/bulk', methods=['GET', 'POST'])
+@admin_required
+def admin_bulk_register():
+    """Enroll many students at once from a CSV roster and a ZIP/directory of photos - Admin only."""
+    if request.method == 'POST':
+        roster_file = request.files.get('roster_file')
+        photos_zip = request.files.get('photos_zip')
+        photos_dir = request.form.get('photos_dir', '').strip()
+        if not roster_file or not roster_file.filename:
+            flash("Please upload a CSV roster.", "danger")
+            return redirect(url_for('admin_bulk_register'))
+        if not (photos_zip and photos_zip.filename) and not photos_dir:
+            flash("Please upload a ZIP of photos or enter a photo directory on the server.", "danger")
+            return redirect(url_for('admin_bulk_register'))
+
+        try:
+            job_id = start_bulk_job(roster_file, photos_zip, photos_dir)
+        except OSError as e:
+            flash(f"Could not start the bulk enrollment: {e}", "danger")
+            return redirect(url_for('admin_bulk_register'))
+        return redirect(url_for('admin_bulk_job', job_id=job_id))
+
+    return render_template('admin_bulk_register.html', job=None)
+
+@app.route('/admin/register/bulk/<job_id>')
+@admin_required
+def admin_bulk_job(job_id):
+    """Progress, then the per-row report, of a bulk enrollment - Admin only."""
+    job = read_bulk_job(job_id)
+    if job is None:
+        flash("Bulk enrollment job not found.", "danger")
+        return redirect(url_for('admin_bulk_register'))
+    return render_template('admin_bulk_register.html', job=job, job_id=job_id)
+
+@app.route('/api/bulk_jobs/<job_id>')
+@admin_required
+def api_bulk_job(job_id):
+    """State and latest progress message of a bulk enrollment, polled by its page."""
+    job = read_bulk_job(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': 'Job not found'}), 404
+    return jsonify({'success': True, 'state': job['state'], 'message': job['message'],
+                    'updated': job.get('updated')})
+
 @app.route('/admin/student/<student_id>/edit', methods=['GET', 'POST'])
 @admin_required
 def admin_edit_student(student_id):
@@ -252,20 +694,10 @@ def admin_edit_student(student_id):
         update_student(student_id, name, faculty, dob, email, address)
         
         # Handle face image update if provided
-        face_image_data = request.form.get('face_image_data')
-        face_image_file = request.files.get('face_image_file')
-        face_path = os.path.join(KNOWN_FACES_DIR, f"{student_id}.jpg")
-        
         try:
-            if face_image_data and face_image_data != 'data:,':
-                # Decode the base64 image from the live capture
-                img_data = re.sub('^data:image/.+;base64,', '', face_image_data)
-                img_binary = base64.b64decode(img_data)
-                with open(face_path, 'wb') as f:
-                    f.write(img_binary)
-            elif face_image_file:
-                # Save the uploaded file
-                face_image_file.save(face_path)
+            img_binary = read_face_upload()
+            if img_binary is not None:
+                enroll_face_image(student_id, img_binary)
         except Exception as e:
             flash(f"An error occurred while updating the image: {e}", "warning")
         
@@ -322,12 +754,13 @@ def student_attendance():
         return redirect(url_for('student_login'))
     
     try:
-        attendance_records = get_student_attendance(student_id)
+        attendance_days = get_student_daily_attendance(student_id)
     except Exception as e:
         flash(f'Error retrieving attendance records: {e}', 'danger')
         return redirect(url_for('student_login'))
     
-    return render_template('student_attendance.html', student=student, attendance=attendance_records)
+    return render_template('student_attendance.html', student=student, attendance=attendance_days,
+                           total_sightings=sum(day['sightings'] for day in attendance_days))
 
 @app.route('/student/logout')
 def student_logout():
@@ -336,5 +769,78 @@ def student_logout():
     flash('You have been logged out.', 'info')
     return redirect(url_for('student_login'))
 
+# --- Attendance analytics --- #
+# Date range used when a request gives no ?start=
+ANALYTICS_DEFAULT_DAYS = 30
+
+def analytics_range():
+    """The ?start= and ?end= dates (YYYY-MM-DD) of an analytics request; the last 30 days by default."""
+    end = request.args.get('end') or datetime.now().strftime("%Y-%m-%d")
+    start = request.args.get('start')
+    if not start:
+        start = (datetime.strptime(end, "%Y-%m-%d") - timedelta(days=ANALYTICS_DEFAULT_DAYS - 1)).strftime("%Y-%m-%d")
+    for value in (start, end):
+        datetime.strptime(value, "%Y-%m-%d")
+    return start, end
+
+def attendance_rate(days_present, possible_days):
+    return round(days_present / possible_days, 4) if possible_days else None
+
+@app.route('/api/analytics/faculty')
+@admin_required
+@cached_page
+def analytics_faculty():
+    """Attendance rate per faculty: student-days present over students x days with any attendance."""
+    try:
+        start, end = analytics_range()
+    except ValueError:
+        return jsonify({'success': False, 'message': "Dates must be YYYY-MM-DD."}), 400
+    session_days = get_session_days(start, end)
+    faculties = [{
+        'faculty': row['faculty'],
+        'students': row['students'],
+        'days_present': row['days_present'],
+        'rate': attendance_rate(row['days_present'], row['students'] * session_days),
+    } for row in get_faculty_attendance(start, end)]
+    return jsonify({'start': start, 'end': end, 'session_days': session_days, 'faculties': faculties})
+
+@app.route('/api/analytics/daily')
+@admin_required
+@cached_page
+def analytics_daily():
+    """Students present and attendance records per day."""
+    try:
+        start, end = analytics_range()
+    except ValueError:
+        return jsonify({'success': False, 'message': "Dates must be YYYY-MM-DD."}), 400
+    days = [{'date': str(row['date']), 'headcount': row['headcount'], 'sightings': int(row['sightings'] or 0)}
+            for row in get_daily_headcount(start, end)]
+    return jsonify({'start': start, 'end': end, 'days': days})
+
+@app.route('/api/analytics/low-attendance')
+@admin_required
+@cached_page
+def analytics_low_attendance():
+    """Students whose attendance rate is below ?threshold= percent (default 75), optionally within one ?faculty=."""
+    try:
+        start, end = analytics_range()
+    except ValueError:
+        return jsonify({'success': False, 'message': "Dates must be YYYY-MM-DD."}), 400
+    threshold = request.args.get('threshold', 75.0, type=float)
+    faculty = request.args.get('faculty') or None
+    session_days = get_session_days(start, end)
+    # Present on fewer days than this means a rate below the threshold
+    min_days = threshold / 100 * session_days
+    students = [{
+        'student_id': row['student_id'],
+        'name': row['name'],
+        'faculty': row['faculty'],
+        'days_present': row['days_present'],
+        'rate': attendance_rate(row['days_present'], session_days),
+    } for row in get_students_below_days(start, end, min_days, faculty)]
+    return jsonify({'start': start, 'end': end, 'session_days': session_days,
+                    'threshold': threshold, 'students': students})
+
 if __name__ == '__main__':
+    create_tables()
     app.run(debug=True)
@@ -0,0 +1,139 @@
+"""
+Change feed of new attendance records for live views.
+
+Attendance is marked by other processes (the desktop app, recognition.py),
+so new records are found by polling `get_attendance_since(last_id)`, a
+range read on the primary key. One AttendanceFeed per process does that
+polling for everyone: a background thread reads new records every
+POLL_SECONDS while anybody has used the feed in the last IDLE_SECONDS,
+keeps the latest BUFFER_RECORDS in memory and wakes the clients waiting in
+since(). A client that fell further behind than the buffer reads straight
+from the database.
+
+Consumers remember the ID of the last record they saw and ask for what
+came after it; /api/attendance/stream passes that ID as the SSE event ID,
+so a reconnecting browser resumes where it left off.
+
+That only works if records become visible in ID order. SQLite guarantees
+it: one writer at a time allocates the ID and commits. On PostgreSQL and
+MySQL, concurrent transactions take IDs when they insert but commit in any
+order, so ID 101 can be visible while 100 is still uncommitted. A client
+that had moved past 101 would never see 100. The feed therefore stops at
+the first gap in the IDs it reads and re-reads from there on the next
+poll. It waits up to SETTLE_SECONDS for the gap to fill before treating
+the missing IDs as rolled back or skipped by the sequence and moving on.
+A transaction that commits later than that is still missed.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from database_sql import DB_TYPE, get_attendance_since, get_latest_attendance_id
+
+POLL_SECONDS = float(os.environ.get('ATTENDANCE_POLL_SECONDS', 1.0))
+# The poller stops after this long without clients and restarts on the next one
+IDLE_SECONDS = 60
+BUFFER_RECORDS = 1000
+BATCH_LIMIT = 500
+# How long a gap in the IDs holds back the records after it (see above); SQLite has no such gaps
+SETTLE_SECONDS = float(os.environ.get('ATTENDANCE_SETTLE_SECONDS', 0 if DB_TYPE == 'sqlite' else 2.0))
+
+log = logging.getLogger(__name__)
+
+
+def serializable(record):
+    """A feed record with the date and time as text (PostgreSQL and MySQL return date/time objects)."""
+    return {**record, 'date': str(record['date']), 'time': str(record['time'])}
+
+
+class AttendanceFeed:
+    """Shared poller and buffer of recent attendance records."""
+
+    def __init__(self, poll_seconds=POLL_SECONDS):
+        self.poll_seconds = poll_seconds
+        self._changed = threading.Condition()
+        self._recent = deque()
+        # Every record with an ID above `_floor` and up to `last_id` is in `_recent`
+        self._floor = None
+        self.last_id = None
+        # First missing ID after `last_id` and when the poller first saw it missing
+        self._gap = None
+        self._gap_seen = 0.0
+        self._used = 0.0
+        self._thread = None
+        self._starting = threading.Lock()
+
+    def _settled(self, records):
+        """The leading records of a read that follow `last_id` without an unexplained gap in the IDs."""
+        if not SETTLE_SECONDS:
+            return records
+        now = time.monotonic()
+        expected = (self.last_id or 0) + 1
+        for count, record in enumerate(records):
+            if record['id'] > expected:
+                if self._gap != expected:
+                    self._gap, self._gap_seen = expected, now
+                if now - self._gap_seen < SETTLE_SECONDS:
+                    return records[:count]
+            expected = record['id'] + 1
+        return records
+
+    def _poll(self):
+        """Publish new records; returns how many, so the poller knows whether to read another batch."""
+        records = self._settled(get_attendance_since(self.last_id, limit=BATCH_LIMIT))
+        if records:
+            with self._changed:
+                self._recent.extend(serializable(record) for record in records)
+                self.last_id = records[-1]['id']
+                while len(self._recent) > BUFFER_RECORDS:
+                    self._floor = self._recent.popleft()['id']
+                self._changed.notify_all()
+        return len(records)
+
+    def _run(self):
+        while time.monotonic() - self._used < IDLE_SECONDS:
+            time.sleep(self.poll_seconds)
+            try:
+                # Catch up in batches after a burst of marks
+                while self._poll() == BATCH_LIMIT:
+                    pass
+            except Exception:
+                log.exception("Polling for new attendance failed")
+
+    def _start(self):
+        """Make sure the buffer is current and the poller is running."""
+        self._used = time.monotonic()
+        with self._starting:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            if self.last_id is None:
+                with self._changed:
+                    self.last_id = self._floor = get_latest_attendance_id()
+            else:
+                self._poll()
+            self._thread = threading.Thread(target=self._run, name='attendance-feed', daemon=True)
+            self._thread.start()
+
+    def latest_id(self):
+        """ID of the newest attendance record; a new client starts from here."""
+        self._start()
+        return self.last_id
+
+    def since(self, after_id, timeout=0.0):
+        """Records newer than `after_id`, oldest first, waiting up to `timeout` seconds for the first one."""
+        self._start()
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while after_id >= self._floor:
+                records = [record for record in self._recent if record['id'] > after_id]
+                remaining = deadline - time.monotonic()
+                if records or remaining <= 0:
+                    return records
+                self._changed.wait(remaining)
+                self._used = time.monotonic()
+        # Too far behind for the buffer; nothing past `last_id`, which may not have settled yet
+        return [serializable(record) for record in get_attendance_since(after_id, limit=BATCH_LIMIT)
+                if record['id'] <= self.last_id]
@@ -0,0 +1,284 @@
+"""
+Columnar in-memory copy of the attendance log for fast filtering.
+
+The log is held as NumPy arrays, one entry per attendance row: its ID, the
+time it was taken (seconds since 1970-01-01 in local wall-clock time) and
+an index into a small table of students. Names and IDs live only in that
+table, so a search compares a few thousand strings and then selects rows
+with one array lookup, instead of testing a million dicts.
+
+refresh() is cheap enough to call before every read: it appends rows newer
+than the last attendance ID it has seen and re-reads students named in
+`gallery_changes` (renames and deletions). Every VERIFY_SECONDS it also
+compares the row count with the database's and rebuilds from scratch if
+rows disappeared that it was not told about.
+
+Used by the attendance tab of the desktop app and by /api/attendance.
+"""
+
+import threading
+import time
+
+import numpy as np
+
+from database_sql import (
+    get_all_students, get_attendance_columns, get_attendance_watermark, get_gallery_change_cursor, get_gallery_changes,
+    get_student_by_id
+)
+
+SECONDS_PER_DAY = 86400
+# Counting the rows to notice deletions by other processes reads the whole
+# table, so it is done at most this often (seconds)
+VERIFY_SECONDS = 10
+# More renamed/deleted students than this in one refresh reloads the whole student table
+STUDENT_RELOAD_THRESHOLD = 200
+
+
+def _epoch_seconds(dates, times):
+    """Seconds since the epoch for parallel lists of dates and times as returned by any backend."""
+    if not dates:
+        return np.empty(0, dtype=np.int64)
+    # SQLite returns 'YYYY-MM-DD' / 'HH:MM:SS' text; PostgreSQL and MySQL return date and time/timedelta objects
+    days = np.array([str(d) for d in dates] if not isinstance(dates[0], str) else dates, dtype='datetime64[D]')
+    if isinstance(times[0], str):
+        digits = np.array(times, dtype='U8').view(np.uint32).reshape(-1, 8).astype(np.int64) - ord('0')
+        seconds = (digits[:, 0] * 10 + digits[:, 1]) * 3600 + (digits[:, 3] * 10 + digits[:, 4]) * 60 \
+            + digits[:, 6] * 10 + digits[:, 7]
+    else:
+        seconds = np.array([int(t.total_seconds()) if hasattr(t, 'total_seconds')
+                            else t.hour * 3600 + t.minute * 60 + t.second for t in times], dtype=np.int64)
+    return days.astype(np.int64) * SECONDS_PER_DAY + seconds
+
+
+def day_bounds(start=None, end=None):
+    """Epoch seconds [from, to) covering the dates `start`..`end` (YYYY-MM-DD, inclusive); None for open ends."""
+    low = int(np.datetime64(start, 'D').astype(np.int64)) * SECONDS_PER_DAY if start else None
+    high = (int(np.datetime64(end, 'D').astype(np.int64)) + 1) * SECONDS_PER_DAY if end else None
+    return low, high
+
+
+class AttendanceSnapshot:
+    """The attendance log as NumPy columns, refreshed incrementally from the database."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.last_id = 0
+        self.change_id = 0
+        self.refreshed = None
+        # Bumped whenever existing positions change meaning (reload, remove)
+        self.generation = 0
+        # When the row count was last compared with the database's
+        self.verified = 0.0
+        self._clear()
+
+    def _clear(self):
+        self.ids = np.empty(0, dtype=np.int64)
+        self.epochs = np.empty(0, dtype=np.int64)
+        self.students = np.empty(0, dtype=np.int32)
+        # Dictionary of students referenced by the rows: index -> ID, name, still enrolled
+        self.student_ids = []
+        self.names = []
+        self.enrolled = np.empty(0, dtype=bool)
+        self._student_index = {}
+        self._order = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def visible_count(self):
+        """Rows of students that are still enrolled, i.e. what select() can return."""
+        with self._lock:
+            return int(np.count_nonzero(self.enrolled[self.students])) if len(self.students) else 0
+
+    # --- Loading --- #
+    def _student(self, student_id):
+        index = self._student_index.get(student_id)
+        if index is None:
+            index = self._student_index[student_id] = len(self.student_ids)
+            self.student_ids.append(student_id)
+            self.names.append('')
+        return index
+
+    def _set_students(self, students):
+        for student in students:
+            self.names[self._student(student['id'])] = student.get('name') or ''
+        enrolled = np.zeros(len(self.student_ids), dtype=bool)
+        enrolled[[self._student_index[student['id']] for student in students]] = True
+        self.enrolled = enrolled
+
+    def _append(self, columns):
+        if not columns['id']:
+            return 0
+        students = np.fromiter((self._student(sid) for sid in columns['student_id']), dtype=np.int32,
+                               count=len(columns['student_id']))
+        epochs = _epoch_seconds(columns['date'], columns['time'])
+        if self._order is not None:
+            if len(self.epochs) == 0 or epochs.min() >= self.epochs.max() and np.all(np.diff(epochs) >= 0):
+                # Usual case: new rows are the newest, so the time order just grows at the end
+                self._order = np.concatenate([self._order, np.arange(len(self.ids), len(self.ids) + len(epochs))])
+            else:
+                self._order = None
+        self.ids = np.concatenate([self.ids, np.asarray(columns['id'], dtype=np.int64)])
+        self.epochs = np.concatenate([self.epochs, epochs])
+        self.students = np.concatenate([self.students, students])
+        # Students first seen in these rows are shown until the student table says otherwise
+        self._grow_enrolled()
+        return len(epochs)
+
+    def _grow_enrolled(self):
+        missing = len(self.student_ids) - len(self.enrolled)
+        if missing:
+            self.enrolled = np.concatenate([self.enrolled, np.ones(missing, dtype=bool)])
+
+    def _sync_students(self):
+        changes = get_gallery_changes(self.change_id, limit=STUDENT_RELOAD_THRESHOLD + 1)
+        if not changes:
+            return
+        if len(changes) > STUDENT_RELOAD_THRESHOLD:
+            self.change_id = get_gallery_change_cursor()
+            self._set_students(get_all_students())
+            return
+        self.change_id = changes[-1][0]
+        for student_id in dict.fromkeys(student_id for _, student_id in changes):
+            student = get_student_by_id(student_id)
+            index = self._student(student_id)
+            self._grow_enrolled()
+            # delete_student_by_id keeps the attendance rows; like get_attendance()'s JOIN, they are no longer shown
+            self.enrolled[index] = student is not None
+            if student is not None:
+                self.names[index] = student.get('name') or ''
+
+    def reload(self):
+        """Drop everything and load the whole log again."""
+        with self._lock:
+            self._clear()
+            self.generation += 1
+            self.change_id = get_gallery_change_cursor()
+            count, last_id = get_attendance_watermark()
+            self._append(get_attendance_columns(0, last_id))
+            self.last_id = last_id
+            self._set_students(get_all_students())
+            self.refreshed = self.verified = time.time()
+            return len(self)
+
+    def refresh(self):
+        """Catch up with the database; returns the number of new rows."""
+        with self._lock:
+            if self.refreshed is None:
+                return self.reload()
+            now = time.time()
+            if now - self.verified < VERIFY_SECONDS:
+                # New rows only: a range read on the primary key
+                columns = get_attendance_columns(self.last_id)
+                added = self._append(columns)
+                if added:
+                    self.last_id = columns['id'][-1]
+                self._sync_students()
+                self.refreshed = now
+                return added
+            count, last_id = get_attendance_watermark()
+            added = 0
+            if last_id > self.last_id:
+                added = self._append(get_attendance_columns(self.last_id, last_id))
+                self.last_id = last_id
+            self._sync_students()
+            if len(self) != count:
+                # Rows were deleted by another process
+                return self.reload()
+            self.refreshed = self.verified = now
+            return added
+
+    def remove(self, attendance_ids):
+        """Forget rows this process deleted itself, so the next refresh need not reload."""
+        with self._lock:
+            keep = ~np.isin(self.ids, np.asarray(list(attendance_ids), dtype=np.int64))
+            self.ids, self.epochs, self.students = self.ids[keep], self.epochs[keep], self.students[keep]
+            self._order = None
+            self.generation += 1
+
+    # --- Queries --- #
+    def _time_order(self):
+        if self._order is None:
+            self._order = np.argsort(self.epochs, kind='stable')
+        return self._order
+
+    def _student_matches(self, query, prefix):
+        ids = np.array(self.student_ids, dtype=str) if self.student_ids else np.empty(0, dtype=str)
+        names = np.char.lower(np.array(self.names, dtype=str)) if self.names else np.empty(0, dtype=str)
+        if prefix:
+            return np.char.startswith(names, query) | np.char.startswith(np.char.lower(ids), query)
+        return (np.char.find(names, query) >= 0) | (np.char.find(np.char.lower(ids), query) >= 0)
+
+    def select(self, query=None, start=None, end=None, prefix=False, order='time', descending=True, positions=None,
+               upto=None):
+        """Positions of the rows matching a search, in display order.
+
+        `query` matches a substring (or with `prefix`, the start) of the
+        student's name or ID, or part of the date; `start` and `end` are
+        inclusive YYYY-MM-DD dates. Rows of deleted students never match.
+        With `positions`, only those rows are considered (e.g. just-added
+        ones); with `upto`, only the first `upto` rows.
+        """
+        with self._lock:
+            students = self.students if positions is None else self.students[positions]
+            epochs = self.epochs if positions is None else self.epochs[positions]
+            mask = self.enrolled[students] if len(students) else np.zeros(0, dtype=bool)
+            if upto is not None and positions is None:
+                mask[upto:] = False
+            low, high = day_bounds(start, end)
+            if low is not None:
+                mask &= epochs >= low
+            if high is not None:
+                mask &= epochs < high
+            query = (query or '').strip().lower()
+            if query and len(students):
+                matches = self._student_matches(query, prefix)[students]
+                if not prefix:
+                    # Dates are matched through a table of the (few hundred) distinct days
+                    days = epochs // SECONDS_PER_DAY
+                    first = days.min()
+                    labels = np.arange(first, days.max() + 1).astype('datetime64[D]').astype(str)
+                    matches |= (np.char.find(labels, query) >= 0)[days - first]
+                mask &= matches
+
+            if order == 'time' and positions is None:
+                ordered = self._time_order()
+                selected = ordered[mask[ordered]]
+            else:
+                selected = np.flatnonzero(mask) if positions is None else np.asarray(positions)[mask]
+                if order == 'time':
+                    keys = (self.epochs[selected],)
+                else:
+                    names = self.student_ids if order == 'student_id' else [name.lower() for name in self.names]
+                    rank = np.empty(len(names), dtype=np.int64)
+                    rank[np.argsort(np.array(names, dtype=str), kind='stable')] = np.arange(len(names))
+                    keys = (self.epochs[selected], rank[self.students[selected]])
+                selected = selected[np.lexsort(keys)]
+            return selected[::-1] if descending else selected
+
+    def query(self, query=None, start=None, end=None, order='time', descending=True, offset=0, limit=None):
+        """One page of a search as (visible rows, matching rows, attendance dicts of the page).
+
+        Positions are only meaningful until the next reload() or remove(),
+        which another thread may run at any time, so the rows are selected
+        and read under one hold of the lock.
+        """
+        with self._lock:
+            positions = self.select(query, start, end, order=order, descending=descending)
+            page = positions[offset:offset + limit] if limit is not None else positions[offset:]
+            return self.visible_count(), len(positions), self.records(page)
+
+    def records(self, positions):
+        """Attendance dicts ({id, student_id, name, date, time}) for positions returned by select()."""
+        with self._lock:
+            ids, epochs, students = self.ids[positions], self.epochs[positions], self.students[positions]
+            student_ids, names = self.student_ids, self.names
+        dates = (epochs // SECONDS_PER_DAY).astype('datetime64[D]').astype(str)
+        seconds = epochs % SECONDS_PER_DAY
+        return [{
+            'id': int(attendance_id),
+            'student_id': student_ids[student],
+            'name': names[student],
+            'date': date,
+            'time': f"{second // 3600:02d}:{second // 60 % 60:02d}:{second % 60:02d}",
+        } for attendance_id, student, date, second in zip(ids.tolist(), students.tolist(), dates.tolist(), seconds.tolist())]
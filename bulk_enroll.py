@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+Bulk student enrollment from a CSV roster and a ZIP archive or directory of photos.
+
+The roster needs a `Name` and a `Photo` column (the photo's file name inside the
+archive/directory); `Faculty`, `DOB`, `Email` and `Address` are optional.
+Faces are encoded in a process pool and students are written in batched
+transactions together with their encodings, so the camera does not have to
+encode them again at start-up.
+
+Usage:
+    python bulk_enroll.py roster.csv photos.zip
+    python bulk_enroll.py roster.csv photos_dir/ --workers 8 --report report.csv
+    python bulk_enroll.py photos_dir/            # roster.csv inside the directory
+    python bulk_enroll.py roster.csv photos.zip --status job/status.json   # progress for /admin/register/bulk
+"""
+
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import re
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from database_sql import add_students_batch, create_tables, get_face_encodings, reserve_student_ids
+from face_gallery import decode_blob, encode_blob
+from face_images import normalize_face_image, store_face_image
+
+BATCH_SIZE = 500
+# Stricter than the 0.6 matching tolerance: only flag near-certain duplicates
+DUPLICATE_TOLERANCE = 0.45
+ROSTER_FILENAMES = ('roster.csv', 'students.csv')
+EMAIL_RE = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+
+# Per-process cache of open ZIP archives used by the encoding workers
+_open_archives = {}
+
+
+class PhotoSource:
+    """Read-only view over a ZIP archive or a directory of photos."""
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self.is_zip = zipfile.is_zipfile(self.path)
+        if self.is_zip:
+            with zipfile.ZipFile(self.path) as archive:
+                members = [m for m in archive.namelist() if not m.endswith('/')]
+        elif os.path.isdir(self.path):
+            members = []
+            for root, _, files in os.walk(self.path):
+                for filename in files:
+                    members.append(os.path.relpath(os.path.join(root, filename), self.path).replace(os.sep, '/'))
+        else:
+            raise ValueError(f"Photo source must be a ZIP file or a directory: {path}")
+
+        # Rosters usually reference bare file names, so index by basename as well
+        self._members = {}
+        for member in members:
+            self._members.setdefault(member.lower(), member)
+            self._members.setdefault(os.path.basename(member).lower(), member)
+
+    def resolve(self, name):
+        """Return the member path for a roster photo reference, or None."""
+        return self._members.get(name.replace('\\', '/').lower())
+
+    def task(self, member):
+        """Picklable description of a member for the worker processes."""
+        return ('zip' if self.is_zip else 'dir', self.path, member)
+
+
+def _read_member(task):
+    kind, path, member = task
+    if kind == 'zip':
+        archive = _open_archives.get(path)
+        if archive is None:
+            archive = _open_archives[path] = zipfile.ZipFile(path)
+        return archive.read(member)
+    with open(os.path.join(path, member), 'rb') as f:
+        return f.read()
+
+
+def _encode_task(task):
+    """Worker: normalise a photo, encode its single face and store the image.
+
+    Returns a (status, encoding_bytes, image_hash) tuple where status is one of
+    'ok', 'no_face', 'multiple_faces', 'unreadable: <reason>' or
+    'failed: <reason>'; a bad photo never raises into the pool. Images of
+    rows that are later rejected are left for the face store's garbage collector.
+    """
+    import numpy as np
+    import face_recognition
+
+    try:
+        canonical, locations = normalize_face_image(_read_member(task))
+    except Exception as e:
+        return f"unreadable: {e}", None, None
+
+    if not locations:
+        return 'no_face', None, None
+    if len(locations) > 1:
+        return 'multiple_faces', None, None
+    try:
+        encoding = face_recognition.face_encodings(np.asarray(canonical), locations)[0]
+        return 'ok', encode_blob(encoding), store_face_image(canonical)
+    except Exception as e:
+        return f"failed: {e}", None, None
+
+
+def _normalise_row(row):
+    return {(k or '').strip().lower(): (v or '').strip() for k, v in row.items()}
+
+
+def validate_row(row, source):
+    """Return (member, error) for a roster row; error is None when the row is valid."""
+    if not row.get('name'):
+        return None, 'Name is required.'
+    if row.get('dob'):
+        try:
+            datetime.strptime(row['dob'], '%Y-%m-%d')
+        except ValueError:
+            return None, f"Invalid DOB '{row['dob']}', expected YYYY-MM-DD."
+    if row.get('email') and not EMAIL_RE.match(row['email']):
+        return None, f"Invalid email '{row['email']}'."
+    if not row.get('photo'):
+        return None, 'Photo column is empty.'
+    member = source.resolve(row['photo'])
+    if member is None:
+        return None, f"Photo '{row['photo']}' not found."
+    return member, None
+
+
+def _find_duplicates(encodings, existing, labels):
+    """Flag encodings matching an enrolled student or an earlier row of the same batch."""
+    import numpy as np
+
+    known = np.empty((len(existing) + len(encodings), 128), dtype=np.float32)
+    known_ids = [sid for sid, _ in existing]
+    for i, (_, blob) in enumerate(existing):
+        known[i] = decode_blob(blob)
+    count = len(existing)
+
+    duplicates = {}
+    for i, blob in encodings.items():
+        vec = decode_blob(blob)
+        if count:
+            distances = np.linalg.norm(known[:count] - vec, axis=1)
+            best = int(np.argmin(distances))
+            if distances[best] <= DUPLICATE_TOLERANCE:
+                duplicates[i] = known_ids[best]
+                continue
+        known[count] = vec
+        known_ids.append(labels[i])
+        count += 1
+    return duplicates
+
+
+def enroll(rows, source, workers=None, progress=print):
+    """Validate, encode and insert roster rows. Returns a per-row report."""
+    report = []
+    pending = {}
+    for line_no, raw in enumerate(rows, start=2):  # line 1 is the header
+        row = _normalise_row(raw)
+        entry = {'row': line_no, 'name': row.get('name', ''), 'photo': row.get('photo', ''),
+                 'status': 'pending', 'student_id': '', 'message': ''}
+        report.append(entry)
+        member, error = validate_row(row, source)
+        if error:
+            entry.update(status='invalid', message=error)
+        else:
+            pending[len(report) - 1] = (row, member)
+
+    progress(f"{len(pending)} of {len(report)} rows valid, encoding faces...")
+    keys = list(pending)
+    tasks = [source.task(pending[k][1]) for k in keys]
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, len(tasks) // (workers * 4))
+    encodings = {}
+    image_hashes = {}
+    done = 0
+    try:
+        # Spawned rather than forked: the caller may be a threaded server, and a forked child
+        # inherits whatever locks its other threads held at that moment
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            for key, (status, blob, image_hash) in zip(keys, pool.map(_encode_task, tasks, chunksize=chunksize)):
+                done += 1
+                if status == 'ok':
+                    encodings[key] = blob
+                    image_hashes[key] = image_hash
+                else:
+                    messages = {'no_face': 'No face found in photo.',
+                                'multiple_faces': 'More than one face found in photo.'}
+                    report[key].update(status=status.split(':')[0], message=messages.get(status, status))
+    except Exception as e:
+        # A worker process died (e.g. crashed in native code); enroll what was encoded and report the rest
+        progress(f"Encoding stopped after {done} of {len(keys)} photos: {e}")
+        for key in keys[done:]:
+            report[key].update(status='failed', message=f"Not encoded: {e}")
+
+    labels = {key: f"row {report[key]['row']}" for key in encodings}
+    for key, match in _find_duplicates(encodings, get_face_encodings(), labels).items():
+        report[key].update(status='duplicate', message=f"Same person as {match}.")
+        del encodings[key]
+
+    accepted = list(encodings)
+    progress(f"{len(accepted)} faces accepted, writing students...")
+    for key, student_id in zip(accepted, reserve_student_ids(len(accepted))):
+        report[key]['student_id'] = student_id
+
+    for start in range(0, len(accepted), BATCH_SIZE):
+        batch = accepted[start:start + BATCH_SIZE]
+        students = []
+        for key in batch:
+            row, _ = pending[key]
+            students.append((report[key]['student_id'], row['name'], row.get('faculty', ''), row.get('dob', ''),
+                             row.get('email', ''), row.get('address', ''), image_hashes[key]))
+        try:
+            add_students_batch(students, [(report[k]['student_id'], encodings[k]) for k in batch])
+        except Exception as e:
+            for key in batch:
+                report[key].update(status='error', student_id='', message=str(e))
+            continue
+        for key in batch:
+            report[key]['status'] = 'enrolled'
+        progress(f"Enrolled {min(start + BATCH_SIZE, len(accepted))}/{len(accepted)}")
+    return report
+
+
+def summarize(report):
+    """Count report rows per status."""
+    summary = {}
+    for entry in report:
+        summary[entry['status']] = summary.get(entry['status'], 0) + 1
+    return summary
+
+
+def run_bulk_enrollment(roster_file, photos_path, workers=None, progress=print):
+    """Enroll students from an open CSV text stream and a ZIP/directory path."""
+    source = PhotoSource(photos_path)
+    rows = list(csv.DictReader(roster_file))
+    return enroll(rows, source, workers=workers, progress=progress)
+
+
+def write_report(report, path):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=['row', 'name', 'photo', 'status', 'student_id', 'message'])
+        writer.writeheader()
+        writer.writerows(report)
+
+
+def write_status(path, **status):
+    """Atomically replace the JSON status file that the web admin polls."""
+    status['pid'] = os.getpid()
+    status['updated'] = datetime.now().isoformat(timespec='seconds')
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(status, f)
+    os.replace(temp_path, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-enroll students from a CSV roster and photos.")
+    parser.add_argument('roster', help="Roster CSV, or a directory containing roster.csv and the photos")
+    parser.add_argument('photos', nargs='?', help="ZIP archive or directory of photos")
+    parser.add_argument('--workers', type=int, default=None, help="Encoding processes (default: CPU count)")
+    parser.add_argument('--report', help="Write the per-row report to this CSV file")
+    parser.add_argument('--status', help="Keep progress and the final report in this JSON file")
+    args = parser.parse_args()
+
+    roster_path, photos_path = args.roster, args.photos
+    if photos_path is None:
+        if not os.path.isdir(roster_path):
+            parser.error("Give a roster CSV and a photo source, or a directory containing roster.csv")
+        photos_path = roster_path
+        roster_path = next((os.path.join(photos_path, n) for n in ROSTER_FILENAMES
+                            if os.path.exists(os.path.join(photos_path, n))), None)
+        if roster_path is None:
+            parser.error(f"No {' or '.join(ROSTER_FILENAMES)} found in {photos_path}")
+
+    progress = print
+    if args.status:
+        def progress(message):
+            print(message)
+            write_status(args.status, state='running', message=message)
+        progress("Reading roster...")
+
+    try:
+        create_tables()
+        with open(roster_path, 'r', newline='', encoding='utf-8-sig') as f:
+            report = run_bulk_enrollment(f, photos_path, workers=args.workers, progress=progress)
+    except Exception as e:
+        if args.status:
+            write_status(args.status, state='failed', message=str(e))
+        raise
+    if args.status:
+        write_status(args.status, state='done', message="Finished", report=report, summary=summarize(report))
+
+    for entry in report:
+        if entry['status'] != 'enrolled':
+            print(f"Row {entry['row']} ({entry['name'] or '?'}): {entry['status']} - {entry['message']}")
+    print("Summary: " + ", ".join(f"{k}={v}" for k, v in sorted(summarize(report).items())))
+    if args.report:
+        write_report(report, args.report)
+        print(f"Report written to {args.report}")
+
+
+if __name__ == "__main__":
+    main()
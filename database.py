@@ -1,16 +1,25 @@
 
 import sqlite3
+import glob
 import os
+import re
 from datetime import datetime
-import random
 
 # Get the absolute path to the directory where this script is located
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 
 # Define absolute paths for the database and faces directory
-DB_FILE = os.path.join(SCRIPT_DIR, "attendance.db")
+DB_FILE = os.environ.get('DB_FILE', os.path.join(SCRIPT_DIR, "attendance.db"))
 KNOWN_FACES_DIR = os.path.join(SCRIPT_DIR, "known_faces")
 
+# Student IDs are '817' followed by a serial from the id_allocator table
+STUDENT_ID_PREFIX = '817'
+STUDENT_ID_MIN = 10000
+STUDENT_ID_MAX = 99999
+# Student fields covered by search_students() and their bm25 weights
+SEARCH_COLUMNS = ('id', 'name', 'email', 'faculty')
+SEARCH_WEIGHTS = (10.0, 5.0, 2.0, 1.0)
+
 def get_db_connection():
     """Establish a connection to the SQLite database."""
     conn = sqlite3.connect(DB_FILE)
@@ -28,7 +37,8 @@ def create_tables():
                 faculty TEXT,
                 dob TEXT,
                 email TEXT,
-                address TEXT
+                address TEXT,
+                image_hash TEXT
             )
         ''')
         conn.execute('''
@@ -47,12 +57,105 @@ def create_tables():
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS id_allocator (
+                name TEXT PRIMARY KEY,
+                next_value INTEGER NOT NULL
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS data_version (
+                name TEXT PRIMARY KEY,
+                version INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS face_encodings (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                student_id TEXT NOT NULL,
+                encoding BLOB NOT NULL,
+                source TEXT NOT NULL DEFAULT 'enrolled',
+                FOREIGN KEY (student_id) REFERENCES students (id) ON DELETE CASCADE
+            )
+        ''')
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_face_encodings_student ON face_encodings (student_id)")
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS gallery_changes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                student_id TEXT NOT NULL,
+                changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS attendance_daily (
+                student_id TEXT NOT NULL,
+                date TEXT NOT NULL,
+                first_seen TEXT NOT NULL,
+                last_seen TEXT NOT NULL,
+                sightings INTEGER NOT NULL DEFAULT 0,
+                present INTEGER NOT NULL DEFAULT 1,
+                PRIMARY KEY (student_id, date)
+            )
+        ''')
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_attendance_daily_date ON attendance_daily (date)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_attendance_daily_headcount ON attendance_daily (date, sightings)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_attendance_student_date ON attendance (student_id, date, time)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_attendance_date ON attendance (date, time)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_students_name ON students (name, id)")
         # Insert default admin if not exists
         conn.execute('''
             INSERT OR IGNORE INTO admins (id, password) VALUES ('admin1', 'admin1')
         ''')
+        conn.execute(
+            "INSERT OR IGNORE INTO id_allocator (name, next_value) VALUES ('student', ?)",
+            (STUDENT_ID_MIN,)
+        )
+        conn.execute("INSERT OR IGNORE INTO data_version (name, version) VALUES ('content', 0)")
+        # Databases created before images moved to the content-addressed store
+        columns = [row['name'] for row in conn.execute("PRAGMA table_info(students)")]
+        if 'image_hash' not in columns:
+            conn.execute("ALTER TABLE students ADD COLUMN image_hash TEXT")
+        columns = [row['name'] for row in conn.execute("PRAGMA table_info(face_encodings)")]
+        if 'source' not in columns:
+            conn.execute("ALTER TABLE face_encodings ADD COLUMN source TEXT NOT NULL DEFAULT 'enrolled'")
+        # Databases from before the rollup existed get it filled in once
+        if (conn.execute("SELECT 1 FROM attendance_daily LIMIT 1").fetchone() is None
+                and conn.execute("SELECT 1 FROM attendance LIMIT 1").fetchone() is not None):
+            _rebuild_attendance_rollup(conn)
+        _create_search_index(conn)
     conn.close()
 
+def _create_search_index(conn):
+    """FTS5 index over students, kept in sync by triggers; skipped where SQLite lacks FTS5."""
+    columns = ', '.join(SEARCH_COLUMNS)
+    new_values = ', '.join(f"new.{column}" for column in SEARCH_COLUMNS)
+    old_values = ', '.join(f"old.{column}" for column in SEARCH_COLUMNS)
+    existed = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'students_fts'").fetchone() is not None
+    try:
+        conn.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS students_fts USING fts5({columns}, content='students', prefix='2 3')")
+    except sqlite3.OperationalError as e:
+        print(f"Full-text student search unavailable, using LIKE: {e}")
+        return
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS students_fts_insert AFTER INSERT ON students BEGIN
+            INSERT INTO students_fts (rowid, {columns}) VALUES (new.rowid, {new_values});
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS students_fts_delete AFTER DELETE ON students BEGIN
+            INSERT INTO students_fts (students_fts, rowid, {columns}) VALUES ('delete', old.rowid, {old_values});
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS students_fts_update AFTER UPDATE OF {columns} ON students BEGIN
+            INSERT INTO students_fts (students_fts, rowid, {columns}) VALUES ('delete', old.rowid, {old_values});
+            INSERT INTO students_fts (rowid, {columns}) VALUES (new.rowid, {new_values});
+        END
+    ''')
+    if not existed:
+        # Index the students added before the search table existed
+        conn.execute("INSERT INTO students_fts (students_fts) VALUES ('rebuild')")
+
 def get_all_students():
     """Retrieve all students from the database."""
     conn = get_db_connection()
@@ -67,6 +170,56 @@ def get_student_by_id(student_id):
     conn.close()
     return dict(student) if student else None
 
+def get_students_page(after_name=None, after_id=None, limit=50, query=None):
+    """Up to `limit` students ordered by (name, id), starting after the student (`after_name`, `after_id`)."""
+    conditions, params = [], []
+    if after_name is not None:
+        conditions.append("(name > ? OR (name = ? AND id > ?))")
+        params += [after_name, after_name, after_id or '']
+    if query:
+        conditions.append("(lower(name) LIKE ? OR id LIKE ?)")
+        params += [f"%{query.lower()}%", f"%{query}%"]
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    conn = get_db_connection()
+    students = conn.execute(
+        f"SELECT id, name, faculty, email, image_hash FROM students {where} ORDER BY name, id LIMIT ?",
+        params + [limit]
+    ).fetchall()
+    conn.close()
+    return [dict(row) for row in students]
+
+def search_students(query, limit=20, offset=0):
+    """Students matching every word of `query` (a prefix of a word in their ID, name, email or faculty), best first.
+
+    Returns (total matches, page of student dicts with a `score`; higher is better).
+    """
+    terms = re.findall(r'\w+', query.lower())
+    if not terms:
+        return 0, []
+    conn = get_db_connection()
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'students_fts'").fetchone():
+        match = ' '.join(f'"{term}"*' for term in terms)
+        rank = f"bm25(students_fts, {', '.join(str(weight) for weight in SEARCH_WEIGHTS)})"
+        total = conn.execute("SELECT COUNT(*) FROM students_fts WHERE students_fts MATCH ?", (match,)).fetchone()[0]
+        students = conn.execute(f'''
+            SELECT s.id, s.name, s.faculty, s.email, s.image_hash, -{rank} AS score
+            FROM students_fts JOIN students s ON s.rowid = students_fts.rowid
+            WHERE students_fts MATCH ?
+            ORDER BY {rank}, s.name
+            LIMIT ? OFFSET ?
+        ''', (match, limit, offset)).fetchall()
+    else:
+        text = "lower(" + " || ' ' || ".join(f"coalesce({column}, '')" for column in SEARCH_COLUMNS) + ")"
+        where = ' AND '.join(f"{text} LIKE ?" for _ in terms)
+        params = [f"%{term}%" for term in terms]
+        total = conn.execute(f"SELECT COUNT(*) FROM students WHERE {where}", params).fetchone()[0]
+        students = conn.execute(
+            f"SELECT id, name, faculty, email, image_hash, 0 AS score FROM students WHERE {where} ORDER BY name LIMIT ? OFFSET ?",
+            params + [limit, offset]
+        ).fetchall()
+    conn.close()
+    return total, [dict(row) for row in students]
+
 def get_attendance():
     """Retrieve all attendance records, joining with student names."""
     conn = get_db_connection()
@@ -92,26 +245,242 @@ def get_student_attendance(student_id):
     conn.close()
     return [dict(row) for row in attendance]
 
+def get_recent_attendance(limit=10):
+    """The most recent attendance records, joined with student names."""
+    conn = get_db_connection()
+    attendance = conn.execute('''
+        SELECT a.id, s.id as student_id, s.name, a.date, a.time
+        FROM attendance a
+        JOIN students s ON a.student_id = s.id
+        ORDER BY a.date DESC, a.time DESC
+        LIMIT ?
+    ''', (limit,)).fetchall()
+    conn.close()
+    return [dict(row) for row in attendance]
+
+def get_attendance_watermark():
+    """Return (row count, newest attendance ID) of the attendance log; the ID is 0 when it is empty."""
+    conn = get_db_connection()
+    count, last_id = conn.execute("SELECT COUNT(*), MAX(id) FROM attendance").fetchone()
+    conn.close()
+    return count, last_id or 0
+
+def get_latest_attendance_id():
+    """Return the newest attendance ID, or 0 if there are no records."""
+    conn = get_db_connection()
+    row = conn.execute("SELECT MAX(id) FROM attendance").fetchone()
+    conn.close()
+    return row[0] or 0
+
+def get_attendance_since(after_id, limit=500):
+    """Attendance records newer than `after_id`, oldest first, joined with student names."""
+    conn = get_db_connection()
+    attendance = conn.execute('''
+        SELECT a.id, s.id as student_id, s.name, a.date, a.time
+        FROM attendance a
+        JOIN students s ON a.student_id = s.id
+        WHERE a.id > ?
+        ORDER BY a.id
+        LIMIT ?
+    ''', (after_id, limit)).fetchall()
+    conn.close()
+    return [dict(row) for row in attendance]
+
+def get_attendance_columns(after_id=0, upto_id=None):
+    """Attendance rows with an ID above `after_id` (and at most `upto_id`) as column lists, oldest ID first.
+
+    Returns {'id': [...], 'student_id': [...], 'date': [...], 'time': [...]}
+    for building in-memory column stores, without a dict per row.
+    """
+    conn = get_db_connection()
+    if upto_id is None:
+        rows = conn.execute("SELECT id, student_id, date, time FROM attendance WHERE id > ? ORDER BY id", (after_id,)).fetchall()
+    else:
+        rows = conn.execute("SELECT id, student_id, date, time FROM attendance WHERE id > ? AND id <= ? ORDER BY id",
+                            (after_id, upto_id)).fetchall()
+    conn.close()
+    columns = ('id', 'student_id', 'date', 'time')
+    values = list(zip(*rows)) or [()] * len(columns)
+    return {column: list(value) for column, value in zip(columns, values)}
+
+def get_dashboard_stats(today):
+    """Student count, attendance record count and records on `today`, without reading the attendance log."""
+    conn = get_db_connection()
+    stats = {
+        'total_students': conn.execute("SELECT COUNT(*) FROM students").fetchone()[0],
+        'total_records': conn.execute("SELECT COALESCE(SUM(sightings), 0) FROM attendance_daily").fetchone()[0],
+        'today_records': conn.execute(
+            "SELECT COALESCE(SUM(sightings), 0) FROM attendance_daily WHERE date = ?", (today,)
+        ).fetchone()[0],
+    }
+    conn.close()
+    return stats
+
+def get_student_daily_attendance(student_id):
+    """One row per day the student attended: date, first_seen, last_seen, sightings and present, newest first."""
+    conn = get_db_connection()
+    days = conn.execute(
+        "SELECT date, first_seen, last_seen, sightings, present FROM attendance_daily WHERE student_id = ? ORDER BY date DESC",
+        (student_id,)
+    ).fetchall()
+    conn.close()
+    return [dict(row) for row in days]
+
+def get_session_days(start, end):
+    """Number of distinct dates between `start` and `end` (inclusive) on which anyone attended."""
+    conn = get_db_connection()
+    days = conn.execute(
+        "SELECT COUNT(DISTINCT date) FROM attendance_daily WHERE date BETWEEN ? AND ?", (start, end)
+    ).fetchone()[0]
+    conn.close()
+    return days
+
+def get_daily_headcount(start, end):
+    """Students present and attendance rows per date between `start` and `end`, oldest first."""
+    conn = get_db_connection()
+    rows = conn.execute('''
+        SELECT date, COUNT(*) AS headcount, SUM(sightings) AS sightings
+        FROM attendance_daily
+        WHERE date BETWEEN ? AND ?
+        GROUP BY date
+        ORDER BY date
+    ''', (start, end)).fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
+def get_faculty_attendance(start, end):
+    """Per faculty: enrolled students and the student-days they attended between `start` and `end`."""
+    conn = get_db_connection()
+    rows = conn.execute('''
+        SELECT faculty, COUNT(*) AS students, SUM(days_present) AS days_present
+        FROM (
+            SELECT s.faculty,
+                   (SELECT COUNT(*) FROM attendance_daily d
+                    WHERE d.student_id = s.id AND d.date BETWEEN ? AND ?) AS days_present
+            FROM students s
+        ) per_student
+        GROUP BY faculty
+        ORDER BY faculty
+    ''', (start, end)).fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
+def get_students_below_days(start, end, min_days, faculty=None):
+    """Students who attended on fewer than `min_days` days between `start` and `end`, fewest first."""
+    conn = get_db_connection()
+    faculty_filter = "WHERE s.faculty = ?" if faculty else ""
+    params = (start, end) + ((faculty,) if faculty else ()) + (min_days,)
+    rows = conn.execute(f'''
+        SELECT student_id, name, faculty, days_present
+        FROM (
+            SELECT s.id AS student_id, s.name, s.faculty,
+                   (SELECT COUNT(*) FROM attendance_daily d
+                    WHERE d.student_id = s.id AND d.date BETWEEN ? AND ?) AS days_present
+            FROM students s
+            {faculty_filter}
+        ) per_student
+        WHERE days_present < ?
+        ORDER BY days_present, name
+    ''', params).fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
+def _rollup_attendance(conn, student_id, date, time):
+    """Count one new attendance row in the student's attendance_daily row for that date."""
+    conn.execute('''
+        INSERT INTO attendance_daily (student_id, date, first_seen, last_seen, sightings, present)
+        VALUES (?, ?, ?, ?, 1, 1)
+        ON CONFLICT (student_id, date) DO UPDATE SET
+            first_seen = MIN(first_seen, excluded.first_seen),
+            last_seen = MAX(last_seen, excluded.last_seen),
+            sightings = sightings + 1, present = 1
+    ''', (student_id, date, time, time))
+
+def _refresh_rollup_day(conn, student_id, date):
+    """Recompute one student's attendance_daily row for a date from the attendance rows left."""
+    conn.execute("DELETE FROM attendance_daily WHERE student_id = ? AND date = ?", (student_id, date))
+    conn.execute('''
+        INSERT INTO attendance_daily (student_id, date, first_seen, last_seen, sightings, present)
+        SELECT student_id, date, MIN(time), MAX(time), COUNT(*), 1
+        FROM attendance WHERE student_id = ? AND date = ?
+        GROUP BY student_id, date
+    ''', (student_id, date))
+
+def _rebuild_attendance_rollup(conn, since=None):
+    """Regenerate attendance_daily from the attendance log, for every date or from `since` on."""
+    if since:
+        conn.execute("DELETE FROM attendance_daily WHERE date >= ?", (since,))
+        where, params = "WHERE a.date >= ?", (since,)
+    else:
+        conn.execute("DELETE FROM attendance_daily")
+        where, params = "", ()
+    # Joining students leaves out rows of deleted students, as get_attendance() does
+    conn.execute(f'''
+        INSERT INTO attendance_daily (student_id, date, first_seen, last_seen, sightings, present)
+        SELECT a.student_id, a.date, MIN(a.time), MAX(a.time), COUNT(*), 1
+        FROM attendance a
+        JOIN students s ON a.student_id = s.id
+        {where}
+        GROUP BY a.student_id, a.date
+    ''', params)
+
+def rebuild_attendance_rollup(since=None):
+    """Rebuild the daily attendance rollup (all of it, or dates from `since` on). Returns its row count."""
+    conn = get_db_connection()
+    with conn:
+        _rebuild_attendance_rollup(conn, since)
+        _bump_data_version(conn)
+    count = conn.execute("SELECT COUNT(*) FROM attendance_daily").fetchone()[0]
+    conn.close()
+    return count
+
+def _log_gallery_change(conn, student_ids):
+    """Record that the students' face galleries (or names) changed, for running recognizers to pick up."""
+    conn.executemany("INSERT INTO gallery_changes (student_id) VALUES (?)", [(sid,) for sid in student_ids])
+
+def _bump_data_version(conn):
+    """Note a change to students or attendance, invalidating pages cached under the previous version."""
+    conn.execute("UPDATE data_version SET version = version + 1 WHERE name = 'content'")
+
+def get_data_version():
+    """Counter bumped by every write to students or attendance; rendered pages are cached per version."""
+    conn = get_db_connection()
+    row = conn.execute("SELECT version FROM data_version WHERE name = 'content'").fetchone()
+    conn.close()
+    return row['version'] if row else 0
+
 def add_student(student_id, name, faculty, dob, email, address):
     """Add or update a student in the database."""
     conn = get_db_connection()
     with conn:
         conn.execute(
-            "INSERT OR REPLACE INTO students (id, name, faculty, dob, email, address) VALUES (?, ?, ?, ?, ?, ?)",
+            "INSERT INTO students (id, name, faculty, dob, email, address) VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (id) DO UPDATE SET name=excluded.name, faculty=excluded.faculty, dob=excluded.dob, email=excluded.email, address=excluded.address",
             (student_id, name, faculty, dob, email, address)
         )
+        _log_gallery_change(conn, [student_id])
+        _bump_data_version(conn)
     conn.close()
 
 def delete_student_by_id(student_id):
     """Delete a student and their corresponding face image."""
     conn = get_db_connection()
     with conn:
+        conn.execute("DELETE FROM face_encodings WHERE student_id = ?", (student_id,))
+        conn.execute("DELETE FROM attendance_daily WHERE student_id = ?", (student_id,))
         conn.execute("DELETE FROM students WHERE id = ?", (student_id,))
+        _log_gallery_change(conn, [student_id])
+        _bump_data_version(conn)
     conn.close()
+    # The image blob is left to `face_store.py --gc`, whose grace period covers a
+    # concurrent enrolment of the same photo
     
+    
+    # Images saved before the content-addressed store existed
     img_path = os.path.join(KNOWN_FACES_DIR, f"{student_id}.jpg")
     if os.path.exists(img_path):
         os.remove(img_path)
+    for thumb_path in glob.glob(os.path.join(KNOWN_FACES_DIR, "thumbs", "*", f"{student_id}.jpg")):
+        os.remove(thumb_path)
     return True
 
 def mark_attendance_db(student_id):
@@ -136,6 +505,8 @@ def mark_attendance_db(student_id):
             "INSERT INTO attendance (student_id, date, time) VALUES (?, ?, ?)",
             (student_id, date, time)
         )
+        _rollup_attendance(conn, student_id, date, time)
+        _bump_data_version(conn)
     conn.close()
     student_name = get_student_by_id(student_id)['name']
     return {'student_id': student_id, 'name': student_name, 'date': date, 'time': time}
@@ -148,28 +519,149 @@ def add_attendance_record(student_id, date, time):
             "INSERT INTO attendance (student_id, date, time) VALUES (?, ?, ?)",
             (student_id, date, time)
         )
+        _rollup_attendance(conn, student_id, date, time)
+        _bump_data_version(conn)
     conn.close()
 
 def delete_attendance_by_id(attendance_id):
     """Delete an attendance record by its primary key."""
     conn = get_db_connection()
     with conn:
+        row = conn.execute("SELECT student_id, date FROM attendance WHERE id = ?", (attendance_id,)).fetchone()
         conn.execute("DELETE FROM attendance WHERE id = ?", (attendance_id,))
+        if row:
+            _refresh_rollup_day(conn, row['student_id'], row['date'])
+            _bump_data_version(conn)
     conn.close()
     return True
 
+def _reserve_student_ids(conn, count):
+    """Reserve `count` unused student IDs inside the caller's transaction."""
+    reserved = []
+    while len(reserved) < count:
+        needed = count - len(reserved)
+        conn.execute("UPDATE id_allocator SET next_value = next_value + ? WHERE name = 'student'", (needed,))
+        end = conn.execute("SELECT next_value FROM id_allocator WHERE name = 'student'").fetchone()['next_value']
+        if end - 1 > STUDENT_ID_MAX:
+            raise RuntimeError("Unable to generate a unique student ID: the ID space is exhausted.")
+        candidates = [STUDENT_ID_PREFIX + str(serial) for serial in range(end - needed, end)]
+        taken = set()
+        for i in range(0, len(candidates), 500):
+            chunk = candidates[i:i + 500]
+            markers = ', '.join('?' * len(chunk))
+            taken.update(row['id'] for row in conn.execute(f"SELECT id FROM students WHERE id IN ({markers})", chunk))
+        reserved.extend(sid for sid in candidates if sid not in taken)
+    return reserved
+
+def reserve_student_ids(count):
+    """Atomically reserve a block of unique student IDs (e.g. for bulk enrollment)."""
+    if count <= 0:
+        return []
+    conn = get_db_connection()
+    with conn:
+        ids = _reserve_student_ids(conn, count)
+    conn.close()
+    return ids
+
 def get_next_student_id():
     """Generate a new, unique student ID."""
+    return reserve_student_ids(1)[0]
+
+def add_new_student(name, faculty, dob, email, address):
+    """Reserve a student ID and insert the student in one transaction. Returns the new ID."""
     conn = get_db_connection()
-    existing_ids = {row['id'] for row in conn.execute("SELECT id FROM students").fetchall()}
+    with conn:
+        student_id = _reserve_student_ids(conn, 1)[0]
+        conn.execute(
+            "INSERT INTO students (id, name, faculty, dob, email, address) VALUES (?, ?, ?, ?, ?, ?)",
+            (student_id, name, faculty, dob, email, address)
+        )
+        _log_gallery_change(conn, [student_id])
+        _bump_data_version(conn)
     conn.close()
-    
-    for _ in range(10000):
-        random_part = str(random.randint(10000, 99999))
-        sid = '817' + random_part
-        if sid not in existing_ids:
-            return sid
-    raise RuntimeError("Unable to generate a unique student ID.")
+    return student_id
+
+def get_student_id_capacity():
+    """Report how much of the student ID space has been handed out."""
+    conn = get_db_connection()
+    row = conn.execute("SELECT next_value FROM id_allocator WHERE name = 'student'").fetchone()
+    conn.close()
+    next_value = row['next_value'] if row else STUDENT_ID_MIN
+    capacity = STUDENT_ID_MAX - STUDENT_ID_MIN + 1
+    allocated = min(next_value - STUDENT_ID_MIN, capacity)
+    return {
+        'capacity': capacity,
+        'allocated': allocated,
+        'remaining': capacity - allocated,
+        'utilization': allocated / capacity,
+        'exhausted': allocated >= capacity,
+    }
+
+def delete_face_encodings(student_id):
+    """Drop the stored face encodings of a student, e.g. after their photo changed."""
+    conn = get_db_connection()
+    with conn:
+        conn.execute("DELETE FROM face_encodings WHERE student_id = ?", (student_id,))
+        _log_gallery_change(conn, [student_id])
+    conn.close()
+
+def add_face_encoding(student_id, encoding, source='enrolled'):
+    """Add one template to a student's face gallery. Returns the new template's ID."""
+    conn = get_db_connection()
+    with conn:
+        cursor = conn.execute(
+            "INSERT INTO face_encodings (student_id, encoding, source) VALUES (?, ?, ?)",
+            (student_id, encoding, source)
+        )
+        _log_gallery_change(conn, [student_id])
+    conn.close()
+    return cursor.lastrowid
+
+def delete_face_encoding(template_id):
+    """Remove a single template from a face gallery."""
+    conn = get_db_connection()
+    with conn:
+        row = conn.execute("SELECT student_id FROM face_encodings WHERE id = ?", (template_id,)).fetchone()
+        conn.execute("DELETE FROM face_encodings WHERE id = ?", (template_id,))
+        if row:
+            _log_gallery_change(conn, [row['student_id']])
+    conn.close()
+
+def get_face_templates(student_ids=None):
+    """Retrieve gallery templates (of all students, or of the given ones) as dicts with id, student_id, encoding and source."""
+    conn = get_db_connection()
+    if student_ids is None:
+        rows = conn.execute("SELECT id, student_id, encoding, source FROM face_encodings ORDER BY id").fetchall()
+    else:
+        rows = conn.execute(
+            f"SELECT id, student_id, encoding, source FROM face_encodings WHERE student_id IN ({', '.join('?' * len(student_ids))}) ORDER BY id",
+            tuple(student_ids)
+        ).fetchall()
+    conn.close()
+    return [dict(row, encoding=bytes(row['encoding'])) for row in rows]
+
+def get_gallery_change_cursor():
+    """Return the ID of the newest gallery change, or 0 if there are none."""
+    conn = get_db_connection()
+    row = conn.execute("SELECT MAX(id) FROM gallery_changes").fetchone()
+    conn.close()
+    return row[0] or 0
+
+def get_gallery_changes(since_id, limit=1000):
+    """Return (change_id, student_id) tuples of gallery changes newer than `since_id`, oldest first."""
+    conn = get_db_connection()
+    rows = conn.execute(
+        "SELECT id, student_id FROM gallery_changes WHERE id > ? ORDER BY id LIMIT ?", (since_id, limit)
+    ).fetchall()
+    conn.close()
+    return [tuple(row) for row in rows]
+
+def get_face_encodings():
+    """Retrieve all stored face encodings as (student_id, encoding_bytes) tuples."""
+    conn = get_db_connection()
+    rows = conn.execute("SELECT student_id, encoding FROM face_encodings ORDER BY id").fetchall()
+    conn.close()
+    return [(row['student_id'], bytes(row['encoding'])) for row in rows]
 
 def verify_admin(admin_id, password):
     """Verify admin credentials."""
@@ -186,7 +678,6 @@ def update_student(student_id, name, faculty, dob, email, address):
             "UPDATE students SET name = ?, faculty = ?, dob = ?, email = ?, address = ? WHERE id = ?",
             (name, faculty, dob, email, address, student_id)
         )
+        _log_gallery_change(conn, [student_id])
+        _bump_data_version(conn)
     conn.close()
-
-# Initialize the database and tables
-create_tables()
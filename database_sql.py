@@ -1,6 +1,9 @@
+import glob
 import os
+import re
 from datetime import datetime
-import random
+
+from metrics import instrument_connection, timed
 
 # Load environment variables from .env file
 try:
@@ -9,27 +12,6 @@ try:
 except ImportError:
     pass  # load_env module not available, continue with system environment variables
 
-# Conditional imports for database drivers
-MYSQL_AVAILABLE = False
-POSTGRESQL_AVAILABLE = False
-
-_mysql_available = False
-_postgresql_available = False
-
-try:
-    import mysql.connector  # type: ignore
-    _mysql_available = True
-except ImportError:
-    mysql = None
-    _mysql_available = False
-
-try:
-    import psycopg2
-    _postgresql_available = True
-except ImportError:
-    psycopg2 = None
-    _postgresql_available = False
-
 # Database configuration from environment variables
 DB_TYPE = os.environ.get('DB_TYPE', 'sqlite')  # 'mysql', 'postgresql', or 'sqlite'
 DB_HOST = os.environ.get('DB_HOST', 'localhost')
@@ -47,15 +29,23 @@ DB_PASSWORD = os.environ.get('DB_PASSWORD', '')
 
 # SQLite fallback (existing functionality)
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
-DB_FILE = os.path.join(SCRIPT_DIR, "attendance.db")
+DB_FILE = os.environ.get('DB_FILE', os.path.join(SCRIPT_DIR, "attendance.db"))
 KNOWN_FACES_DIR = os.path.join(SCRIPT_DIR, "known_faces")
 
+# Student IDs are '817' followed by a five digit serial handed out by the
+# id_allocator table, so allocation never has to look at existing IDs.
+STUDENT_ID_PREFIX = '817'
+STUDENT_ID_MIN = 10000
+STUDENT_ID_MAX = 99999
+
 def get_db_connection():
     """Establish a connection to the configured database."""
     if DB_TYPE == 'mysql':
-        if not _mysql_available:
+        # Drivers are imported only for the backend in use, so the others need not be installed
+        try:
+            import mysql.connector  # type: ignore
+        except ImportError:
             raise ImportError("MySQL driver not available. Please install mysql-connector-python")
-        import mysql.connector  # type: ignore
         connection = mysql.connector.connect(
             host=DB_HOST,
             port=DB_PORT,
@@ -63,11 +53,12 @@ def get_db_connection():
             user=DB_USER,
             password=DB_PASSWORD
         )
-        return connection
+        return instrument_connection(connection)
     elif DB_TYPE == 'postgresql':
-        if not _postgresql_available:
+        try:
+            import psycopg2
+        except ImportError:
             raise ImportError("PostgreSQL driver not available. Please install psycopg2-binary")
-        import psycopg2
         connection = psycopg2.connect(
             host=DB_HOST,
             port=DB_PORT,
@@ -75,12 +66,108 @@ def get_db_connection():
             user=DB_USER,
             password=DB_PASSWORD
         )
-        return connection
+        return instrument_connection(connection)
     else:  # sqlite (default)
         import sqlite3
         conn = sqlite3.connect(DB_FILE)
         conn.row_factory = sqlite3.Row
-        return conn
+        return instrument_connection(conn)
+
+def _ensure_column(cursor, table, column, definition):
+    """Add a column to an existing table created by an older version of the schema."""
+    if DB_TYPE in ['mysql', 'postgresql']:
+        schema = 'DATABASE()' if DB_TYPE == 'mysql' else 'current_schema()'
+        cursor.execute(
+            f"SELECT 1 FROM information_schema.columns WHERE table_schema = {schema} AND table_name = %s AND column_name = %s",
+            (table, column)
+        )
+        exists = cursor.fetchone() is not None
+    else:  # sqlite
+        cursor.execute(f"PRAGMA table_info({table})")
+        exists = any(list(row)[1] == column for row in cursor.fetchall())
+    if not exists:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+def _ensure_index(cursor, table, name, columns, kind=''):
+    """Create an index on an existing table unless it is already there (`kind` e.g. 'FULLTEXT' on MySQL)."""
+    if DB_TYPE == 'mysql':
+        # MySQL has no CREATE INDEX IF NOT EXISTS
+        cursor.execute(
+            "SELECT 1 FROM information_schema.statistics WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s",
+            (table, name)
+        )
+        if cursor.fetchone() is None:
+            cursor.execute(f"CREATE {kind + ' ' if kind else ''}INDEX {name} ON {table} ({columns})")
+    else:
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})")
+
+# Student search runs on a per-backend full-text index created by create_tables():
+# an FTS5 table kept in sync by triggers (SQLite), a trigram GIN index (PostgreSQL,
+# needs the pg_trgm extension) or a FULLTEXT index (MySQL). Without one it falls back to LIKE.
+SEARCH_COLUMNS = ('id', 'name', 'email', 'faculty')
+# FTS5 bm25() weights for SEARCH_COLUMNS: an ID hit ranks above a name hit, and so on
+SEARCH_WEIGHTS = (10.0, 5.0, 2.0, 1.0)
+PG_SEARCH_TEXT = "lower(id || ' ' || name || ' ' || coalesce(email, '') || ' ' || coalesce(faculty, ''))"
+_search_index_ready = None
+
+def _create_search_index(cursor):
+    """Create the backend's full-text index over students; returns False where the server lacks support."""
+    columns = ', '.join(SEARCH_COLUMNS)
+    try:
+        if DB_TYPE == 'mysql':
+            _ensure_index(cursor, 'students', 'idx_students_fulltext', columns, kind='FULLTEXT')
+        elif DB_TYPE == 'postgresql':
+            # A failed statement aborts a PostgreSQL transaction, so only this part is undone
+            cursor.execute("SAVEPOINT search_index")
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_students_search ON students USING gin (({PG_SEARCH_TEXT}) gin_trgm_ops)")
+            cursor.execute("RELEASE SAVEPOINT search_index")
+        else:  # sqlite
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'students_fts'")
+            existed = cursor.fetchone() is not None
+            cursor.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS students_fts USING fts5({columns}, content='students', prefix='2 3')")
+            new_values = ', '.join(f"new.{column}" for column in SEARCH_COLUMNS)
+            old_values = ', '.join(f"old.{column}" for column in SEARCH_COLUMNS)
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS students_fts_insert AFTER INSERT ON students BEGIN
+                    INSERT INTO students_fts (rowid, {columns}) VALUES (new.rowid, {new_values});
+                END
+            ''')
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS students_fts_delete AFTER DELETE ON students BEGIN
+                    INSERT INTO students_fts (students_fts, rowid, {columns}) VALUES ('delete', old.rowid, {old_values});
+                END
+            ''')
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS students_fts_update AFTER UPDATE OF {columns} ON students BEGIN
+                    INSERT INTO students_fts (students_fts, rowid, {columns}) VALUES ('delete', old.rowid, {old_values});
+                    INSERT INTO students_fts (rowid, {columns}) VALUES (new.rowid, {new_values});
+                END
+            ''')
+            if not existed:
+                # Index the students added before the search table existed
+                cursor.execute("INSERT INTO students_fts (students_fts) VALUES ('rebuild')")
+        return True
+    except Exception as e:
+        if DB_TYPE == 'postgresql':
+            cursor.execute("ROLLBACK TO SAVEPOINT search_index")
+        print(f"Full-text student search unavailable, using LIKE: {e}")
+        return False
+
+def _has_search_index(cursor):
+    """Whether the full-text index exists, checked once per process."""
+    global _search_index_ready
+    if _search_index_ready is None:
+        if DB_TYPE == 'mysql':
+            cursor.execute(
+                "SELECT 1 FROM information_schema.statistics WHERE table_schema = DATABASE() AND table_name = 'students' AND index_name = 'idx_students_fulltext'"
+            )
+        elif DB_TYPE == 'postgresql':
+            cursor.execute("SELECT 1 FROM pg_indexes WHERE tablename = 'students' AND indexname = 'idx_students_search'")
+        else:  # sqlite
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'students_fts'")
+        _search_index_ready = cursor.fetchone() is not None
+    return _search_index_ready
 
 def create_tables():
     """Create the necessary tables if they don't already exist."""
@@ -96,7 +183,8 @@ def create_tables():
                 faculty TEXT,
                 dob DATE,
                 email VARCHAR(255),
-                address TEXT
+                address TEXT,
+                image_hash VARCHAR(64)
             )
         ''')
         cursor.execute('''
@@ -115,10 +203,56 @@ def create_tables():
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS id_allocator (
+                name VARCHAR(64) PRIMARY KEY,
+                next_value INT NOT NULL
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS data_version (
+                name VARCHAR(64) PRIMARY KEY,
+                version BIGINT NOT NULL DEFAULT 0
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS face_encodings (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                student_id VARCHAR(255) NOT NULL,
+                encoding BLOB NOT NULL,
+                source VARCHAR(16) NOT NULL DEFAULT 'enrolled',
+                INDEX idx_face_encodings_student (student_id),
+                FOREIGN KEY (student_id) REFERENCES students (id) ON DELETE CASCADE
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS gallery_changes (
+                id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                student_id VARCHAR(255) NOT NULL,
+                changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS attendance_daily (
+                student_id VARCHAR(255) NOT NULL,
+                date DATE NOT NULL,
+                first_seen TIME NOT NULL,
+                last_seen TIME NOT NULL,
+                sightings INT NOT NULL DEFAULT 0,
+                present BOOLEAN NOT NULL DEFAULT TRUE,
+                PRIMARY KEY (student_id, date),
+                INDEX idx_attendance_daily_date (date)
+            )
+        ''')
         # Insert default admin if not exists
         cursor.execute('''
             INSERT IGNORE INTO admins (id, password) VALUES ('admin1', 'admin1')
         ''')
+        cursor.execute(
+            "INSERT IGNORE INTO id_allocator (name, next_value) VALUES ('student', %s)",
+            (STUDENT_ID_MIN,)
+        )
+        cursor.execute("INSERT IGNORE INTO data_version (name, version) VALUES ('content', 0)")
     elif DB_TYPE == 'postgresql':
         # PostgreSQL table creation
         cursor.execute('''
@@ -128,7 +262,8 @@ def create_tables():
                 faculty TEXT,
                 dob DATE,
                 email VARCHAR(255),
-                address TEXT
+                address TEXT,
+                image_hash VARCHAR(64)
             )
         ''')
         cursor.execute('''
@@ -147,12 +282,58 @@ def create_tables():
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS id_allocator (
+                name VARCHAR(64) PRIMARY KEY,
+                next_value INTEGER NOT NULL
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS data_version (
+                name VARCHAR(64) PRIMARY KEY,
+                version BIGINT NOT NULL DEFAULT 0
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS face_encodings (
+                id SERIAL PRIMARY KEY,
+                student_id VARCHAR(255) NOT NULL,
+                encoding BYTEA NOT NULL,
+                source VARCHAR(16) NOT NULL DEFAULT 'enrolled',
+                FOREIGN KEY (student_id) REFERENCES students (id) ON DELETE CASCADE
+            )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_face_encodings_student ON face_encodings (student_id)")
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS gallery_changes (
+                id BIGSERIAL PRIMARY KEY,
+                student_id VARCHAR(255) NOT NULL,
+                changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS attendance_daily (
+                student_id VARCHAR(255) NOT NULL,
+                date DATE NOT NULL,
+                first_seen TIME NOT NULL,
+                last_seen TIME NOT NULL,
+                sightings INTEGER NOT NULL DEFAULT 0,
+                present BOOLEAN NOT NULL DEFAULT TRUE,
+                PRIMARY KEY (student_id, date)
+            )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_attendance_daily_date ON attendance_daily (date)")
         # Insert default admin if not exists (PostgreSQL)
         cursor.execute('''
             INSERT INTO admins (id, password) 
             VALUES ('admin1', 'admin1')
             ON CONFLICT (id) DO NOTHING
         ''')
+        cursor.execute(
+            "INSERT INTO id_allocator (name, next_value) VALUES ('student', %s) ON CONFLICT (name) DO NOTHING",
+            (STUDENT_ID_MIN,)
+        )
+        cursor.execute("INSERT INTO data_version (name, version) VALUES ('content', 0) ON CONFLICT (name) DO NOTHING")
     else:  # sqlite
         # SQLite table creation (existing functionality)
         cursor.execute('''
@@ -162,7 +343,8 @@ def create_tables():
                 faculty TEXT,
                 dob TEXT,
                 email TEXT,
-                address TEXT
+                address TEXT,
+                image_hash TEXT
             )
         ''')
         cursor.execute('''
@@ -181,14 +363,79 @@ def create_tables():
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS id_allocator (
+                name TEXT PRIMARY KEY,
+                next_value INTEGER NOT NULL
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS data_version (
+                name TEXT PRIMARY KEY,
+                version INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS face_encodings (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                student_id TEXT NOT NULL,
+                encoding BLOB NOT NULL,
+                source TEXT NOT NULL DEFAULT 'enrolled',
+                FOREIGN KEY (student_id) REFERENCES students (id) ON DELETE CASCADE
+            )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_face_encodings_student ON face_encodings (student_id)")
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS gallery_changes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                student_id TEXT NOT NULL,
+                changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS attendance_daily (
+                student_id TEXT NOT NULL,
+                date TEXT NOT NULL,
+                first_seen TEXT NOT NULL,
+                last_seen TEXT NOT NULL,
+                sightings INTEGER NOT NULL DEFAULT 0,
+                present INTEGER NOT NULL DEFAULT 1,
+                PRIMARY KEY (student_id, date)
+            )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_attendance_daily_date ON attendance_daily (date)")
         # Insert default admin if not exists
         cursor.execute('''
             INSERT OR IGNORE INTO admins (id, password) VALUES ('admin1', 'admin1')
         ''')
+        cursor.execute(
+            "INSERT OR IGNORE INTO id_allocator (name, next_value) VALUES ('student', ?)",
+            (STUDENT_ID_MIN,)
+        )
+        cursor.execute("INSERT OR IGNORE INTO data_version (name, version) VALUES ('content', 0)")
+
+    _ensure_column(cursor, 'students', 'image_hash', 'VARCHAR(64)' if DB_TYPE in ['mysql', 'postgresql'] else 'TEXT')
+    _ensure_column(cursor, 'face_encodings', 'source', "VARCHAR(16) NOT NULL DEFAULT 'enrolled'")
+    # Per-student history and the latest-mark lookup, and recent records for the dashboard
+    _ensure_index(cursor, 'attendance', 'idx_attendance_student_date', 'student_id, date, time')
+    _ensure_index(cursor, 'attendance', 'idx_attendance_date', 'date, time')
+    # Covers the daily headcount series so it never reads the rollup rows themselves
+    _ensure_index(cursor, 'attendance_daily', 'idx_attendance_daily_headcount', 'date, sightings')
+    # Keyset pagination of the student list (get_students_page)
+    _ensure_index(cursor, 'students', 'idx_students_name', 'name, id')
+    _create_search_index(cursor)
+
+    # Databases from before the rollup existed get it filled in once
+    cursor.execute("SELECT 1 FROM attendance_daily LIMIT 1")
+    if cursor.fetchone() is None:
+        cursor.execute("SELECT 1 FROM attendance LIMIT 1")
+        if cursor.fetchone() is not None:
+            _rebuild_attendance_rollup(cursor)
     
     conn.commit()
     conn.close()
 
+@timed
 def get_all_students():
     """Retrieve all students from the database."""
     conn = get_db_connection()
@@ -221,6 +468,7 @@ def get_all_students():
     conn.close()
     return result
 
+@timed
 def get_student_by_id(student_id):
     """Retrieve a single student by their ID."""
     conn = get_db_connection()
@@ -250,6 +498,95 @@ def get_student_by_id(student_id):
     conn.close()
     return result
 
+@timed
+def get_students_page(after_name=None, after_id=None, limit=50, query=None):
+    """Up to `limit` students ordered by (name, id), starting after the student (`after_name`, `after_id`).
+
+    Seeks on the (name, id) index instead of skipping rows, so every page
+    costs the same. `query` keeps students whose name or ID contains it.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    placeholder = '%s' if DB_TYPE in ['mysql', 'postgresql'] else '?'
+    conditions, params = [], []
+    if after_name is not None:
+        conditions.append(f"(name > {placeholder} OR (name = {placeholder} AND id > {placeholder}))")
+        params += [after_name, after_name, after_id or '']
+    if query:
+        conditions.append(f"(lower(name) LIKE {placeholder} OR id LIKE {placeholder})")
+        params += [f"%{query.lower()}%", f"%{query}%"]
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    cursor.execute(
+        f"SELECT id, name, faculty, email, image_hash FROM students {where} ORDER BY name, id LIMIT {placeholder}",
+        params + [limit]
+    )
+    columns = [desc[0] for desc in cursor.description]
+    result = [dict(zip(columns, list(row))) for row in cursor.fetchall()]
+    
+    conn.close()
+    return result
+
+@timed
+def search_students(query, limit=20, offset=0):
+    """Students matching every word of `query` (a prefix of a word in their ID, name, email or faculty), best first.
+
+    Returns (total matches, page of student dicts with a `score`; higher is better).
+    """
+    terms = re.findall(r'\w+', query.lower())
+    if not terms:
+        return 0, []
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    fields = "id, name, faculty, email, image_hash"
+    columns = ', '.join(SEARCH_COLUMNS)
+    if not _has_search_index(cursor):
+        placeholder = '%s' if DB_TYPE in ['mysql', 'postgresql'] else '?'
+        if DB_TYPE in ['mysql', 'postgresql']:
+            text = f"lower(concat_ws(' ', {columns}))"
+        else:  # sqlite
+            text = "lower(" + " || ' ' || ".join(f"coalesce({column}, '')" for column in SEARCH_COLUMNS) + ")"
+        where = ' AND '.join(f"{text} LIKE {placeholder}" for _ in terms)
+        params = [f"%{term}%" for term in terms]
+        cursor.execute(f"SELECT COUNT(*) FROM students WHERE {where}", params)
+        total = list(cursor.fetchone())[0]
+        cursor.execute(f"SELECT {fields}, 0 AS score FROM students WHERE {where} ORDER BY name LIMIT {placeholder} OFFSET {placeholder}",
+                       params + [limit, offset])
+    elif DB_TYPE == 'mysql':
+        match = f"MATCH ({columns}) AGAINST (%s IN BOOLEAN MODE)"
+        against = ' '.join(f"+{term}*" for term in terms)
+        cursor.execute(f"SELECT COUNT(*) FROM students WHERE {match}", (against,))
+        total = list(cursor.fetchone())[0]
+        cursor.execute(f"SELECT {fields}, {match} AS score FROM students WHERE {match} ORDER BY score DESC, name LIMIT %s OFFSET %s",
+                       (against, against, limit, offset))
+    elif DB_TYPE == 'postgresql':
+        # Each LIKE is answered by the trigram index; similarity() ranks the matches
+        where = ' AND '.join(f"{PG_SEARCH_TEXT} LIKE %s" for _ in terms)
+        params = [f"%{term}%" for term in terms]
+        cursor.execute(f"SELECT COUNT(*) FROM students WHERE {where}", params)
+        total = list(cursor.fetchone())[0]
+        cursor.execute(f"SELECT {fields}, similarity({PG_SEARCH_TEXT}, %s) AS score FROM students WHERE {where} ORDER BY score DESC, name LIMIT %s OFFSET %s",
+                       [' '.join(terms)] + params + [limit, offset])
+    else:  # sqlite
+        match = ' '.join(f'"{term}"*' for term in terms)
+        rank = f"bm25(students_fts, {', '.join(str(weight) for weight in SEARCH_WEIGHTS)})"
+        cursor.execute("SELECT COUNT(*) FROM students_fts WHERE students_fts MATCH ?", (match,))
+        total = list(cursor.fetchone())[0]
+        cursor.execute(f'''
+            SELECT s.id, s.name, s.faculty, s.email, s.image_hash, -{rank} AS score
+            FROM students_fts JOIN students s ON s.rowid = students_fts.rowid
+            WHERE students_fts MATCH ?
+            ORDER BY {rank}, s.name
+            LIMIT ? OFFSET ?
+        ''', (match, limit, offset))
+    columns = [desc[0] for desc in cursor.description]
+    result = [dict(zip(columns, list(row))) for row in cursor.fetchall()]
+    
+    conn.close()
+    return int(total), result
+
+@timed
 def get_attendance():
     """Retrieve all attendance records, joining with student names."""
     conn = get_db_connection()
@@ -295,6 +632,7 @@ def get_attendance():
     conn.close()
     return result
 
+@timed
 def get_student_attendance(student_id):
     """Retrieve attendance records for a specific student."""
     conn = get_db_connection()
@@ -357,6 +695,280 @@ def get_student_attendance(student_id):
     
     return result
 
+@timed
+def get_recent_attendance(limit=10):
+    """The most recent attendance records, joined with student names."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    if DB_TYPE in ['mysql', 'postgresql']:
+        cursor.execute('''
+            SELECT a.id, s.id as student_id, s.name, a.date, a.time
+            FROM attendance a
+            JOIN students s ON a.student_id = s.id
+            ORDER BY a.date DESC, a.time DESC
+            LIMIT %s
+        ''', (limit,))
+    else:  # sqlite
+        cursor.execute('''
+            SELECT a.id, s.id as student_id, s.name, a.date, a.time
+            FROM attendance a
+            JOIN students s ON a.student_id = s.id
+            ORDER BY a.date DESC, a.time DESC
+            LIMIT ?
+        ''', (limit,))
+    columns = [desc[0] for desc in cursor.description]
+    result = [dict(zip(columns, list(row))) for row in cursor.fetchall()]
+    
+    conn.close()
+    return result
+
+@timed
+def get_attendance_watermark():
+    """Return (row count, newest attendance ID) of the attendance log; the ID is 0 when it is empty."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute("SELECT COUNT(*), MAX(id) FROM attendance")
+    count, last_id = list(cursor.fetchone())
+    
+    conn.close()
+    return count, last_id or 0
+
+@timed
+def get_latest_attendance_id():
+    """Return the newest attendance ID, or 0 if there are no records."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute("SELECT MAX(id) FROM attendance")
+    row = cursor.fetchone()
+    
+    conn.close()
+    return (list(row)[0] if row else None) or 0
+
+@timed
+def get_attendance_since(after_id, limit=500):
+    """Attendance records newer than `after_id`, oldest first, joined with student names.
+
+    Only on SQLite are records committed in ID order. Elsewhere a lower ID can
+    appear after a higher one was read; see attendance_feed.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    if DB_TYPE in ['mysql', 'postgresql']:
+        cursor.execute('''
+            SELECT a.id, s.id as student_id, s.name, a.date, a.time
+            FROM attendance a
+            JOIN students s ON a.student_id = s.id
+            WHERE a.id > %s
+            ORDER BY a.id
+            LIMIT %s
+        ''', (after_id, limit))
+    else:  # sqlite
+        cursor.execute('''
+            SELECT a.id, s.id as student_id, s.name, a.date, a.time
+            FROM attendance a
+            JOIN students s ON a.student_id = s.id
+            WHERE a.id > ?
+            ORDER BY a.id
+            LIMIT ?
+        ''', (after_id, limit))
+    columns = [desc[0] for desc in cursor.description]
+    result = [dict(zip(columns, list(row))) for row in cursor.fetchall()]
+    
+    conn.close()
+    return result
+
+@timed
+def get_attendance_columns(after_id=0, upto_id=None):
+    """Attendance rows with an ID above `after_id` (and at most `upto_id`) as column lists, oldest ID first.
+
+    Returns {'id': [...], 'student_id': [...], 'date': [...], 'time': [...]}
+    for building in-memory column stores, without a dict per row.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    placeholder = '%s' if DB_TYPE in ['mysql', 'postgresql'] else '?'
+    if upto_id is None:
+        cursor.execute(f"SELECT id, student_id, date, time FROM attendance WHERE id > {placeholder} ORDER BY id", (after_id,))
+    else:
+        cursor.execute(f"SELECT id, student_id, date, time FROM attendance WHERE id > {placeholder} AND id <= {placeholder} ORDER BY id",
+                       (after_id, upto_id))
+    columns = [desc[0] for desc in cursor.description]
+    values = list(zip(*cursor.fetchall())) or [()] * len(columns)
+    result = {column: list(value) for column, value in zip(columns, values)}
+    
+    conn.close()
+    return result
+
+@timed
+def get_dashboard_stats(today):
+    """Student count, attendance record count and records on `today`, without reading the attendance log."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute("SELECT COUNT(*) FROM students")
+    total_students = list(cursor.fetchone())[0]
+    cursor.execute("SELECT COALESCE(SUM(sightings), 0) FROM attendance_daily")
+    total_records = list(cursor.fetchone())[0]
+    if DB_TYPE in ['mysql', 'postgresql']:
+        cursor.execute("SELECT COALESCE(SUM(sightings), 0) FROM attendance_daily WHERE date = %s", (today,))
+    else:  # sqlite
+        cursor.execute("SELECT COALESCE(SUM(sightings), 0) FROM attendance_daily WHERE date = ?", (today,))
+    today_records = list(cursor.fetchone())[0]
+    
+    conn.close()
+    return {
+        'total_students': int(total_students),
+        'total_records': int(total_records),
+        'today_records': int(today_records),
+    }
+
+@timed
+def get_student_daily_attendance(student_id):
+    """One row per day the student attended: date, first_seen, last_seen, sightings and present, newest first."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    if DB_TYPE in ['mysql', 'postgresql']:
+        cursor.execute(
+            "SELECT date, first_seen, last_seen, sightings, present FROM attendance_daily WHERE student_id = %s ORDER BY date DESC",
+            (student_id,)
+        )
+    else:  # sqlite
+        cursor.execute(
+            "SELECT date, first_seen, last_seen, sightings, present FROM attendance_daily WHERE student_id = ? ORDER BY date DESC",
+            (student_id,)
+        )
+    columns = [desc[0] for desc in cursor.description]
+    result = [dict(zip(columns, list(row))) for row in cursor.fetchall()]
+    
+    conn.close()
+    return result
+
+@timed
+def get_session_days(start, end):
+    """Number of distinct dates between `start` and `end` (inclusive) on which anyone attended."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    if DB_TYPE in ['mysql', 'postgresql']:
+        cursor.execute("SELECT COUNT(DISTINCT date) FROM attendance_daily WHERE date BETWEEN %s AND %s", (start, end))
+    else:  # sqlite
+        cursor.execute("SELECT COUNT(DISTINCT date) FROM attendance_daily WHERE date BETWEEN ? AND ?", (start, end))
+    days = list(cursor.fetchone())[0]
+    
+    conn.close()
+    return int(days)
+
+@timed
+def get_daily_headcount(start, end):
+    """Students present and attendance rows per date between `start` and `end`, oldest first."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    if DB_TYPE in ['mysql', 'postgresql']:
+        cursor.execute('''
+            SELECT date, COUNT(*) AS headcount, SUM(sightings) AS sightings
+            FROM attendance_daily
+            WHERE date BETWEEN %s AND %s
+            GROUP BY date
+            ORDER BY date
+        ''', (start, end))
+    else:  # sqlite
+        cursor.execute('''
+            SELECT date, COUNT(*) AS headcount, SUM(sightings) AS sightings
+            FROM attendance_daily
+            WHERE date BETWEEN ? AND ?
+            GROUP BY date
+            ORDER BY date
+        ''', (start, end))
+    columns = [desc[0] for desc in cursor.description]
+    result = [dict(zip(columns, list(row))) for row in cursor.fetchall()]
+    
+    conn.close()
+    return result
+
+@timed
+def get_faculty_attendance(start, end):
+    """Per faculty: enrolled students and the student-days they attended between `start` and `end`."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    placeholder = '%s' if DB_TYPE in ['mysql', 'postgresql'] else '?'
+    # Counting each student's days separately is a range read on the rollup's
+    # primary key, far cheaper than joining and de-duplicating every row
+    cursor.execute(f'''
+        SELECT faculty, COUNT(*) AS students, SUM(days_present) AS days_present
+        FROM (
+            SELECT s.faculty,
+                   (SELECT COUNT(*) FROM attendance_daily d
+                    WHERE d.student_id = s.id AND d.date BETWEEN {placeholder} AND {placeholder}) AS days_present
+            FROM students s
+        ) per_student
+        GROUP BY faculty
+        ORDER BY faculty
+    ''', (start, end))
+    columns = [desc[0] for desc in cursor.description]
+    result = [dict(zip(columns, list(row))) for row in cursor.fetchall()]
+    
+    conn.close()
+    return result
+
+@timed
+def get_students_below_days(start, end, min_days, faculty=None):
+    """Students who attended on fewer than `min_days` days between `start` and `end`, fewest first."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    placeholder = '%s' if DB_TYPE in ['mysql', 'postgresql'] else '?'
+    faculty_filter = f"WHERE s.faculty = {placeholder}" if faculty else ""
+    params = (start, end) + ((faculty,) if faculty else ()) + (min_days,)
+    cursor.execute(f'''
+        SELECT student_id, name, faculty, days_present
+        FROM (
+            SELECT s.id AS student_id, s.name, s.faculty,
+                   (SELECT COUNT(*) FROM attendance_daily d
+                    WHERE d.student_id = s.id AND d.date BETWEEN {placeholder} AND {placeholder}) AS days_present
+            FROM students s
+            {faculty_filter}
+        ) per_student
+        WHERE days_present < {placeholder}
+        ORDER BY days_present, name
+    ''', params)
+    columns = [desc[0] for desc in cursor.description]
+    result = [dict(zip(columns, list(row))) for row in cursor.fetchall()]
+    
+    conn.close()
+    return result
+
+def _log_gallery_change(cursor, student_ids):
+    """Record that the students' face galleries (or names) changed, for running recognizers to pick up."""
+    if DB_TYPE in ['mysql', 'postgresql']:
+        cursor.executemany("INSERT INTO gallery_changes (student_id) VALUES (%s)", [(sid,) for sid in student_ids])
+    else:  # sqlite
+        cursor.executemany("INSERT INTO gallery_changes (student_id) VALUES (?)", [(sid,) for sid in student_ids])
+
+def _bump_data_version(cursor):
+    """Note a change to students or attendance, invalidating pages cached under the previous version."""
+    cursor.execute("UPDATE data_version SET version = version + 1 WHERE name = 'content'")
+
+@timed
+def get_data_version():
+    """Counter bumped by every write to students or attendance; rendered pages are cached per version."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute("SELECT version FROM data_version WHERE name = 'content'")
+    row = cursor.fetchone()
+    
+    conn.close()
+    return int(list(row)[0]) if row else 0
+
+@timed
 def add_student(student_id, name, faculty, dob, email, address):
     """Add or update a student in the database."""
     conn = get_db_connection()
@@ -374,31 +986,132 @@ def add_student(student_id, name, faculty, dob, email, address):
         )
     else:  # sqlite
         cursor.execute(
-            "INSERT OR REPLACE INTO students (id, name, faculty, dob, email, address) VALUES (?, ?, ?, ?, ?, ?)",
+            # An upsert rather than INSERT OR REPLACE, which would reset image_hash
+            "INSERT INTO students (id, name, faculty, dob, email, address) VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (id) DO UPDATE SET name=excluded.name, faculty=excluded.faculty, dob=excluded.dob, email=excluded.email, address=excluded.address",
             (student_id, name, faculty, dob, email, address)
         )
+    _log_gallery_change(cursor, [student_id])
+    _bump_data_version(cursor)
     
     conn.commit()
     conn.close()
 
+@timed
 def delete_student_by_id(student_id):
     """Delete a student and their corresponding face image."""
     conn = get_db_connection()
     cursor = conn.cursor()
     
     if DB_TYPE in ['mysql', 'postgresql']:
+        cursor.execute("DELETE FROM face_encodings WHERE student_id = %s", (student_id,))
+        cursor.execute("DELETE FROM attendance_daily WHERE student_id = %s", (student_id,))
         cursor.execute("DELETE FROM students WHERE id = %s", (student_id,))
     else:  # sqlite
+        cursor.execute("DELETE FROM face_encodings WHERE student_id = ?", (student_id,))
+        cursor.execute("DELETE FROM attendance_daily WHERE student_id = ?", (student_id,))
         cursor.execute("DELETE FROM students WHERE id = ?", (student_id,))
+    _log_gallery_change(cursor, [student_id])
+    _bump_data_version(cursor)
     
     conn.commit()
     conn.close()
+    # The image blob is left to `face_store.py --gc`, whose grace period covers a
+    # concurrent enrolment of the same photo
     
+    # Images saved before the content-addressed store existed
     img_path = os.path.join(KNOWN_FACES_DIR, f"{student_id}.jpg")
     if os.path.exists(img_path):
         os.remove(img_path)
+    for thumb_path in glob.glob(os.path.join(KNOWN_FACES_DIR, "thumbs", "*", f"{student_id}.jpg")):
+        os.remove(thumb_path)
     return True
 
+def _rollup_attendance(cursor, student_id, date, time):
+    """Count one new attendance row in the student's attendance_daily row for that date."""
+    if DB_TYPE == 'mysql':
+        cursor.execute('''
+            INSERT INTO attendance_daily (student_id, date, first_seen, last_seen, sightings, present)
+            VALUES (%s, %s, %s, %s, 1, TRUE)
+            ON DUPLICATE KEY UPDATE first_seen = LEAST(first_seen, VALUES(first_seen)),
+                last_seen = GREATEST(last_seen, VALUES(last_seen)), sightings = sightings + 1, present = TRUE
+        ''', (student_id, date, time, time))
+    elif DB_TYPE == 'postgresql':
+        cursor.execute('''
+            INSERT INTO attendance_daily (student_id, date, first_seen, last_seen, sightings, present)
+            VALUES (%s, %s, %s, %s, 1, TRUE)
+            ON CONFLICT (student_id, date) DO UPDATE SET
+                first_seen = LEAST(attendance_daily.first_seen, EXCLUDED.first_seen),
+                last_seen = GREATEST(attendance_daily.last_seen, EXCLUDED.last_seen),
+                sightings = attendance_daily.sightings + 1, present = TRUE
+        ''', (student_id, date, time, time))
+    else:  # sqlite
+        cursor.execute('''
+            INSERT INTO attendance_daily (student_id, date, first_seen, last_seen, sightings, present)
+            VALUES (?, ?, ?, ?, 1, 1)
+            ON CONFLICT (student_id, date) DO UPDATE SET
+                first_seen = MIN(first_seen, excluded.first_seen),
+                last_seen = MAX(last_seen, excluded.last_seen),
+                sightings = sightings + 1, present = 1
+        ''', (student_id, date, time, time))
+
+def _refresh_rollup_day(cursor, student_id, date):
+    """Recompute one student's attendance_daily row for a date from the attendance rows left."""
+    if DB_TYPE in ['mysql', 'postgresql']:
+        cursor.execute("DELETE FROM attendance_daily WHERE student_id = %s AND date = %s", (student_id, date))
+        cursor.execute('''
+            INSERT INTO attendance_daily (student_id, date, first_seen, last_seen, sightings, present)
+            SELECT student_id, date, MIN(time), MAX(time), COUNT(*), TRUE
+            FROM attendance WHERE student_id = %s AND date = %s
+            GROUP BY student_id, date
+        ''', (student_id, date))
+    else:  # sqlite
+        cursor.execute("DELETE FROM attendance_daily WHERE student_id = ? AND date = ?", (student_id, date))
+        cursor.execute('''
+            INSERT INTO attendance_daily (student_id, date, first_seen, last_seen, sightings, present)
+            SELECT student_id, date, MIN(time), MAX(time), COUNT(*), 1
+            FROM attendance WHERE student_id = ? AND date = ?
+            GROUP BY student_id, date
+        ''', (student_id, date))
+
+def _rebuild_attendance_rollup(cursor, since=None):
+    """Regenerate attendance_daily from the attendance log, for every date or from `since` on."""
+    present = 'TRUE' if DB_TYPE in ['mysql', 'postgresql'] else '1'
+    placeholder = '%s' if DB_TYPE in ['mysql', 'postgresql'] else '?'
+    if since:
+        cursor.execute(f"DELETE FROM attendance_daily WHERE date >= {placeholder}", (since,))
+        where, params = f"WHERE a.date >= {placeholder}", (since,)
+    else:
+        cursor.execute("DELETE FROM attendance_daily")
+        where, params = "", ()
+    # Joining students leaves out rows of deleted students, as get_attendance() does
+    cursor.execute(f'''
+        INSERT INTO attendance_daily (student_id, date, first_seen, last_seen, sightings, present)
+        SELECT a.student_id, a.date, MIN(a.time), MAX(a.time), COUNT(*), {present}
+        FROM attendance a
+        JOIN students s ON a.student_id = s.id
+        {where}
+        GROUP BY a.student_id, a.date
+    ''', params)
+
+@timed
+def rebuild_attendance_rollup(since=None):
+    """Rebuild the daily attendance rollup (all of it, or dates from `since`). Returns its row count."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        _rebuild_attendance_rollup(cursor, since)
+        _bump_data_version(cursor)
+        conn.commit()
+        cursor.execute("SELECT COUNT(*) FROM attendance_daily")
+        count = list(cursor.fetchone())[0]
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return count
+
+@timed
 def mark_attendance_db(student_id):
     """Append attendance if not marked within the last 12 hours."""
     conn = get_db_connection()
@@ -468,6 +1181,8 @@ def mark_attendance_db(student_id):
             "INSERT INTO attendance (student_id, date, time) VALUES (?, ?, ?)",
             (student_id, date, time)
         )
+    _rollup_attendance(cursor, student_id, date, time)
+    _bump_data_version(cursor)
     
     conn.commit()
     conn.close()
@@ -475,6 +1190,7 @@ def mark_attendance_db(student_id):
     student_name = student_data['name'] if student_data else 'Unknown'
     return {'student_id': student_id, 'name': student_name, 'date': date, 'time': time}
 
+@timed
 def add_attendance_record(student_id, date, time):
     """Add a single attendance record to the database (for migration)."""
     conn = get_db_connection()
@@ -490,53 +1206,385 @@ def add_attendance_record(student_id, date, time):
             "INSERT INTO attendance (student_id, date, time) VALUES (?, ?, ?)",
             (student_id, date, time)
         )
+    _rollup_attendance(cursor, student_id, date, time)
+    _bump_data_version(cursor)
     
     conn.commit()
     conn.close()
 
+@timed
 def delete_attendance_by_id(attendance_id):
     """Delete an attendance record by its primary key."""
     conn = get_db_connection()
     cursor = conn.cursor()
     
     if DB_TYPE in ['mysql', 'postgresql']:
+        cursor.execute("SELECT student_id, date FROM attendance WHERE id = %s", (attendance_id,))
+        row = cursor.fetchone()
         cursor.execute("DELETE FROM attendance WHERE id = %s", (attendance_id,))
     else:  # sqlite
+        cursor.execute("SELECT student_id, date FROM attendance WHERE id = ?", (attendance_id,))
+        row = cursor.fetchone()
         cursor.execute("DELETE FROM attendance WHERE id = ?", (attendance_id,))
+    if row:
+        _refresh_rollup_day(cursor, *list(row))
+        _bump_data_version(cursor)
     
     conn.commit()
     conn.close()
     return True
 
+def _reserve_student_ids(cursor, count):
+    """Reserve `count` unused student IDs using an open cursor.
+
+    The allocator row is bumped with a single UPDATE, which holds the row (or
+    database, for SQLite) write lock until the caller commits, so concurrent
+    registrations can never be handed the same block. Serials that collide
+    with legacy randomly generated IDs are skipped and replaced.
+    """
+    placeholder = '%s' if DB_TYPE in ['mysql', 'postgresql'] else '?'
+    reserved = []
+    while len(reserved) < count:
+        needed = count - len(reserved)
+        cursor.execute(
+            f"UPDATE id_allocator SET next_value = next_value + {placeholder} WHERE name = 'student'",
+            (needed,)
+        )
+        cursor.execute("SELECT next_value FROM id_allocator WHERE name = 'student'")
+        row = cursor.fetchone()
+        if row is None:
+            raise RuntimeError("Student ID allocator is not initialised. Run create_tables() first.")
+        end = list(row)[0]
+        start = end - needed
+        if end - 1 > STUDENT_ID_MAX:
+            raise RuntimeError("Unable to generate a unique student ID: the ID space is exhausted.")
+
+        candidates = [STUDENT_ID_PREFIX + str(serial) for serial in range(start, end)]
+        taken = set()
+        # Stay well below SQLite's host parameter limit
+        for i in range(0, len(candidates), 500):
+            chunk = candidates[i:i + 500]
+            markers = ', '.join([placeholder] * len(chunk))
+            cursor.execute(f"SELECT id FROM students WHERE id IN ({markers})", chunk)
+            taken.update(list(row)[0] for row in cursor.fetchall())
+        reserved.extend(sid for sid in candidates if sid not in taken)
+    return reserved
+
+@timed
+def reserve_student_ids(count):
+    """Atomically reserve a block of unique student IDs (e.g. for bulk enrollment)."""
+    if count <= 0:
+        return []
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        ids = _reserve_student_ids(cursor, count)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return ids
+
 def get_next_student_id():
     """Generate a new, unique student ID."""
+    return reserve_student_ids(1)[0]
+
+@timed
+def add_new_student(name, faculty, dob, email, address):
+    """Reserve a student ID and insert the student in one transaction. Returns the new ID."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        student_id = _reserve_student_ids(cursor, 1)[0]
+        if DB_TYPE in ['mysql', 'postgresql']:
+            cursor.execute(
+                "INSERT INTO students (id, name, faculty, dob, email, address) VALUES (%s, %s, %s, %s, %s, %s)",
+                (student_id, name, faculty, dob, email, address)
+            )
+        else:  # sqlite
+            cursor.execute(
+                "INSERT INTO students (id, name, faculty, dob, email, address) VALUES (?, ?, ?, ?, ?, ?)",
+                (student_id, name, faculty, dob, email, address)
+            )
+        _log_gallery_change(cursor, [student_id])
+        _bump_data_version(cursor)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return student_id
+
+@timed
+def get_student_id_capacity():
+    """Report how much of the student ID space has been handed out."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT next_value FROM id_allocator WHERE name = 'student'")
+    row = cursor.fetchone()
+    conn.close()
+
+    next_value = list(row)[0] if row else STUDENT_ID_MIN
+    capacity = STUDENT_ID_MAX - STUDENT_ID_MIN + 1
+    allocated = min(next_value - STUDENT_ID_MIN, capacity)
+    return {
+        'capacity': capacity,
+        'allocated': allocated,
+        'remaining': capacity - allocated,
+        'utilization': allocated / capacity,
+        'exhausted': allocated >= capacity,
+    }
+
+@timed
+def add_students_batch(students, encodings=None):
+    """Insert many students (and optionally their face encodings) in one transaction.
+
+    `students` is a list of (id, name, faculty, dob, email, address, image_hash)
+    tuples and `encodings` a list of (student_id, encoding_bytes) tuples.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        if DB_TYPE in ['mysql', 'postgresql']:
+            cursor.executemany(
+                "INSERT INTO students (id, name, faculty, dob, email, address, image_hash) VALUES (%s, %s, %s, %s, %s, %s, %s)",
+                students
+            )
+            if encodings:
+                cursor.executemany(
+                    "INSERT INTO face_encodings (student_id, encoding) VALUES (%s, %s)",
+                    encodings
+                )
+        else:  # sqlite
+            cursor.executemany(
+                "INSERT INTO students (id, name, faculty, dob, email, address, image_hash) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                students
+            )
+            if encodings:
+                cursor.executemany(
+                    "INSERT INTO face_encodings (student_id, encoding) VALUES (?, ?)",
+                    encodings
+                )
+        _log_gallery_change(cursor, [student[0] for student in students])
+        _bump_data_version(cursor)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+@timed
+def set_student_image_hash(student_id, image_hash):
+    """Point a student at a new image blob; the previous one is left for `face_store.py --gc`."""
     conn = get_db_connection()
     cursor = conn.cursor()
     
-    cursor.execute("SELECT id FROM students")
-    rows = cursor.fetchall()
-    # For all database types, safely extract IDs
-    existing_ids = set()
-    for row in rows:
-        if row is not None:
-            # Safely access the first element
-            try:
-                if hasattr(row, '__getitem__'):
-                    student_id = list(row)[0]
-                else:
-                    student_id = list(row)[0]
-                existing_ids.add(student_id)
-            except (IndexError, TypeError):
-                pass  # Skip invalid rows
+    if DB_TYPE in ['mysql', 'postgresql']:
+        cursor.execute("UPDATE students SET image_hash = %s WHERE id = %s", (image_hash, student_id))
+    else:  # sqlite
+        cursor.execute("UPDATE students SET image_hash = ? WHERE id = ?", (image_hash, student_id))
+    _log_gallery_change(cursor, [student_id])
+    _bump_data_version(cursor)
+    
+    conn.commit()
+    conn.close()
+
+@timed
+def set_student_photo(student_id, image_hash, encoding=None):
+    """Point a student at a new photo and replace their templates with its encoding, in one transaction.
+
+    The old templates belong to the old photo, so they are dropped even when
+    `encoding` is None (no usable face); readers of the gallery change log never
+    see the new photo without its template.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    if DB_TYPE in ['mysql', 'postgresql']:
+        cursor.execute("UPDATE students SET image_hash = %s WHERE id = %s", (image_hash, student_id))
+        cursor.execute("DELETE FROM face_encodings WHERE student_id = %s", (student_id,))
+        if encoding is not None:
+            cursor.execute("INSERT INTO face_encodings (student_id, encoding) VALUES (%s, %s)", (student_id, encoding))
+    else:  # sqlite
+        cursor.execute("UPDATE students SET image_hash = ? WHERE id = ?", (image_hash, student_id))
+        cursor.execute("DELETE FROM face_encodings WHERE student_id = ?", (student_id,))
+        if encoding is not None:
+            cursor.execute("INSERT INTO face_encodings (student_id, encoding) VALUES (?, ?)", (student_id, encoding))
+    _log_gallery_change(cursor, [student_id])
+    _bump_data_version(cursor)
+    
+    conn.commit()
+    conn.close()
+
+@timed
+def get_referenced_image_hashes():
+    """Return the set of image hashes referenced by student rows."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute("SELECT DISTINCT image_hash FROM students WHERE image_hash IS NOT NULL")
+    result = {list(row)[0] for row in cursor.fetchall()}
+    
+    conn.close()
+    return result
+
+@timed
+def save_face_encoding(student_id, encoding):
+    """Replace the stored face encoding(s) of a student with a single encoding."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    if DB_TYPE in ['mysql', 'postgresql']:
+        cursor.execute("DELETE FROM face_encodings WHERE student_id = %s", (student_id,))
+        cursor.execute(
+            "INSERT INTO face_encodings (student_id, encoding) VALUES (%s, %s)",
+            (student_id, encoding)
+        )
+    else:  # sqlite
+        cursor.execute("DELETE FROM face_encodings WHERE student_id = ?", (student_id,))
+        cursor.execute(
+            "INSERT INTO face_encodings (student_id, encoding) VALUES (?, ?)",
+            (student_id, encoding)
+        )
+    _log_gallery_change(cursor, [student_id])
+    
+    conn.commit()
     conn.close()
+
+@timed
+def delete_face_encodings(student_id):
+    """Drop the stored face encodings of a student, e.g. after their photo changed."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
     
-    for _ in range(10000):
-        random_part = str(random.randint(10000, 99999))
-        sid = '817' + random_part
-        if sid not in existing_ids:
-            return sid
-    raise RuntimeError("Unable to generate a unique student ID.")
+    if DB_TYPE in ['mysql', 'postgresql']:
+        cursor.execute("DELETE FROM face_encodings WHERE student_id = %s", (student_id,))
+    else:  # sqlite
+        cursor.execute("DELETE FROM face_encodings WHERE student_id = ?", (student_id,))
+    _log_gallery_change(cursor, [student_id])
+    
+    conn.commit()
+    conn.close()
 
+@timed
+def add_face_encoding(student_id, encoding, source='enrolled'):
+    """Add one template to a student's face gallery. Returns the new template's ID."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    if DB_TYPE == 'postgresql':
+        cursor.execute(
+            "INSERT INTO face_encodings (student_id, encoding, source) VALUES (%s, %s, %s) RETURNING id",
+            (student_id, encoding, source)
+        )
+        template_id = cursor.fetchone()[0]
+    elif DB_TYPE == 'mysql':
+        cursor.execute(
+            "INSERT INTO face_encodings (student_id, encoding, source) VALUES (%s, %s, %s)",
+            (student_id, encoding, source)
+        )
+        template_id = cursor.lastrowid
+    else:  # sqlite
+        cursor.execute(
+            "INSERT INTO face_encodings (student_id, encoding, source) VALUES (?, ?, ?)",
+            (student_id, encoding, source)
+        )
+        template_id = cursor.lastrowid
+    _log_gallery_change(cursor, [student_id])
+    
+    conn.commit()
+    conn.close()
+    return template_id
+
+@timed
+def delete_face_encoding(template_id):
+    """Remove a single template from a face gallery."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    if DB_TYPE in ['mysql', 'postgresql']:
+        cursor.execute("SELECT student_id FROM face_encodings WHERE id = %s", (template_id,))
+        row = cursor.fetchone()
+        cursor.execute("DELETE FROM face_encodings WHERE id = %s", (template_id,))
+    else:  # sqlite
+        cursor.execute("SELECT student_id FROM face_encodings WHERE id = ?", (template_id,))
+        row = cursor.fetchone()
+        cursor.execute("DELETE FROM face_encodings WHERE id = ?", (template_id,))
+    if row:
+        _log_gallery_change(cursor, [list(row)[0]])
+    
+    conn.commit()
+    conn.close()
+
+@timed
+def get_face_templates(student_ids=None):
+    """Retrieve gallery templates (of all students, or of the given ones) as dicts with id, student_id, encoding and source."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    query = "SELECT id, student_id, encoding, source FROM face_encodings"
+    params = ()
+    if student_ids is not None:
+        if not student_ids:
+            conn.close()
+            return []
+        placeholder = '%s' if DB_TYPE in ['mysql', 'postgresql'] else '?'
+        query += f" WHERE student_id IN ({', '.join([placeholder] * len(student_ids))})"
+        params = tuple(student_ids)
+    cursor.execute(query + " ORDER BY id", params)
+    result = [
+        {'id': r[0], 'student_id': r[1], 'encoding': bytes(r[2]), 'source': r[3]}
+        for r in (list(row) for row in cursor.fetchall())
+    ]
+    
+    conn.close()
+    return result
+
+@timed
+def get_gallery_change_cursor():
+    """Return the ID of the newest gallery change, or 0 if there are none."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute("SELECT MAX(id) FROM gallery_changes")
+    row = cursor.fetchone()
+    
+    conn.close()
+    return (list(row)[0] if row else None) or 0
+
+@timed
+def get_gallery_changes(since_id, limit=1000):
+    """Return (change_id, student_id) tuples of gallery changes newer than `since_id`, oldest first."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    if DB_TYPE in ['mysql', 'postgresql']:
+        cursor.execute("SELECT id, student_id FROM gallery_changes WHERE id > %s ORDER BY id LIMIT %s", (since_id, limit))
+    else:  # sqlite
+        cursor.execute("SELECT id, student_id FROM gallery_changes WHERE id > ? ORDER BY id LIMIT ?", (since_id, limit))
+    result = [tuple(row) for row in cursor.fetchall()]
+    
+    conn.close()
+    return result
+
+@timed
+def get_face_encodings():
+    """Retrieve all stored face encodings as (student_id, encoding_bytes) tuples."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute("SELECT student_id, encoding FROM face_encodings ORDER BY id")
+    # psycopg2 returns memoryview and mysql-connector bytearray for binary columns
+    result = [(list(row)[0], bytes(list(row)[1])) for row in cursor.fetchall()]
+    
+    conn.close()
+    return result
+
+@timed
 def verify_admin(admin_id, password):
     """Verify admin credentials."""
     conn = get_db_connection()
@@ -551,6 +1599,7 @@ def verify_admin(admin_id, password):
     conn.close()
     return admin is not None
 
+@timed
 def update_student(student_id, name, faculty, dob, email, address):
     """Update an existing student's information."""
     conn = get_db_connection()
@@ -566,9 +1615,8 @@ def update_student(student_id, name, faculty, dob, email, address):
             "UPDATE students SET name = ?, faculty = ?, dob = ?, email = ?, address = ? WHERE id = ?",
             (name, faculty, dob, email, address, student_id)
         )
+    _log_gallery_change(cursor, [student_id])
+    _bump_data_version(cursor)
     
     conn.commit()
     conn.close()
-
-# Initialize the database and tables
-create_tables()
\ No newline at end of file
@@ -10,5 +10,5 @@ DB_PASSWORD = os.environ.get('DB_PASSWORD', '')
 
 # For SQLite (default)
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
-DB_FILE = os.path.join(SCRIPT_DIR, "attendance.db")
+DB_FILE = os.environ.get('DB_FILE', os.path.join(SCRIPT_DIR, "attendance.db"))
 KNOWN_FACES_DIR = os.path.join(SCRIPT_DIR, "known_faces")
\ No newline at end of file
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Accuracy and speed of the gallery's template formats (float32, float16, int8).
+
+A synthetic population of identities is enrolled with a few templates each
+and probed with fresh captures of enrolled and unknown people. For every
+format it reports memory, matching throughput, and how often its answer
+differs from float32: rank-1 disagreements, the largest distance error, and
+identification and false-accept rates at the matching tolerance.
+
+Usage:
+    python embedding_benchmark.py
+    python embedding_benchmark.py --identities 100000 --templates 3 --probes 2000 --json results.json
+    python embedding_benchmark.py --from-db      # use the enrolled templates as identities
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+from face_gallery import MATCH_TOLERANCE, STORAGE_DTYPES, FaceGallery, decode_blob
+
+# Spread of synthetic identities and of captures around them, chosen so that
+# same-person distances (~0.4) and different-person distances (~0.9) resemble
+# those of face_recognition's 128-d encodings
+IDENTITY_NORM = 0.65
+CAPTURE_NOISE = 0.28
+
+
+def _unit_noise(rng, shape, norm):
+    return rng.normal(size=shape).astype(np.float32) * (norm / np.sqrt(shape[-1]))
+
+
+def synthetic_population(identities, templates, rng):
+    centres = _unit_noise(rng, (identities, 128), IDENTITY_NORM)
+    gallery = np.repeat(centres, templates, axis=0) + _unit_noise(rng, (identities * templates, 128), CAPTURE_NOISE)
+    owners = np.repeat(np.arange(identities), templates)
+    return centres, gallery, owners
+
+
+def database_population():
+    from database_sql import create_tables, get_face_templates
+
+    create_tables()
+    rows = get_face_templates()
+    if not rows:
+        raise SystemExit("No templates in the database; run without --from-db.")
+    ids = sorted({r['student_id'] for r in rows})
+    index = {sid: i for i, sid in enumerate(ids)}
+    gallery = np.stack([decode_blob(r['encoding']) for r in rows])
+    owners = np.array([index[r['student_id']] for r in rows])
+    # Identity centres for the probes are the mean of each student's templates
+    centres = np.zeros((len(ids), 128), dtype=np.float32)
+    np.add.at(centres, owners, gallery)
+    centres /= np.bincount(owners)[:, None]
+    return centres, gallery, owners
+
+
+def build_gallery(vectors, owners, dtype):
+    gallery = FaceGallery(dtype=dtype)
+    for row, (vector, owner) in enumerate(zip(vectors, owners)):
+        gallery.add(int(owner), vector, template_id=row)
+    return gallery
+
+
+def time_matching(gallery, probes, batch, repeat):
+    """Best-of-`repeat` probes per second, matching `batch` probes per call."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for i in range(0, len(probes), batch):
+            gallery._nearest_templates(probes[i:i + batch])
+        best = min(best, time.perf_counter() - start)
+    return len(probes) / best
+
+
+def evaluate(gallery, probes, truth, tolerance):
+    rows, d2 = gallery._nearest_templates(probes)
+    distances = np.sqrt(d2)
+    predicted = np.where(distances <= tolerance, gallery._owners[rows], -1)
+    known = truth >= 0
+    return {
+        'rows': rows,
+        'distances': distances,
+        'identification_rate': float(np.mean(predicted[known] == truth[known])) if known.any() else None,
+        'false_accept_rate': float(np.mean(predicted[~known] >= 0)) if (~known).any() else None,
+    }
+
+
+def run(centres, vectors, owners, probes_count, batch, repeat, rng, tolerance=MATCH_TOLERANCE):
+    identities = len(centres)
+    # Half the probes are new captures of enrolled identities, half are strangers
+    known_ids = rng.integers(0, identities, probes_count - probes_count // 2)
+    probes = np.concatenate([
+        centres[known_ids] + _unit_noise(rng, (len(known_ids), 128), CAPTURE_NOISE),
+        _unit_noise(rng, (probes_count // 2, 128), IDENTITY_NORM) + _unit_noise(rng, (probes_count // 2, 128), CAPTURE_NOISE),
+    ]).astype(np.float32)
+    truth = np.concatenate([known_ids, np.full(probes_count // 2, -1)])
+
+    results = {}
+    baseline = None
+    for dtype in STORAGE_DTYPES:
+        gallery = build_gallery(vectors, owners, dtype)
+        quality = evaluate(gallery, probes, truth, tolerance)
+        entry = {
+            'memory_bytes': gallery.nbytes,
+            'bytes_per_template': gallery.nbytes / len(gallery),
+            'probes_per_second': time_matching(gallery, probes, batch, repeat),
+            'identification_rate': quality['identification_rate'],
+            'false_accept_rate': quality['false_accept_rate'],
+        }
+        if baseline is None:
+            baseline = quality
+        else:
+            entry['rank1_disagreements'] = int(np.count_nonzero(
+                gallery._owners[quality['rows']] != gallery._owners[baseline['rows']]))
+            entry['max_distance_error'] = float(np.abs(quality['distances'] - baseline['distances']).max())
+        entry['template_distance_evaluations_per_second'] = entry['probes_per_second'] * len(gallery)
+        results[dtype] = entry
+    return {
+        'identities': identities,
+        'templates': len(vectors),
+        'probes': probes_count,
+        'batch': batch,
+        'tolerance': tolerance,
+        'formats': results,
+    }
+
+
+def print_report(report):
+    print(f"{report['identities']} identities, {report['templates']} templates, {report['probes']} probes "
+          f"(batch {report['batch']}, tolerance {report['tolerance']})")
+    print(f"{'format':<8} {'memory':>10} {'B/tmpl':>7} {'probes/s':>10} {'speedup':>8} {'ident.':>7} "
+          f"{'FAR':>7} {'rank-1 diff':>11} {'max dist err':>12}")
+    base = report['formats']['float32']['probes_per_second']
+    for dtype, r in report['formats'].items():
+        ident = f"{r['identification_rate']:.4f}" if r['identification_rate'] is not None else '-'
+        far = f"{r['false_accept_rate']:.4f}" if r['false_accept_rate'] is not None else '-'
+        print(f"{dtype:<8} {r['memory_bytes'] / 2**20:>8.1f}MB {r['bytes_per_template']:>7.0f} "
+              f"{r['probes_per_second']:>10.0f} {r['probes_per_second'] / base:>7.2f}x {ident:>7} {far:>7} "
+              f"{r.get('rank1_disagreements', 0):>11} {r.get('max_distance_error', 0.0):>12.5f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark float32/float16/int8 gallery templates.")
+    parser.add_argument('--identities', type=int, default=20000)
+    parser.add_argument('--templates', type=int, default=3, help="Templates per identity")
+    parser.add_argument('--probes', type=int, default=1000)
+    parser.add_argument('--batch', type=int, default=4, help="Probes matched per call (faces per frame)")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--from-db', action='store_true', help="Use enrolled templates instead of synthetic ones")
+    parser.add_argument('--json', help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    if args.from_db:
+        centres, vectors, owners = database_population()
+    else:
+        centres, vectors, owners = synthetic_population(args.identities, args.templates, rng)
+    report = run(centres, vectors, owners, args.probes, args.batch, args.repeat, rng)
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,732 @@
+#!/usr/bin/env python3
+"""
+Per-student face galleries for recognition.
+
+Each student can have several templates (face encodings) in the
+`face_encodings` table: the ones enrolled from photos and, optionally, live
+captures the camera was confident about ('auto' templates). Templates are
+stored as 128 float32 values (512 bytes); older float64 rows are still read.
+
+The gallery keeps every template in one contiguous matrix so a frame's faces
+are matched against all students with a single matrix product, either by the
+closest template of each student ('min') or by each student's mean
+template ('centroid').
+
+Running recognizers stay current without a restart: every write that
+affects a student's templates or name is recorded in `gallery_changes`, and
+apply_gallery_changes() replays the new entries as per-student deltas on the
+in-memory matrix.
+
+Large galleries can be held as float16 or int8 (with a per-template scale)
+and saved to a directory of .npy files that is memory-mapped on open, so a
+process only pages in what it touches. See embedding_benchmark.py for the
+accuracy and speed trade-off of each format.
+
+Snapshots can also be published for other processes: publish_gallery()
+writes a new numbered version next to the previous ones and atomically
+repoints `CURRENT` at it, and SharedGallery maps whichever version is
+current, so any number of workers share one physical copy and switch to a
+new version without reloading from the database.
+
+Usage:
+    python face_gallery.py --add 81712345 photo1.jpg photo2.jpg
+    python face_gallery.py --stats
+    python face_gallery.py --export gallery_int8/ --dtype int8
+    python face_gallery.py --publish [--dtype int8] [--follow 2]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from database_sql import (
+    KNOWN_FACES_DIR, add_face_encoding, create_tables, delete_face_encoding, get_all_students, get_face_templates, get_gallery_change_cursor,
+    get_gallery_changes, get_student_by_id
+)
+
+ENCODING_DIM = 128
+MATCH_MODES = ('min', 'centroid')
+MATCH_TOLERANCE = 0.6
+# In-memory template formats: float16 halves and int8 (+ a per-template scale) quarters the memory of float32
+STORAGE_DTYPES = ('float32', 'float16', 'int8')
+TEMPLATE_SOURCES = ('enrolled', 'auto')
+# Compact templates are matched in blocks of this many rows (512 KB once converted to float32)
+MATCH_BLOCK_ROWS = 1024
+# Per-template arrays of a gallery, all indexed by row
+ROW_ARRAYS = ('_vectors', '_scales', '_sq_norms', '_owners', '_template_ids', '_sources')
+MAX_TEMPLATES_PER_STUDENT = 5
+# A live capture is only added to a gallery when it matched this closely...
+ENRICH_MAX_DISTANCE = 0.4
+# ...is at least this far from every other student's templates...
+ENRICH_MIN_MARGIN = 0.15
+# ...and adds something the student's existing templates do not already cover
+ENRICH_MIN_NOVELTY = 0.2
+# Seconds between auto-enrichments of the same student
+ENRICH_COOLDOWN = 60
+# Published snapshots shared by recognizer processes; point it at a tmpfs
+# (e.g. /dev/shm/face_gallery) to keep them off the disk entirely
+SHARED_GALLERY_DIR = os.environ.get('FACE_GALLERY_DIR', os.path.join(KNOWN_FACES_DIR, 'gallery'))
+# Old snapshot versions kept for processes that have not switched yet
+SNAPSHOTS_KEPT = 2
+# Seconds between a SharedGallery's checks for a newer version
+SHARED_CHECK_INTERVAL = 1.0
+# Times a SharedGallery re-reads CURRENT when the version it named was pruned before it could be opened
+SHARED_OPEN_ATTEMPTS = 3
+
+
+def encode_blob(encoding):
+    """Serialise a face encoding for the face_encodings table."""
+    return np.asarray(encoding, dtype=np.float32).tobytes()
+
+
+def decode_blob(blob):
+    """Deserialise a stored face encoding (float32, or float64 from before galleries)."""
+    dtype = np.float64 if len(blob) == ENCODING_DIM * 8 else np.float32
+    return np.frombuffer(blob, dtype=dtype).astype(np.float32)
+
+
+class FaceGallery:
+    """In-memory (or memory-mapped) matrix of face templates with vectorised matching.
+
+    `dtype` selects how templates are held: 'float32', 'float16' (half the
+    memory) or 'int8' (a quarter, with one float32 scale per template).
+    """
+
+    def __init__(self, mode='min', tolerance=MATCH_TOLERANCE, dtype='float32'):
+        if mode not in MATCH_MODES:
+            raise ValueError(f"Unknown match mode '{mode}', expected one of {MATCH_MODES}")
+        if dtype not in STORAGE_DTYPES:
+            raise ValueError(f"Unknown storage dtype '{dtype}', expected one of {STORAGE_DTYPES}")
+        self.mode = mode
+        self.tolerance = tolerance
+        self.dtype = dtype
+        # Newest gallery_changes entry reflected in the matrix
+        self.change_id = 0
+        # Template rows; only the first `size` rows of the arrays are in use
+        self.size = 0
+        self._vectors = np.empty((16, ENCODING_DIM), dtype=dtype)
+        self._scales = np.ones(16, dtype=np.float32)
+        self._sq_norms = np.empty(16, dtype=np.float32)
+        self._owners = np.empty(16, dtype=np.int64)
+        self._template_ids = np.empty(16, dtype=np.int64)
+        self._sources = np.empty(16, dtype=np.int8)
+        self._rows = {}
+        # Students, indexed by owner number, and their display names
+        self._student_ids = []
+        self._owner_index = {}
+        self._names = {}
+        # Of a gallery opened from a snapshot: mapped arrays of owner IDs and
+        # names (plus a sorted copy for lookups), expanded only on first write
+        self._mapped = None
+        # Per-student template sums and counts for centroid matching, built on first use
+        self._sums = None
+        self._counts = None
+        self._centroids = None
+        self._last_enriched = {}
+
+    def __len__(self):
+        return self.size
+
+    def _expand(self):
+        """Turn the mapped student tables of a snapshot into the mutable dicts and lists."""
+        if self._mapped is not None:
+            ids, names = self._mapped['student_ids'].tolist(), self._mapped['names'].tolist()
+            self._mapped = None
+            self._student_ids = ids
+            self._owner_index = {sid: owner for owner, sid in enumerate(ids)}
+            self._names = {sid: name for sid, name in zip(ids, names)}
+
+    @property
+    def student_ids(self):
+        self._expand()
+        return self._student_ids
+
+    @property
+    def names(self):
+        self._expand()
+        return self._names
+
+    @names.setter
+    def names(self, names):
+        self._expand()
+        self._names = names
+
+    def _lookup_owner(self, student_id):
+        if self._mapped is None:
+            return self._owner_index.get(student_id)
+        # Binary search in the snapshot's sorted ID table; no dict is built
+        sorted_ids = self._mapped['sorted_ids']
+        i = int(np.searchsorted(sorted_ids, student_id))
+        if i < len(sorted_ids) and sorted_ids[i] == student_id:
+            return int(self._mapped['sorted_owners'][i])
+        return None
+
+    def _student_id_at(self, owner):
+        if self._mapped is None:
+            return self._student_ids[owner]
+        return str(self._mapped['student_ids'][owner])
+
+    def name(self, student_id, default='Unknown'):
+        """Display name of a student."""
+        if self._mapped is None:
+            return self._names.get(student_id, default)
+        owner = self._lookup_owner(student_id)
+        return default if owner is None else str(self._mapped['names'][owner])
+
+    @property
+    def nbytes(self):
+        """Memory held by the template rows in use."""
+        per_row = self._vectors.itemsize * ENCODING_DIM + (4 if self.dtype == 'int8' else 0)
+        return self.size * per_row
+
+    def _quantize(self, vector):
+        """Convert a float32 vector to the storage dtype. Returns (stored_row, scale)."""
+        if self.dtype == 'int8':
+            peak = float(np.abs(vector).max())
+            scale = peak / 127.0 if peak else 1.0
+            return np.round(vector / scale).astype(np.int8), scale
+        return vector.astype(self.dtype), 1.0
+
+    def _dequantize(self, start, stop):
+        """float32 copy of template rows [start, stop)."""
+        block = self._vectors[start:stop].astype(np.float32)
+        if self.dtype == 'int8':
+            block *= self._scales[start:stop, None]
+        return block
+
+    def _grow(self):
+        # Grow geometrically so appends stay amortised O(1). This also copies
+        # memory-mapped arrays into memory the first time a mapped gallery grows.
+        for name in ROW_ARRAYS:
+            array = getattr(self, name)
+            extra = np.empty((max(16, len(array)),) + array.shape[1:], dtype=array.dtype)
+            setattr(self, name, np.concatenate([array, extra]))
+
+    def _row_index(self):
+        if self._rows is None:
+            self._rows = {int(tid): row for row, tid in enumerate(self._template_ids[:self.size]) if tid >= 0}
+        return self._rows
+
+    def _owner(self, student_id):
+        self._expand()
+        owner = self._owner_index.get(student_id)
+        if owner is None:
+            owner = len(self.student_ids)
+            self.student_ids.append(student_id)
+            self._owner_index[student_id] = owner
+            if self._counts is not None and owner == len(self._counts):
+                self._sums = np.concatenate([self._sums, np.zeros_like(self._sums)])
+                self._counts = np.concatenate([self._counts, np.zeros_like(self._counts)])
+        return owner
+
+    def _ensure_sums(self):
+        if self._counts is None:
+            count = max(16, self.owner_count)
+            self._sums = np.zeros((count, ENCODING_DIM), dtype=np.float64)
+            self._counts = np.zeros(count, dtype=np.int64)
+            owners = self._owners[:self.size]
+            for start in range(0, self.size, MATCH_BLOCK_ROWS):
+                stop = min(start + MATCH_BLOCK_ROWS, self.size)
+                np.add.at(self._sums, owners[start:stop], self._dequantize(start, stop))
+            np.add.at(self._counts, owners, 1)
+
+    def add(self, student_id, encoding, template_id=None, source='enrolled'):
+        """Append one template to the matrix. Returns False if the template is already present."""
+        rows = self._row_index()
+        if template_id is not None and template_id in rows:
+            return False
+        vector = np.asarray(encoding, dtype=np.float32).reshape(ENCODING_DIM)
+        if self.size == len(self._vectors):
+            self._grow()
+        owner = self._owner(student_id)
+        row = self.size
+        stored, scale = self._quantize(vector)
+        self._vectors[row] = stored
+        self._scales[row] = scale
+        self.size += 1
+        # Norms of the stored (not the original) vector keep distances consistent
+        stored = self._dequantize(row, row + 1)[0]
+        self._sq_norms[row] = stored @ stored
+        self._owners[row] = owner
+        self._template_ids[row] = -1 if template_id is None else template_id
+        self._sources[row] = TEMPLATE_SOURCES.index(source)
+        if template_id is not None:
+            rows[template_id] = row
+        if self._counts is not None:
+            self._sums[owner] += stored
+            self._counts[owner] += 1
+        self._centroids = None
+        return True
+
+    def remove_template(self, template_id):
+        """Drop a template by its database ID. Returns False if it is not in the gallery."""
+        rows = self._row_index()
+        row = rows.pop(template_id, None)
+        if row is None:
+            return False
+        owner = self._owners[row]
+        if self._counts is not None:
+            self._sums[owner] -= self._dequantize(row, row + 1)[0]
+            self._counts[owner] -= 1
+        # Move the last row into the hole instead of shifting the whole matrix
+        last = self.size - 1
+        if row != last:
+            for array in (self._vectors, self._scales, self._sq_norms, self._owners, self._template_ids,
+                          self._sources):
+                array[row] = array[last]
+            if self._template_ids[row] >= 0:
+                rows[int(self._template_ids[row])] = row
+        self.size = last
+        self._centroids = None
+        return True
+
+    def templates(self, student_id):
+        """(template_ids, sources, vectors) of one student's templates."""
+        owner = self._lookup_owner(student_id)
+        rows = np.flatnonzero(self._owners[:self.size] == owner) if owner is not None else np.empty(0, np.int64)
+        vectors = self._vectors[rows].astype(np.float32)
+        if self.dtype == 'int8':
+            vectors *= self._scales[rows, None]
+        return ([int(self._template_ids[r]) for r in rows], [TEMPLATE_SOURCES[self._sources[r]] for r in rows],
+                vectors)
+
+    def sync_student(self, student_id, name, templates):
+        """Bring one student's templates in line with the database rows in `templates`.
+
+        Only rows that were added or removed touch the matrix. A `name` of None
+        means the student was deleted.
+        """
+        keep = {t['id'] for t in templates} if name is not None else set()
+        current, _, _ = self.templates(student_id)
+        for template_id in current:
+            if template_id not in keep:
+                self.remove_template(template_id)
+        if name is None:
+            self.names.pop(student_id, None)
+            return
+        self.names[student_id] = name
+        for template in templates:
+            self.add(student_id, decode_blob(template['encoding']), template['id'], template['source'])
+
+    @property
+    def owner_count(self):
+        return len(self._student_ids) if self._mapped is None else len(self._mapped['student_ids'])
+
+    def template_count(self, student_id):
+        owner = self._lookup_owner(student_id)
+        if owner is None:
+            return 0
+        if self._counts is not None:
+            return int(self._counts[owner])
+        return int(np.count_nonzero(self._owners[:self.size] == owner))
+
+    def _centroid_matrix(self):
+        if self._centroids is None:
+            self._ensure_sums()
+            count = self.owner_count
+            counts = self._counts[:count]
+            centroids = np.zeros((count, ENCODING_DIM), dtype=np.float32)
+            present = counts > 0
+            centroids[present] = self._sums[:count][present] / counts[present, None]
+            self._centroids = (centroids, np.einsum('ij,ij->i', centroids, centroids), present)
+        return self._centroids
+
+    def _nearest_templates(self, queries, exclude_owner=None):
+        """Row of, and squared distance to, the closest template for each query.
+
+        Templates of `exclude_owner` are skipped; a query with no other
+        template gets an infinite distance.
+
+        Compact formats are converted to float32 one cache-sized block at a
+        time, so the matrix is streamed from memory in its small form and the
+        product still runs in BLAS.
+        """
+        queries_t = np.ascontiguousarray(queries.T)
+        q_sq = (queries * queries).sum(axis=1)
+        best_d2 = np.full(len(queries), np.inf, dtype=np.float32)
+        best_row = np.zeros(len(queries), dtype=np.int64)
+        block_rows = self.size if self.dtype == 'float32' else MATCH_BLOCK_ROWS
+        buffer = None if self.dtype == 'float32' else np.empty((block_rows, ENCODING_DIM), dtype=np.float32)
+        columns = np.arange(len(queries))
+        for start in range(0, self.size, block_rows):
+            stop = min(start + block_rows, self.size)
+            block = self._vectors[start:stop]
+            if buffer is not None:
+                np.copyto(buffer[:stop - start], block, casting='unsafe')
+                block = buffer[:stop - start]
+            dots = block @ queries_t
+            if self.dtype == 'int8':
+                # Scaling the dot products is cheaper than dequantizing the block
+                dots *= self._scales[start:stop, None]
+            # |q - v|^2 = |q|^2 + |v|^2 - 2 q.v, for all pairs at once
+            d2 = self._sq_norms[start:stop, None] - 2.0 * dots
+            if exclude_owner is not None:
+                d2[self._owners[start:stop] == exclude_owner] = np.inf
+            rows = d2.argmin(axis=0)
+            d2_min = d2[rows, columns] + q_sq
+            better = d2_min < best_d2
+            best_d2[better] = d2_min[better]
+            best_row[better] = rows[better] + start
+        return best_row, np.maximum(best_d2, 0.0)
+
+    def match(self, encodings):
+        """Best student for each encoding as a list of (student_id or None, distance)."""
+        if not len(encodings) or not self.size:
+            return [(None, float('inf'))] * len(encodings)
+        queries = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_DIM)
+        if self.mode == 'centroid':
+            centroids, sq_norms, present = self._centroid_matrix()
+            d2 = (queries * queries).sum(axis=1)[:, None] + sq_norms - 2.0 * (queries @ centroids.T)
+            d2[:, ~present] = np.inf
+            owners = d2.argmin(axis=1)
+            best_d2 = np.maximum(d2[np.arange(len(queries)), owners], 0.0)
+        else:
+            # The closest template overall is the closest template of the best student
+            rows, best_d2 = self._nearest_templates(queries)
+            owners = self._owners[rows]
+        results = []
+        for owner, d2 in zip(owners, best_d2):
+            distance = float(np.sqrt(d2))
+            results.append((self._student_id_at(owner) if distance <= self.tolerance else None, distance))
+        return results
+
+    def enrich(self, student_id, encoding, distance):
+        """Add a confidently matched live capture to the student's gallery.
+
+        The capture must match closely, be well separated from every other
+        student and differ from the student's existing templates. When the
+        gallery is full the oldest auto template is replaced; enrolled
+        templates are never evicted. Returns True if a template was added.
+        """
+        now = time.monotonic()
+        if distance > ENRICH_MAX_DISTANCE or now - self._last_enriched.get(student_id, -ENRICH_COOLDOWN) < ENRICH_COOLDOWN:
+            return False
+        vector = np.asarray(encoding, dtype=np.float32)
+        template_ids, sources, vectors = self.templates(student_id)
+        if not len(vectors) or np.linalg.norm(vectors - vector, axis=1).min() < ENRICH_MIN_NOVELTY:
+            return False
+        # The capture must be clearly closer to this student than to the nearest template of anyone else
+        _, d2 = self._nearest_templates(vector[None, :], exclude_owner=self._lookup_owner(student_id))
+        if np.sqrt(d2[0]) - distance < ENRICH_MIN_MARGIN:
+            return False
+
+        if len(template_ids) >= MAX_TEMPLATES_PER_STUDENT:
+            auto = [tid for tid, source in zip(template_ids, sources) if source == 'auto']
+            if not auto:
+                return False
+            oldest = min(auto)
+            delete_face_encoding(oldest)
+            self.remove_template(oldest)
+        template_id = add_face_encoding(student_id, encode_blob(vector), 'auto')
+        self.add(student_id, vector, template_id, 'auto')
+        self._last_enriched[student_id] = now
+        return True
+
+    def save(self, path):
+        """Write the gallery to a directory of .npy files that open() can memory-map."""
+        os.makedirs(path, exist_ok=True)
+        arrays = {name.lstrip('_'): getattr(self, name)[:self.size] for name in ROW_ARRAYS}
+        ids = self.student_ids
+        arrays['student_ids'] = np.array(ids, dtype=str)
+        arrays['names'] = np.array([self.names.get(sid, 'Unknown') for sid in ids], dtype=str)
+        order = np.argsort(arrays['student_ids'], kind='stable')
+        arrays['sorted_ids'] = arrays['student_ids'][order]
+        arrays['sorted_owners'] = order.astype(np.int64)
+        for name, array in arrays.items():
+            np.save(os.path.join(path, name + '.npy'), array)
+        with open(os.path.join(path, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump({'dtype': self.dtype, 'change_id': self.change_id}, f)
+
+    @classmethod
+    def open(cls, path, mode='min', tolerance=MATCH_TOLERANCE, mmap=True):
+        """Load a gallery written by save(). With mmap, rows are paged in from disk on demand.
+
+        Opening only maps the files, so it takes the same time for any gallery
+        size, and processes mapping the same snapshot share one copy in the page
+        cache. Mapped arrays are copy-on-write: later changes stay private to
+        this process and are never written back to the files.
+        """
+        with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        gallery = cls(mode=mode, tolerance=tolerance, dtype=meta['dtype'])
+        mmap_mode = 'c' if mmap else None
+        for name in ROW_ARRAYS:
+            setattr(gallery, name, np.load(os.path.join(path, name.lstrip('_') + '.npy'), mmap_mode=mmap_mode))
+        gallery._mapped = {name: np.load(os.path.join(path, name + '.npy'), mmap_mode=mmap_mode)
+                           for name in ('student_ids', 'names', 'sorted_ids', 'sorted_owners')}
+        gallery.size = len(gallery._vectors)
+        gallery.change_id = meta['change_id']
+        # Built on first add/remove rather than paging in every template ID now
+        gallery._rows = None
+        return gallery
+
+
+def encode_photo(data):
+    """Encode the single face in a photo. Raises ValueError if it does not contain exactly one face."""
+    import face_recognition
+    from face_images import normalize_face_image
+
+    canonical, locations = normalize_face_image(data)
+    if not locations:
+        raise ValueError("No face found in photo.")
+    if len(locations) > 1:
+        raise ValueError("More than one face found in photo.")
+    return face_recognition.face_encodings(np.asarray(canonical), locations)[0]
+
+
+def _encode_student_photo(student):
+    """Encode a student's current photo and store it as an enrolled template. Returns (template_id, encoding)."""
+    import face_store
+
+    path = face_store.student_image_path(student)
+    if path is None:
+        raise ValueError(f"Image not found for ID: {student['id']}")
+    try:
+        with open(path, 'rb') as f:
+            encoding = encode_photo(f.read())
+    except ValueError as e:
+        raise ValueError(f"{e} (ID: {student['id']})")
+    except Exception as e:
+        raise ValueError(f"Error with image for ID {student['id']}: {e}")
+    return add_face_encoding(student['id'], encode_blob(encoding)), encoding
+
+
+def load_gallery(students, mode='min', tolerance=MATCH_TOLERANCE, dtype='float32'):
+    """Build a gallery from stored templates, encoding (and storing) photos of students that have none.
+
+    Returns (gallery, errors).
+    """
+    gallery = FaceGallery(mode=mode, tolerance=tolerance, dtype=dtype)
+    # Taken before reading, so changes made while loading are replayed rather than missed
+    gallery.change_id = get_gallery_change_cursor()
+    gallery.names = {s['id']: s.get('name', 'Unknown') for s in students}
+    for template in get_face_templates():
+        if template['student_id'] in gallery.names:
+            gallery.add(template['student_id'], decode_blob(template['encoding']),
+                        template['id'], template['source'])
+
+    errors = []
+    for student in students:
+        if gallery.template_count(student['id']):
+            continue
+        try:
+            template_id, encoding = _encode_student_photo(student)
+        except ValueError as e:
+            errors.append(str(e))
+            continue
+        gallery.add(student['id'], encoding, template_id)
+    return gallery, errors
+
+
+def read_gallery_changes(change_id):
+    """Read the gallery changes logged after `change_id` without touching a gallery.
+
+    Returns (last_change_id, updates, errors) for apply_gallery_updates(). Each
+    update is (student_id, name or None if deleted, template rows, new
+    (template_id, encoding) or None). Students that gained a photo but have no
+    template yet are encoded and stored here, which takes a while, so callers
+    with a UI run this on a worker thread.
+    """
+    changes = get_gallery_changes(change_id)
+    if not changes:
+        return change_id, [], []
+    student_ids = list(dict.fromkeys(student_id for _, student_id in changes))
+
+    templates = {student_id: [] for student_id in student_ids}
+    for template in get_face_templates(student_ids):
+        templates[template['student_id']].append(template)
+
+    updates, errors = [], []
+    for student_id in student_ids:
+        student = get_student_by_id(student_id)
+        encoded = None
+        if student and not templates[student_id] and student.get('image_hash'):
+            try:
+                encoded = _encode_student_photo(student)
+            except ValueError as e:
+                errors.append(str(e))
+        updates.append((student_id, student.get('name', 'Unknown') if student else None, templates[student_id], encoded))
+    return changes[-1][0], updates, errors
+
+
+def apply_gallery_updates(gallery, change_id, updates):
+    """Apply the result of read_gallery_changes() to `gallery`. Returns the changed student IDs."""
+    gallery.change_id = change_id
+    for student_id, name, templates, encoded in updates:
+        gallery.sync_student(student_id, name, templates)
+        if encoded is not None:
+            gallery.add(student_id, encoded[1], encoded[0])
+    return [update[0] for update in updates]
+
+
+def apply_gallery_changes(gallery):
+    """Apply gallery changes logged since the gallery was loaded or last refreshed.
+
+    Returns (changed_student_ids, errors); see read_gallery_changes().
+    """
+    change_id, updates, errors = read_gallery_changes(gallery.change_id)
+    return apply_gallery_updates(gallery, change_id, updates), errors
+
+
+def _snapshot_versions(root):
+    return sorted(name for name in os.listdir(root) if name.startswith('v') and name[1:].isdigit())
+
+
+def publish_gallery(gallery, root=SHARED_GALLERY_DIR):
+    """Save a gallery as the next snapshot version and atomically make it current. Returns the version."""
+    os.makedirs(root, exist_ok=True)
+    staging = tempfile.mkdtemp(dir=root, prefix='.staging-')
+    try:
+        gallery.save(staging)
+        while True:
+            versions = _snapshot_versions(root)
+            version = f"v{int(versions[-1][1:]) + 1 if versions else 1:08d}"
+            try:
+                os.rename(staging, os.path.join(root, version))
+                break
+            except OSError:
+                # Another publisher took this version number
+                if not os.path.isdir(os.path.join(root, version)):
+                    raise
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    fd, tmp_path = tempfile.mkstemp(dir=root, prefix='.current-')
+    with os.fdopen(fd, 'w') as f:
+        f.write(version)
+    # Readers see either the old or the new version, never a partial one
+    os.replace(tmp_path, os.path.join(root, 'CURRENT'))
+
+    for old in _snapshot_versions(root)[:-SNAPSHOTS_KEPT]:
+        # Processes still mapping an old version keep their pages until they switch
+        shutil.rmtree(os.path.join(root, old), ignore_errors=True)
+    return version
+
+
+class SharedGallery:
+    """Read-only view of the currently published gallery snapshot, following new versions."""
+
+    def __init__(self, root=SHARED_GALLERY_DIR, mode='min', tolerance=MATCH_TOLERANCE,
+                 check_interval=SHARED_CHECK_INTERVAL):
+        self.root = root
+        self.mode = mode
+        self.tolerance = tolerance
+        self.check_interval = check_interval
+        self.version = None
+        self.gallery = None
+        self._pointer = None
+        self._checked_at = 0.0
+        if not self.refresh():
+            raise FileNotFoundError(f"No gallery has been published in {root}")
+
+    def refresh(self):
+        """Switch to the current version if it changed. Returns True if a new version was attached."""
+        self._checked_at = time.monotonic()
+        current = os.path.join(self.root, 'CURRENT')
+        for _ in range(SHARED_OPEN_ATTEMPTS):
+            try:
+                st = os.stat(current)
+            except FileNotFoundError:
+                return False
+            # os.replace gives CURRENT a new inode, so this catches every publish
+            pointer = (st.st_ino, st.st_mtime_ns)
+            if pointer == self._pointer:
+                return False
+            with open(current) as f:
+                version = f.read().strip()
+            if version == self.version:
+                self._pointer = pointer
+                return False
+            try:
+                gallery = FaceGallery.open(os.path.join(self.root, version), mode=self.mode, tolerance=self.tolerance)
+            except FileNotFoundError:
+                # Pruned by publishes since CURRENT was read; CURRENT names a newer version by now
+                continue
+            self._pointer, self.gallery, self.version = pointer, gallery, version
+            return True
+        # Keep matching against the version already attached; the next check tries again
+        return False
+
+    def match(self, encodings):
+        if time.monotonic() - self._checked_at >= self.check_interval:
+            self.refresh()
+        return self.gallery.match(encodings)
+
+    def name(self, student_id, default='Unknown'):
+        return self.gallery.name(student_id, default)
+
+    def __len__(self):
+        return len(self.gallery)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage per-student face galleries.")
+    parser.add_argument('--add', nargs='+', metavar=('STUDENT_ID', 'PHOTO'),
+                        help="Enroll additional photos for a student")
+    parser.add_argument('--stats', action='store_true', help="Print template counts per student")
+    parser.add_argument('--export', metavar='DIR', help="Save the gallery to DIR for memory-mapped loading")
+    parser.add_argument('--publish', action='store_true', help="Publish the gallery for other processes to share")
+    parser.add_argument('--root', default=SHARED_GALLERY_DIR, help="Directory of published snapshots")
+    parser.add_argument('--follow', type=float, metavar='SECONDS',
+                        help="With --publish, keep polling for changes and publish a new version when they occur")
+    parser.add_argument('--dtype', choices=STORAGE_DTYPES, default='float32',
+                        help="Template format for --export and --publish")
+    args = parser.parse_args()
+
+    create_tables()
+    if args.add:
+        if len(args.add) < 2:
+            parser.error("--add needs a student ID and at least one photo")
+        student_id, photos = args.add[0], args.add[1:]
+        if student_id not in {s['id'] for s in get_all_students()}:
+            parser.error(f"No student with ID {student_id}")
+        for photo in photos:
+            try:
+                with open(photo, 'rb') as f:
+                    encoding = encode_photo(f.read())
+            except (OSError, ValueError) as e:
+                print(f"{photo}: skipped - {e}")
+                continue
+            add_face_encoding(student_id, encode_blob(encoding))
+            print(f"{photo}: added")
+    elif args.stats:
+        counts = {}
+        for template in get_face_templates():
+            per_source = counts.setdefault(template['student_id'], {})
+            per_source[template['source']] = per_source.get(template['source'], 0) + 1
+        for student in get_all_students():
+            per_source = counts.get(student['id'], {})
+            print(f"{student['id']}  {student['name']:<30} enrolled={per_source.get('enrolled', 0)} "
+                  f"auto={per_source.get('auto', 0)}")
+    elif args.export:
+        # Students without a template are encoded (and stored) on the way
+        gallery, errors = load_gallery(get_all_students(), dtype=args.dtype)
+        for error in errors:
+            print(error)
+        gallery.save(args.export)
+        print(f"Saved {len(gallery)} templates of {len(gallery.names)} students to {args.export} "
+              f"({gallery.nbytes / 1024:.1f} KiB as {args.dtype})")
+    elif args.publish:
+        gallery, errors = load_gallery(get_all_students(), dtype=args.dtype)
+        for error in errors:
+            print(error)
+        print(f"Published {publish_gallery(gallery, args.root)} ({len(gallery)} templates)")
+        while args.follow:
+            time.sleep(args.follow)
+            changed, errors = apply_gallery_changes(gallery)
+            for error in errors:
+                print(error)
+            if changed:
+                print(f"Published {publish_gallery(gallery, args.root)} ({len(changed)} students changed)")
+    else:
+        parser.error("Nothing to do; pass --add, --stats, --export or --publish")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Face image ingest pipeline for the known_faces directory.
+
+Every saved photo is oriented from its EXIF data, stripped of metadata,
+cropped around the detected face and stored in the face store (see
+face_store.py) as a canonical, encode-ready JPEG together with pre-sized
+thumbnail variants: 'avatar' (256x256 profile) and 'icon' (64x64 table icon).
+
+Usage (move images saved before the pipeline existed into the store):
+    python face_images.py --backfill [--force]
+"""
+
+import argparse
+import io
+import os
+
+import face_store
+from database_sql import KNOWN_FACES_DIR, create_tables, get_all_students, set_student_image_hash, set_student_photo
+
+THUMBNAIL_SIZES = {'avatar': 256, 'icon': 64}
+# Canonical images are at most this many pixels on the long side
+CANONICAL_SIZE = 480
+# Detection runs on a downscaled copy; HOG detection time grows with pixel count
+MAX_DETECT_DIM = 800
+# Side of the square crop relative to the face box, leaving room for hair and chin
+FACE_CROP_SCALE = 2.2
+JPEG_QUALITY = 90
+
+
+def _imaging():
+    """Lazily import Pillow, mirroring the optional heavy deps in the UI."""
+    try:
+        from PIL import Image, ImageOps
+        return Image, ImageOps
+    except ImportError as e:
+        raise ImportError(f"Face image processing needs pillow. Install with: pip install pillow\n\nDetails: {e}")
+
+
+def _detect_faces(img):
+    """Return face boxes (top, right, bottom, left) in `img`, or None if face_recognition is not installed."""
+    try:
+        import numpy as np
+        import face_recognition
+    except ImportError:
+        return None
+    return face_recognition.face_locations(np.asarray(img))
+
+
+def normalize_face_image(data, detect=True):
+    """Decode, orient and crop a face photo.
+
+    Returns (canonical_image, face_locations) where face_locations are in the
+    canonical image's coordinates. The image is only cropped when exactly one
+    face is found; face_locations is None when no detector is available.
+    """
+    Image, ImageOps = _imaging()
+    img = Image.open(io.BytesIO(data))
+    img = ImageOps.exif_transpose(img).convert('RGB')
+    img.thumbnail((MAX_DETECT_DIM, MAX_DETECT_DIM), Image.Resampling.LANCZOS)
+
+    locations = _detect_faces(img) if detect else None
+    if locations and len(locations) == 1:
+        top, right, bottom, left = locations[0]
+        side = int(max(bottom - top, right - left) * FACE_CROP_SCALE)
+        cx, cy = (left + right) // 2, (top + bottom) // 2
+        x0 = max(0, min(cx - side // 2, img.width - side))
+        y0 = max(0, min(cy - side // 2, img.height - side))
+        box = (x0, y0, min(img.width, x0 + side), min(img.height, y0 + side))
+        img = img.crop(box)
+        locations = [(top - box[1], right - box[0], bottom - box[1], left - box[0])]
+
+    scale = min(1.0, CANONICAL_SIZE / max(img.width, img.height))
+    if scale < 1.0:
+        img = img.resize((round(img.width * scale), round(img.height * scale)), Image.Resampling.LANCZOS)
+        if locations:
+            locations = [tuple(int(v * scale) for v in loc) for loc in locations]
+    return img, locations
+
+
+def render_thumbnails(canonical):
+    """Square, centre-cropped thumbnails of a canonical image keyed by size name."""
+    Image, ImageOps = _imaging()
+    return {
+        name: ImageOps.fit(canonical, (size, size), Image.Resampling.LANCZOS)
+        for name, size in THUMBNAIL_SIZES.items()
+    }
+
+
+def _jpeg_bytes(img):
+    buf = io.BytesIO()
+    # Saving without exif= drops all metadata from the source photo
+    img.save(buf, format='JPEG', quality=JPEG_QUALITY, optimize=True)
+    return buf.getvalue()
+
+
+def store_face_image(canonical):
+    """Store a canonical image and its thumbnails in the face store. Returns the image hash."""
+    image_hash = face_store.put_blob(_jpeg_bytes(canonical))
+    for size, thumb in render_thumbnails(canonical).items():
+        face_store.put_variant(image_hash, size, _jpeg_bytes(thumb))
+    return image_hash
+
+
+def save_face_image(student_id, data):
+    """Run the ingest pipeline on raw upload bytes and make it the student's current image.
+
+    Returns the number of faces detected, or None if no detector is installed.
+    """
+    canonical, locations = normalize_face_image(data)
+    set_student_image_hash(student_id, store_face_image(canonical))
+    return None if locations is None else len(locations)
+
+
+def enroll_face_image(student_id, data):
+    """Make an uploaded photo the student's current image and store its face template.
+
+    The template is encoded here, so the camera's gallery refresh only has to
+    load it. When the photo does not show exactly one face, or no detector is
+    installed, the student is left without a template. Returns the number of
+    faces detected, or None if no detector is installed.
+    """
+    canonical, locations = normalize_face_image(data)
+    encoding = None
+    if locations and len(locations) == 1:
+        import numpy as np
+        import face_recognition
+        from face_gallery import encode_blob
+        encoding = encode_blob(face_recognition.face_encodings(np.asarray(canonical), locations)[0])
+    set_student_photo(student_id, store_face_image(canonical), encoding)
+    return None if locations is None else len(locations)
+
+
+def _remove_legacy_images(student_id):
+    paths = [os.path.join(KNOWN_FACES_DIR, f"{student_id}.jpg")]
+    paths += [os.path.join(KNOWN_FACES_DIR, "thumbs", size, f"{student_id}.jpg") for size in THUMBNAIL_SIZES]
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def backfill(force=False):
+    """Move legacy known_faces/<id>.jpg images into the face store and build missing thumbnails."""
+    processed, skipped, failed = 0, 0, 0
+    for student in get_all_students():
+        image_hash = student.get('image_hash')
+        has_thumbs = image_hash and all(os.path.exists(face_store.blob_path(image_hash, size))
+                                        for size in THUMBNAIL_SIZES)
+        if has_thumbs and not force:
+            skipped += 1
+            continue
+        path = face_store.student_image_path(student)
+        if path is None:
+            print(f"No image found for student {student['id']}")
+            failed += 1
+            continue
+        try:
+            with open(path, 'rb') as f:
+                save_face_image(student['id'], f.read())
+            _remove_legacy_images(student['id'])
+            processed += 1
+        except Exception as e:
+            print(f"Failed to process {path}: {e}")
+            failed += 1
+    print(f"Backfill complete: {processed} processed, {skipped} already up to date, {failed} failed.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Normalise known_faces images and build thumbnails.")
+    parser.add_argument('--backfill', action='store_true', help="Process existing student images")
+    parser.add_argument('--force', action='store_true', help="Re-process images that are already in the store")
+    args = parser.parse_args()
+    if not args.backfill:
+        parser.error("Nothing to do; pass --backfill")
+    create_tables()
+    backfill(force=args.force)
+
+
+if __name__ == "__main__":
+    main()
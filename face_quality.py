@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Cheap quality checks that run on detected faces before they are encoded.
+
+Encoding costs far more than detection, so faces that cannot produce a
+reliable match are dropped first: boxes that are too small or cut off by the
+frame edge, blurry crops (low variance of the Laplacian), and turned or
+tilted heads (yaw and roll estimated from the 5-point landmarks). An
+optional liveness check only lets a face through once it has been seen to
+blink, which a printed photo or a phone screen cannot do.
+
+Every decision is counted per reason so the thresholds can be tuned.
+
+Usage (score the faces in some images with the default thresholds):
+    python face_quality.py photo1.jpg photo2.jpg
+"""
+
+import argparse
+import math
+from collections import Counter
+
+import numpy as np
+
+MIN_FACE_SIZE = 64
+# Faces whose box comes this close to the frame edge are likely cut off
+EDGE_MARGIN = 2
+# Variance of the Laplacian of the grey face crop; lower is blurrier
+MIN_SHARPNESS = 40.0
+# Nose offset from the eye midpoint, as a fraction of the eye distance
+MAX_YAW = 0.35
+MAX_ROLL_DEGREES = 25.0
+# Side of the grey crop the blur score is computed on, so it does not depend on face size
+SHARPNESS_CROP = 96
+
+# Eye aspect ratio below which the eye counts as closed
+BLINK_EAR_THRESHOLD = 0.21
+# Tracks not seen for this many frames are forgotten
+TRACK_MAX_AGE = 15
+TRACK_MIN_IOU = 0.3
+
+SKIP_REASONS = ('too_small', 'out_of_frame', 'blurry', 'pose', 'not_live')
+
+
+def sharpness(image, location):
+    """Variance of the Laplacian of a face crop, resampled to SHARPNESS_CROP pixels square and greyed."""
+    top, right, bottom, left = location
+    crop = image[top:bottom, left:right]
+    if crop.size == 0:
+        return 0.0
+    ys = np.linspace(0, crop.shape[0] - 1, SHARPNESS_CROP).astype(int)
+    xs = np.linspace(0, crop.shape[1] - 1, SHARPNESS_CROP).astype(int)
+    crop = crop[np.ix_(ys, xs)].astype(np.float32)
+    if crop.ndim == 3:
+        crop = crop.mean(axis=2)
+    lap = (crop[1:-1, :-2] + crop[1:-1, 2:] + crop[:-2, 1:-1] + crop[2:, 1:-1] - 4.0 * crop[1:-1, 1:-1])
+    return float(lap.var())
+
+
+def head_pose(landmarks):
+    """(yaw, roll_degrees) from face_recognition's 5-point ('small') landmarks."""
+    left_eye = np.mean(landmarks['left_eye'], axis=0)
+    right_eye = np.mean(landmarks['right_eye'], axis=0)
+    nose = np.asarray(landmarks['nose_tip'][0], dtype=float)
+    eye_vector = right_eye - left_eye
+    eye_distance = float(np.hypot(*eye_vector)) or 1.0
+    # Signed offset of the nose from the eye midpoint along the eye line
+    yaw = float(np.dot(nose - (left_eye + right_eye) / 2, eye_vector)) / eye_distance ** 2
+    roll = math.degrees(math.atan2(eye_vector[1], eye_vector[0]))
+    # Left and right are from the image's point of view, so a level face has roll 0 or 180
+    if roll > 90:
+        roll -= 180
+    elif roll < -90:
+        roll += 180
+    return yaw, roll
+
+
+def eye_aspect_ratio(eye):
+    """Eye openness from the six 68-point landmarks of one eye."""
+    p = np.asarray(eye, dtype=float)
+    vertical = np.linalg.norm(p[1] - p[5]) + np.linalg.norm(p[2] - p[4])
+    horizontal = 2.0 * np.linalg.norm(p[0] - p[3])
+    return float(vertical / horizontal) if horizontal else 0.0
+
+
+def _iou(a, b):
+    top, right = max(a[0], b[0]), min(a[1], b[1])
+    bottom, left = min(a[2], b[2]), max(a[3], b[3])
+    inter = max(0, bottom - top) * max(0, right - left)
+    area = lambda box: (box[2] - box[0]) * (box[1] - box[3])
+    union = area(a) + area(b) - inter
+    return inter / union if union else 0.0
+
+
+class BlinkTracker:
+    """Follows faces across frames by box overlap and remembers which ones have blinked."""
+
+    def __init__(self):
+        self.frame = 0
+        # Each track: {'box', 'seen', 'closed', 'live'}
+        self.tracks = []
+
+    def _track(self, location):
+        best, best_iou = None, TRACK_MIN_IOU
+        for track in self.tracks:
+            overlap = _iou(track['box'], location)
+            if overlap >= best_iou:
+                best, best_iou = track, overlap
+        if best is None:
+            best = {'box': location, 'seen': self.frame, 'closed': False, 'live': False}
+            self.tracks.append(best)
+        best['box'] = location
+        best['seen'] = self.frame
+        return best
+
+    def next_frame(self):
+        self.frame += 1
+        self.tracks = [t for t in self.tracks if self.frame - t['seen'] <= TRACK_MAX_AGE]
+
+    def is_live(self, rgb, location, face_recognition):
+        """True once the face at `location` has closed and reopened its eyes while tracked."""
+        track = self._track(location)
+        if track['live']:
+            return True
+        landmarks = face_recognition.face_landmarks(rgb, [location], model='large')
+        if not landmarks:
+            return False
+        ear = (eye_aspect_ratio(landmarks[0]['left_eye']) + eye_aspect_ratio(landmarks[0]['right_eye'])) / 2
+        if ear < BLINK_EAR_THRESHOLD:
+            track['closed'] = True
+        elif track['closed']:
+            track['live'] = True
+        return track['live']
+
+
+class QualityGate:
+    """Decides which detected faces are worth encoding, counting the reason for every skip."""
+
+    def __init__(self, min_face_size=MIN_FACE_SIZE, min_sharpness=MIN_SHARPNESS, max_yaw=MAX_YAW,
+                 max_roll=MAX_ROLL_DEGREES, liveness=False):
+        self.min_face_size = min_face_size
+        self.min_sharpness = min_sharpness
+        self.max_yaw = max_yaw
+        self.max_roll = max_roll
+        self.blinks = BlinkTracker() if liveness else None
+        self.counts = Counter()
+
+    def check(self, rgb, location, face_recognition=None):
+        """Return None if the face should be encoded, otherwise the reason to skip it.
+
+        Checks run cheapest first; landmarks are only computed for faces that
+        passed the size, edge and blur checks.
+        """
+        top, right, bottom, left = location
+        height, width = rgb.shape[:2]
+        if min(bottom - top, right - left) < self.min_face_size:
+            return 'too_small'
+        if top < EDGE_MARGIN or left < EDGE_MARGIN or bottom > height - EDGE_MARGIN or right > width - EDGE_MARGIN:
+            return 'out_of_frame'
+        if sharpness(rgb, location) < self.min_sharpness:
+            return 'blurry'
+        if face_recognition is None:
+            import face_recognition
+        landmarks = face_recognition.face_landmarks(rgb, [location], model='small')
+        if landmarks:
+            yaw, roll = head_pose(landmarks[0])
+            if abs(yaw) > self.max_yaw or abs(roll) > self.max_roll:
+                return 'pose'
+        if self.blinks is not None and not self.blinks.is_live(rgb, location, face_recognition):
+            return 'not_live'
+        return None
+
+    def filter(self, rgb, locations, face_recognition=None):
+        """Split a frame's face locations into (accepted, [(location, reason), ...] skipped)."""
+        if self.blinks is not None:
+            self.blinks.next_frame()
+        accepted, skipped = [], []
+        for location in locations:
+            reason = self.check(rgb, location, face_recognition)
+            self.counts[reason or 'passed'] += 1
+            if reason is None:
+                accepted.append(location)
+            else:
+                skipped.append((location, reason))
+        return accepted, skipped
+
+    def stats(self):
+        """Counts per outcome plus the overall skip rate."""
+        total = sum(self.counts.values())
+        skipped = total - self.counts['passed']
+        return {
+            'faces': total,
+            'passed': self.counts['passed'],
+            'skipped': {reason: self.counts[reason] for reason in SKIP_REASONS if self.counts[reason]},
+            'skip_rate': skipped / total if total else 0.0,
+        }
+
+    def summary(self):
+        """One-line description of the counters, for status bars and logs."""
+        stats = self.stats()
+        reasons = ", ".join(f"{reason.replace('_', ' ')} {count}" for reason, count in stats['skipped'].items())
+        return f"Encoded {stats['passed']}/{stats['faces']} faces" + (f" (skipped: {reasons})" if reasons else "")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score detected faces against the pre-encoding quality gate.")
+    parser.add_argument('images', nargs='+')
+    parser.add_argument('--min-size', type=int, default=MIN_FACE_SIZE)
+    parser.add_argument('--min-sharpness', type=float, default=MIN_SHARPNESS)
+    args = parser.parse_args()
+
+    import face_recognition
+    gate = QualityGate(min_face_size=args.min_size, min_sharpness=args.min_sharpness)
+    for path in args.images:
+        rgb = face_recognition.load_image_file(path)
+        for location in face_recognition.face_locations(rgb):
+            landmarks = face_recognition.face_landmarks(rgb, [location], model='small')
+            yaw, roll = head_pose(landmarks[0]) if landmarks else (float('nan'), float('nan'))
+            reason = gate.check(rgb, location, face_recognition)
+            gate.counts[reason or 'passed'] += 1
+            top, right, bottom, left = location
+            print(f"{path} {location}: size {min(bottom - top, right - left)}, "
+                  f"sharpness {sharpness(rgb, location):.1f}, yaw {yaw:+.2f}, roll {roll:+.1f} -> {reason or 'ok'}")
+    print(gate.summary())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Content-addressed storage for face images.
+
+Images are stored once per distinct content under the SHA-256 of their bytes,
+sharded two levels deep so no directory grows past a few hundred entries:
+
+    known_faces/blobs/ab/cd/abcd...ef.jpg         canonical image
+    known_faces/blobs/ab/cd/abcd...ef.avatar.jpg  derived variants
+
+A student row points at its current image through `students.image_hash`.
+Blobs are never modified in place; replacing a photo writes a new blob, so
+URLs and encodings keyed by the hash never go stale. Blobs no student
+references any more are only deleted by the garbage collector below.
+
+Usage (remove blobs no student references any more):
+    python face_store.py --gc [--grace 3600]
+"""
+
+import argparse
+import hashlib
+import os
+import tempfile
+import time
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+KNOWN_FACES_DIR = os.path.join(SCRIPT_DIR, "known_faces")
+BLOBS_DIR = os.path.join(KNOWN_FACES_DIR, "blobs")
+# Blobs younger than this are kept by the garbage collector, since a
+# concurrent save may have written the blob but not yet updated its row.
+GC_GRACE_SECONDS = 3600
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def blob_path(image_hash, variant=None):
+    """Filesystem path of a blob, or of one of its derived variants (e.g. 'avatar')."""
+    name = f"{image_hash}.{variant}.jpg" if variant else f"{image_hash}.jpg"
+    return os.path.join(BLOBS_DIR, image_hash[:2], image_hash[2:4], name)
+
+
+def _atomic_write(path, data):
+    """Write to a temporary file in the target directory, then rename it into place."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def put_blob(data):
+    """Store image bytes and return their hash. Storing identical bytes twice is a no-op."""
+    image_hash = content_hash(data)
+    path = blob_path(image_hash)
+    if os.path.exists(path):
+        # Refresh the mtime so the garbage collector's grace period restarts
+        os.utime(path)
+    else:
+        _atomic_write(path, data)
+    return image_hash
+
+
+def put_variant(image_hash, variant, data):
+    """Store a derived image (thumbnail) of a blob."""
+    _atomic_write(blob_path(image_hash, variant), data)
+
+
+def student_image_path(student, variant=None):
+    """Path of a student's current image (or variant), falling back to the legacy flat layout.
+
+    Returns None if the student has no image on disk.
+    """
+    image_hash = student.get('image_hash')
+    if image_hash:
+        path = blob_path(image_hash, variant)
+        if os.path.exists(path):
+            return path
+        if variant:
+            return student_image_path(student)
+        return None
+    legacy = os.path.join(KNOWN_FACES_DIR, f"{student.get('id')}.jpg")
+    if variant:
+        thumb = os.path.join(KNOWN_FACES_DIR, "thumbs", variant, f"{student.get('id')}.jpg")
+        if os.path.exists(thumb):
+            return thumb
+    return legacy if os.path.exists(legacy) else None
+
+
+def collect_garbage(referenced_hashes, grace_seconds=GC_GRACE_SECONDS):
+    """Remove blobs (and stale temporary files) that no student references. Returns the number of files removed."""
+    referenced = set(referenced_hashes)
+    cutoff = time.time() - grace_seconds
+    removed = 0
+    for root, _, files in os.walk(BLOBS_DIR):
+        for name in files:
+            path = os.path.join(root, name)
+            is_temp = name.endswith('.tmp')
+            if not is_temp and name.split('.', 1)[0] in referenced:
+                continue
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except FileNotFoundError:
+                pass
+    return removed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the content-addressed face image store.")
+    parser.add_argument('--gc', action='store_true', help="Delete blobs not referenced by any student")
+    parser.add_argument('--grace', type=int, default=GC_GRACE_SECONDS,
+                        help="Keep unreferenced blobs younger than this many seconds")
+    args = parser.parse_args()
+    if not args.gc:
+        parser.error("Nothing to do; pass --gc")
+
+    from database_sql import create_tables, get_referenced_image_hashes
+    create_tables()
+    removed = collect_garbage(get_referenced_image_hashes(), grace_seconds=args.grace)
+    print(f"Garbage collection complete: {removed} files removed.")
+
+
+if __name__ == "__main__":
+    main()
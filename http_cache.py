@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+HTTP caching helpers for face images and static assets.
+
+Files are versioned by a hash of their content. URLs built with url_for()
+carry that version as `?v=<hash>`; a request whose version matches the file
+on disk is served with a year-long immutable Cache-Control, anything else is
+revalidated with the content-hash ETag and Last-Modified (304 when unchanged).
+
+Usage (write .gz/.br siblings of text assets in static/):
+    python http_cache.py --precompress
+"""
+
+import argparse
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+
+from flask import request, send_from_directory
+from werkzeug.security import safe_join
+
+LONG_MAX_AGE = 365 * 24 * 3600
+VERSION_LENGTH = 12
+# Only text assets benefit from precompression; images are already compressed
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.svg', '.html', '.json', '.txt')
+# Encodings in order of preference, with the suffix of the precompressed file
+PRECOMPRESSED_ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+# path -> (mtime_ns, size, version); entries are refreshed when the file changes
+_versions = {}
+_versions_lock = threading.Lock()
+
+
+def file_version(path):
+    """Short content hash of a file, cached until its mtime or size changes. None if missing."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    cached = _versions.get(path)
+    if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+        return cached[2]
+
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            digest.update(chunk)
+    version = digest.hexdigest()[:VERSION_LENGTH]
+    with _versions_lock:
+        _versions[path] = (st.st_mtime_ns, st.st_size, version)
+    return version
+
+
+def _accepted_encodings():
+    header = request.headers.get('Accept-Encoding', '')
+    return {part.split(';')[0].strip().lower() for part in header.split(',') if part.strip()}
+
+
+def send_cached_file(directory, filename, precompressed=False, content_addressed=False):
+    """send_from_directory with content-hash ETags and long-lived caching for versioned URLs.
+
+    Content-addressed files already carry their hash in the URL, so they are
+    always served as immutable and never re-hashed.
+    """
+    path = safe_join(directory, filename)
+    if content_addressed:
+        version = os.path.basename(filename).split('.', 1)[0] if path and os.path.exists(path) else None
+    else:
+        version = file_version(path) if path else None
+    if version is None:
+        # Let Flask produce its usual 404
+        return send_from_directory(directory, filename)
+
+    immutable = content_addressed or request.args.get('v') == version
+    max_age = LONG_MAX_AGE if immutable else 0
+
+    if precompressed:
+        accepted = _accepted_encodings()
+        for encoding, suffix in PRECOMPRESSED_ENCODINGS:
+            # A compressed copy older than its source is stale, so it is skipped
+            if encoding in accepted and os.path.exists(path + suffix) \
+                    and os.path.getmtime(path + suffix) >= os.path.getmtime(path):
+                rv = send_from_directory(directory, filename + suffix, mimetype=mimetypes.guess_type(filename)[0],
+                                         etag=f"{version}-{encoding}", max_age=max_age, conditional=True)
+                rv.headers['Content-Encoding'] = encoding
+                rv.vary.add('Accept-Encoding')
+                break
+        else:
+            rv = send_from_directory(directory, filename, etag=version, max_age=max_age, conditional=True)
+            rv.vary.add('Accept-Encoding')
+    else:
+        rv = send_from_directory(directory, filename, etag=version, max_age=max_age, conditional=True)
+
+    if immutable:
+        rv.cache_control.immutable = True
+    return rv
+
+
+def precompress(directory):
+    """Write .gz (and .br, if the brotli package is installed) next to compressible files."""
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+
+    written = 0
+    for root, _, files in os.walk(directory):
+        for filename in files:
+            if not filename.endswith(COMPRESSIBLE_EXTENSIONS):
+                continue
+            path = os.path.join(root, filename)
+            with open(path, 'rb') as f:
+                data = f.read()
+            outputs = [('.gz', gzip.compress(data, compresslevel=9, mtime=0))]
+            if brotli is not None:
+                outputs.append(('.br', brotli.compress(data)))
+            for suffix, compressed in outputs:
+                # Serving a compressed copy that is not smaller only costs the client CPU
+                if len(compressed) < len(data):
+                    with open(path + suffix, 'wb') as f:
+                        f.write(compressed)
+                    written += 1
+    print(f"Wrote {written} precompressed files under {directory}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP caching utilities.")
+    parser.add_argument('--precompress', action='store_true', help="Precompress text assets in static/")
+    args = parser.parse_args()
+    if not args.precompress:
+        parser.error("Nothing to do; pass --precompress")
+    precompress(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static'))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Measure how long the application modules take to import.
+
+Each module is imported in a fresh interpreter started with
+`python -X importtime`, several times, and the median cumulative time is
+reported together with the direct imports that cost the most. This is what
+every web worker and every start of the desktop app pays before doing
+anything useful.
+
+Imports run against an empty SQLite database path in a temporary
+directory (and without reading .env), so the benchmark also checks that
+importing a module does not touch the database: schema creation belongs to
+`python manage_db.py migrate` and the startup of main.py/run_production.py.
+
+The exit status is 1 when a module exceeds its --budget or touches the
+database, so the benchmark can run as a check before a release. Reports
+are written as JSON so runs can be compared between releases.
+
+Usage:
+    python import_benchmark.py
+    python import_benchmark.py app --runs 10 --json imports.json
+    python import_benchmark.py --budget app=400 --budget student_attendance_ui=300 --compare imports.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+# Entry points of the web workers, the desktop app and the database layer they share
+DEFAULT_MODULES = ('app', 'student_attendance_ui', 'database_sql')
+# "import time:  self [us] | cumulative | <indent>name", one line per module after it finished importing
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)$')
+LARGEST_IMPORTS = 8
+
+
+def parse_importtime(output, module):
+    """Self and cumulative microseconds of `module` and of its direct imports, from -X importtime output."""
+    entries = []
+    for line in output.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            entries.append((name, (len(indent) - 1) // 2, int(self_us), int(cumulative_us)))
+    # A module is reported after everything it imported, so its direct imports are the
+    # depth-1 entries between the previous top-level entry and its own
+    end = next((i for i in range(len(entries) - 1, -1, -1) if entries[i][0] == module and entries[i][1] == 0), None)
+    if end is None:
+        raise ValueError(f"{module} does not appear in the -X importtime output")
+    start = end
+    while start > 0 and entries[start - 1][1] > 0:
+        start -= 1
+    children = [(name, cumulative) for name, depth, _, cumulative in entries[start:end] if depth == 1]
+    return entries[end][2], entries[end][3], children
+
+
+def import_once(module, workdir):
+    """Import `module` in a new interpreter; returns (-X importtime output, whether the database file was created)."""
+    db_file = os.path.join(workdir, 'attendance.db')
+    env = dict(os.environ,
+               PYTHONPATH=os.pathsep.join(filter(None, [SCRIPT_DIR, os.environ.get('PYTHONPATH')])),
+               DB_TYPE='sqlite', DB_FILE=db_file,
+               SECRET_KEY_FILE=os.path.join(workdir, '.secret_key'),
+               RESPONSE_CACHE_FILE=os.path.join(workdir, 'response_cache.db'))
+    # Started in workdir so load_env finds no .env to override the settings above
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=workdir, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise SystemExit(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+    touched = os.path.exists(db_file)
+    if touched:
+        os.remove(db_file)
+    return result.stderr, touched
+
+
+def measure(module, runs):
+    with tempfile.TemporaryDirectory(prefix='import-benchmark-') as workdir:
+        # Untimed first import, so byte-code compilation is not counted
+        import_once(module, workdir)
+        samples = []
+        touched = False
+        for _ in range(runs):
+            output, created = import_once(module, workdir)
+            touched = touched or created
+            samples.append(parse_importtime(output, module))
+    cumulative = [sample[1] for sample in samples]
+    median_run = samples[cumulative.index(sorted(cumulative)[len(cumulative) // 2])]
+    children = sorted(median_run[2], key=lambda child: child[1], reverse=True)[:LARGEST_IMPORTS]
+    return {
+        'cumulative_ms': statistics.median(cumulative) / 1000,
+        'min_ms': min(cumulative) / 1000,
+        'max_ms': max(cumulative) / 1000,
+        'self_ms': median_run[0] / 1000,
+        'largest_imports': [{'module': name, 'cumulative_ms': us / 1000} for name, us in children],
+        'touches_database': touched,
+    }
+
+
+def _environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=SCRIPT_DIR, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'git_commit': commit,
+    }
+
+
+def parse_budget(value):
+    module, _, ms = value.partition('=')
+    try:
+        return module, float(ms)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected MODULE=MILLISECONDS, got {value!r}")
+
+
+def print_report(report, baseline=None):
+    for module, result in report['modules'].items():
+        print(f"{module:<24} {result['cumulative_ms']:>8.1f} ms (min {result['min_ms']:.1f}, max {result['max_ms']:.1f}, "
+              f"self {result['self_ms']:.1f})" + ("  TOUCHES THE DATABASE" if result['touches_database'] else ''))
+        for child in result['largest_imports']:
+            print(f"    {child['module']:<32} {child['cumulative_ms']:>8.1f} ms")
+
+    if baseline:
+        print(f"\nCompared with {baseline.get('timestamp')} ({baseline['environment'].get('git_commit')}):")
+        for module, result in report['modules'].items():
+            previous = baseline['modules'].get(module, {}).get('cumulative_ms')
+            if not previous:
+                continue
+            change = (result['cumulative_ms'] - previous) / previous
+            marker = '' if abs(change) < 0.05 else (' better' if change < 0 else ' WORSE')
+            print(f"  {module:<24} {previous:>8.1f} -> {result['cumulative_ms']:>8.1f} ms  {change:+7.1%}{marker}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the import time of the application modules.")
+    parser.add_argument('modules', nargs='*', default=list(DEFAULT_MODULES),
+                        help=f"Modules to import (default: {' '.join(DEFAULT_MODULES)})")
+    parser.add_argument('--runs', type=int, default=5, help="Timed imports per module (default 5)")
+    parser.add_argument('--budget', type=parse_budget, action='append', default=[], metavar='MODULE=MS',
+                        help="Fail if the median import of MODULE takes longer than MS milliseconds")
+    parser.add_argument('--json', help="Write the report to this JSON file")
+    parser.add_argument('--compare', help="Previous JSON report to compare against")
+    args = parser.parse_args()
+
+    report = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'environment': _environment(),
+        'runs': args.runs,
+        'modules': {module: measure(module, max(1, args.runs)) for module in args.modules},
+    }
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.json}")
+
+    failures = [f"{module} touches the database on import"
+                for module, result in report['modules'].items() if result['touches_database']]
+    for module, budget in args.budget:
+        result = report['modules'].get(module)
+        if result is None:
+            failures.append(f"no measurement for {module}; add it to the modules to import")
+        elif result['cumulative_ms'] > budget:
+            failures.append(f"{module} imports in {result['cumulative_ms']:.1f} ms, over its {budget:.0f} ms budget")
+    if failures:
+        raise SystemExit("\n".join(failures))
+
+
+if __name__ == "__main__":
+    main()
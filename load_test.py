@@ -0,0 +1,491 @@
+#!/usr/bin/env python3
+"""
+Load test for the web application on databases of different sizes.
+
+`seed` fills a database with generated students and a chronological
+attendance log of the requested size. `run` starts run_production.py
+(Waitress) against each seeded database, logs in as the dashboard user, an
+admin and a student, and drives every route with concurrent requests. For
+each route it reports p50/p95/p99 latency, throughput, errors, response size
+and the server's resident memory while the route was being hit.
+
+With the default SQLite backend every size gets its own database file under
+--db-dir, seeded on first use. For MySQL/PostgreSQL, `seed` writes to the
+configured database and `run` measures it as it is.
+
+Usage:
+    python load_test.py run --rows 10k,1M --concurrency 16 --duration 20 --json results.json
+    python load_test.py seed --rows 10M --students 20000
+    python load_test.py run --url http://127.0.0.1:8080 --student-id 81710000
+"""
+
+import argparse
+import http.client
+import itertools
+import json
+import math
+import os
+import platform
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from urllib.parse import urlencode, urlsplit
+
+import numpy as np
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DB_DIR = os.path.join(SCRIPT_DIR, 'loadtest')
+
+# (path, session needed) for every route under test
+ROUTES = (
+    ('/', 'user'),
+    ('/attendance', 'user'),
+    ('/attendance/export', 'user'),
+    ('/admin', 'admin'),
+    ('/student/attendance', 'student'),
+)
+PERCENTILES = (50, 95, 99)
+
+FIRST_NAMES = ('Aarav', 'Aisha', 'Bikash', 'Chen', 'Diya', 'Elena', 'Farhan', 'Grace', 'Hari', 'Ines',
+               'Jonas', 'Kiran', 'Leila', 'Mohit', 'Nina', 'Omar', 'Priya', 'Quinn', 'Rohan', 'Sara',
+               'Tenzin', 'Uma', 'Victor', 'Wen', 'Yuki', 'Zara')
+LAST_NAMES = ('Adhikari', 'Baker', 'Chaudhary', 'Dahal', 'Evans', 'Fernandez', 'Gurung', 'Hansen',
+              'Ito', 'Joshi', 'Karki', 'Lama', 'Müller', 'Nguyen', 'Okafor', 'Pandey', 'Rai', 'Shrestha',
+              'Thapa', 'Wagle')
+FACULTIES = ('Science', 'Engineering', 'Management', 'Humanities', 'Medicine', 'Law', 'Education')
+# Share of students present on an average day, used to spread rows over dates
+ATTENDANCE_RATE = 0.8
+SEED_BATCH = 50000
+# Marks happen between 08:00 and 17:00
+DAY_START_SECONDS = 8 * 3600
+DAY_SECONDS = 9 * 3600
+
+
+def parse_count(text):
+    """'10k' -> 10000, '1M' -> 1000000, '2500' -> 2500."""
+    match = re.fullmatch(r'(\d+(?:\.\d+)?)([kKmM]?)', text.strip())
+    if not match:
+        raise argparse.ArgumentTypeError(f"not a row count: {text!r}")
+    scale = {'': 1, 'k': 1000, 'm': 1000000}[match.group(2).lower()]
+    return int(float(match.group(1)) * scale)
+
+
+def _sizes(text):
+    return [(label.strip(), parse_count(label)) for label in text.split(',') if label.strip()]
+
+
+# --- Seeding --- #
+def _stride(students):
+    """A step coprime with `students`, so (offset + k * step) % students visits every student once."""
+    for step in (7919, 104729, 1299709, 15485863):
+        if math.gcd(step, students) == 1:
+            return step
+    return 1
+
+
+def seed(rows, students, days=None, append=False, seed_value=0, progress=print):
+    """Insert `students` generated students and `rows` attendance rows spread over `days` days ending today."""
+    from database_sql import (DB_TYPE, add_students_batch, create_tables, get_db_connection,
+                              rebuild_attendance_rollup, reserve_student_ids)
+
+    create_tables()
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1 FROM attendance LIMIT 1")
+    if cursor.fetchone() is not None and not append:
+        conn.close()
+        raise SystemExit("The attendance table is not empty; pass --append to add to it anyway.")
+    conn.close()
+
+    rng = np.random.default_rng(seed_value)
+    ids = reserve_student_ids(students)
+    for start in range(0, students, 5000):
+        batch = []
+        for i, student_id in enumerate(ids[start:start + 5000], start):
+            first, last = FIRST_NAMES[rng.integers(len(FIRST_NAMES))], LAST_NAMES[rng.integers(len(LAST_NAMES))]
+            dob = date(1995, 1, 1) + timedelta(days=int(rng.integers(3650)))
+            batch.append((student_id, f"{first} {last}", FACULTIES[i % len(FACULTIES)], dob.isoformat(),
+                          f"{first.lower()}.{last.lower()}{i}@example.edu", '', None))
+        add_students_batch(batch)
+    progress(f"Added {students} students")
+
+    days = days or max(1, math.ceil(rows / (students * ATTENDANCE_RATE)))
+    first_day = date.today() - timedelta(days=days - 1)
+    day_names = np.array([(first_day + timedelta(days=d)).isoformat() for d in range(days)], dtype=object)
+    time_names = np.array([f"{s // 3600:02d}:{s // 60 % 60:02d}:{s % 60:02d}"
+                           for s in range(DAY_START_SECONDS, DAY_START_SECONDS + DAY_SECONDS)], dtype=object)
+    id_names = np.array(ids, dtype=object)
+    # Rows are spread evenly over the days in date order, and nobody is marked twice on a day
+    # as long as a day has no more rows than there are students
+    day_offsets = rng.integers(0, students, days)
+    step = _stride(students)
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    if DB_TYPE == 'sqlite':
+        cursor.execute("PRAGMA synchronous = OFF")
+    started = time.perf_counter()
+    for start in range(0, rows, SEED_BATCH):
+        index = np.arange(start, min(rows, start + SEED_BATCH))
+        day = index * days // rows
+        first_of_day = (day * rows + days - 1) // days
+        position = index - first_of_day
+        student = (day_offsets[day] + position * step) % students
+        seconds = rng.integers(0, DAY_SECONDS, len(index))
+        batch = list(zip(id_names[student].tolist(), day_names[day].tolist(), time_names[seconds].tolist()))
+        if DB_TYPE in ['mysql', 'postgresql']:
+            cursor.executemany("INSERT INTO attendance (student_id, date, time) VALUES (%s, %s, %s)", batch)
+        else:  # sqlite
+            cursor.executemany("INSERT INTO attendance (student_id, date, time) VALUES (?, ?, ?)", batch)
+        conn.commit()
+        done = start + len(index)
+        if done % (SEED_BATCH * 20) == 0 or done == rows:
+            progress(f"  {done}/{rows} attendance rows ({done / (time.perf_counter() - started):.0f} rows/s)")
+    conn.close()
+    progress(f"Added {rows} attendance rows over {days} days")
+    # Rows were inserted directly, so bring the daily rollup up to date
+    rebuild_attendance_rollup(since=first_day.isoformat())
+    progress("Rebuilt the daily attendance rollup")
+
+
+def seeded_database(db_dir, label, rows, students):
+    """Path of the SQLite database for one size, seeding it in a child process on first use."""
+    os.makedirs(db_dir, exist_ok=True)
+    path = os.path.join(db_dir, f"attendance_{label}.db")
+    if not os.path.exists(path):
+        print(f"Seeding {path} ...")
+        try:
+            subprocess.run([sys.executable, os.path.abspath(__file__), 'seed', '--rows', str(rows),
+                            '--students', str(students)], env=dict(os.environ, DB_FILE=path), check=True)
+        except (subprocess.CalledProcessError, KeyboardInterrupt):
+            # Leave no half-seeded database behind to be mistaken for a complete one
+            if os.path.exists(path):
+                os.remove(path)
+            raise
+    return path
+
+
+def sample_student(db_file=None):
+    """ID of a student with recent attendance, for the student pages."""
+    if db_file:
+        import sqlite3
+        conn = sqlite3.connect(db_file)
+    else:
+        from database_sql import get_db_connection
+        conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT student_id FROM attendance ORDER BY id DESC LIMIT 1")
+    row = cursor.fetchone()
+    if row is None:
+        cursor.execute("SELECT id FROM students LIMIT 1")
+        row = cursor.fetchone()
+    conn.close()
+    return list(row)[0] if row else None
+
+
+# --- Server --- #
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(db_file, threads):
+    """Start run_production.py on a free local port; returns (process, port, log file)."""
+    port = _free_port()
+    env = dict(os.environ, APP_HOST='127.0.0.1', APP_PORT=str(port), APP_THREADS=str(threads))
+    if db_file:
+        env['DB_FILE'] = db_file
+    log = tempfile.TemporaryFile()
+    process = subprocess.Popen([sys.executable, os.path.join(SCRIPT_DIR, 'run_production.py')],
+                               env=env, stdout=log, stderr=subprocess.STDOUT, cwd=SCRIPT_DIR)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            log.seek(0)
+            raise SystemExit(f"Server exited during startup:\n{log.read().decode(errors='replace')}")
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return process, port, log
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise SystemExit("Server did not start listening within 60 seconds")
+
+
+def stop_server(process, log):
+    process.terminate()
+    try:
+        process.wait(10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+    log.close()
+
+
+def rss_bytes(pid):
+    """Resident memory of a process, or None where it cannot be read."""
+    try:
+        import psutil
+        return psutil.Process(pid).memory_info().rss
+    except ImportError:
+        pass
+    except Exception:
+        return None
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class MemorySampler(threading.Thread):
+    """Polls a process's RSS in the background and keeps the peak."""
+
+    def __init__(self, pid, interval=0.05):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.peak = rss_bytes(pid) if pid else None
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while self.pid and not self._stop_event.wait(self.interval):
+            rss = rss_bytes(self.pid)
+            if rss is not None:
+                self.peak = max(self.peak or 0, rss)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        return self.peak
+
+
+# --- Client --- #
+class Client:
+    """One keep-alive connection with its own cookie jar, i.e. one browser."""
+
+    def __init__(self, host, port, timeout=120):
+        self.host, self.port, self.timeout = host, port, timeout
+        self.conn = http.client.HTTPConnection(host, port, timeout=timeout)
+        self.cookies = {}
+
+    def request(self, method, path, form=None):
+        headers = {}
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f"{name}={value}" for name, value in self.cookies.items())
+        body = None
+        if form is not None:
+            body = urlencode(form)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        for attempt in (1, 2):
+            try:
+                self.conn.request(method, path, body=body, headers=headers)
+                response = self.conn.getresponse()
+                data = response.read()
+                break
+            except (http.client.HTTPException, OSError):
+                # The server closed the keep-alive connection; reconnect once
+                self.conn.close()
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+                if attempt == 2:
+                    raise
+        for header in response.headers.get_all('Set-Cookie') or []:
+            name, _, value = header.split(';', 1)[0].partition('=')
+            self.cookies[name.strip()] = value
+        return response.status, response.headers, data
+
+    def _captcha_login(self, path, form):
+        status, _, page = self.request('GET', path)
+        captcha = re.search(rb'>\s*(\d{5})\s*<', page)
+        if status != 200 or not captcha:
+            raise RuntimeError(f"Could not read the CAPTCHA from {path}")
+        status, headers, _ = self.request('POST', path, dict(form, captcha=captcha.group(1).decode()))
+        if status != 302 or 'login' in headers.get('Location', ''):
+            raise RuntimeError(f"Login at {path} failed (HTTP {status})")
+
+    def login(self, roles, admin_id, admin_password, student_id):
+        if 'user' in roles:
+            self._captcha_login('/login', {'username': 'admin', 'password': 'admin'})
+        if 'admin' in roles:
+            self._captcha_login('/admin/login', {'username': admin_id, 'password': admin_password})
+        if 'student' in roles:
+            status, headers, _ = self.request('POST', '/student/login', {'student_id': student_id})
+            if status != 302 or 'login' in headers.get('Location', ''):
+                raise RuntimeError(f"Student login as {student_id} failed")
+
+    def close(self):
+        self.conn.close()
+
+
+def latency_summary(samples):
+    values = np.asarray(samples) * 1000.0
+    if not len(values):
+        return {'count': 0}
+    summary = {'count': int(len(values)), 'mean': float(values.mean()), 'max': float(values.max())}
+    for p in PERCENTILES:
+        summary[f"p{p}"] = float(np.percentile(values, p))
+    return summary
+
+
+def drive_route(clients, path, duration, max_requests, warmup, pid):
+    """Hit one route from every client at once for `duration` seconds (or `max_requests` in total)."""
+    for client in clients:
+        for _ in range(warmup):
+            client.request('GET', path)
+    issued = itertools.count()
+    deadline = time.perf_counter() + duration
+    results = [[] for _ in clients]
+
+    def worker(client, out):
+        while time.perf_counter() < deadline and (max_requests is None or next(issued) < max_requests):
+            start = time.perf_counter()
+            try:
+                status, _, data = client.request('GET', path)
+            except (http.client.HTTPException, OSError):
+                status, data = None, b''
+            out.append((time.perf_counter() - start, status, len(data)))
+
+    rss_before = rss_bytes(pid) if pid else None
+    sampler = MemorySampler(pid)
+    sampler.start()
+    threads = [threading.Thread(target=worker, args=(client, out)) for client, out in zip(clients, results)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+    peak = sampler.stop()
+
+    samples = [sample for out in results for sample in out]
+    ok = [sample for sample in samples if sample[1] == 200]
+    return {
+        'requests': len(samples),
+        'errors': len(samples) - len(ok),
+        'seconds': wall,
+        'throughput': len(ok) / wall if wall else 0.0,
+        'latency_ms': latency_summary([sample[0] for sample in ok]),
+        'mean_response_bytes': float(np.mean([sample[2] for sample in ok])) if ok else 0.0,
+        'memory': {'rss_before': rss_before, 'rss_peak': peak, 'rss_after': rss_bytes(pid) if pid else None},
+    }
+
+
+def run_routes(host, port, routes, args, student_id, pid=None):
+    roles = {role for _, role in routes}
+    clients = [Client(host, port) for _ in range(args.concurrency)]
+    try:
+        for client in clients:
+            client.login(roles, args.admin_id, args.admin_password, student_id)
+        report = {}
+        for path, _ in routes:
+            report[path] = drive_route(clients, path, args.duration, args.requests, args.warmup, pid)
+            _print_route(path, report[path])
+        return report
+    finally:
+        for client in clients:
+            client.close()
+
+
+def _print_route(path, r):
+    lat = r['latency_ms']
+    rss = r['memory']['rss_peak']
+    print(f"  {path:<22} {r['requests']:>7} req {r['throughput']:>8.1f}/s  "
+          + (f"p50 {lat['p50']:>8.1f}  p95 {lat['p95']:>8.1f}  p99 {lat['p99']:>8.1f} ms" if lat['count'] else "no successful requests")
+          + (f"  {r['errors']} errors" if r['errors'] else "")
+          + (f"  peak RSS {rss / 2**20:.0f}MB" if rss else ""))
+
+
+def _environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=SCRIPT_DIR, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'db_type': os.environ.get('DB_TYPE', 'sqlite'),
+        'git_commit': commit,
+    }
+
+
+def run(args):
+    selected = [route for route in ROUTES if not args.routes or route[0] in args.routes]
+    report = {
+        'format': 1,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'environment': _environment(),
+        'config': {'concurrency': args.concurrency, 'duration': args.duration, 'requests': args.requests,
+                   'server_threads': args.threads, 'routes': [path for path, _ in selected]},
+        'runs': [],
+    }
+    if args.url:
+        target = urlsplit(args.url)
+        print(f"{args.url}:")
+        routes = run_routes(target.hostname, target.port or 80, selected, args, args.student_id or sample_student())
+        report['runs'].append({'label': args.url, 'routes': routes})
+        return report
+
+    sqlite = os.environ.get('DB_TYPE', 'sqlite') == 'sqlite'
+    sizes = _sizes(args.rows) if sqlite else [('configured', None)]
+    for label, rows in sizes:
+        db_file = seeded_database(args.db_dir, label, rows, args.students) if sqlite else None
+        process, port, log = start_server(db_file, args.threads)
+        try:
+            print(f"{label} attendance rows (server pid {process.pid}, {args.concurrency} clients):")
+            routes = run_routes('127.0.0.1', port, selected, args, args.student_id or sample_student(db_file),
+                                pid=process.pid)
+        finally:
+            stop_server(process, log)
+        report['runs'].append({'label': label, 'rows': rows, 'database': db_file, 'routes': routes})
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed attendance databases and load-test the web routes.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    seed_parser = commands.add_parser('seed', help="Fill the configured database (DB_FILE for SQLite)")
+    seed_parser.add_argument('--rows', type=parse_count, required=True, help="Attendance rows, e.g. 10k, 1M, 10M")
+    seed_parser.add_argument('--students', type=int, default=5000)
+    seed_parser.add_argument('--days', type=int, help="Days of history (default: enough for ~80%% daily attendance)")
+    seed_parser.add_argument('--append', action='store_true', help="Seed even if attendance rows already exist")
+    seed_parser.add_argument('--seed', type=int, default=0)
+
+    run_parser = commands.add_parser('run', help="Start the server on each seeded size and load-test it")
+    run_parser.add_argument('--rows', default='10k,1M', help="Comma-separated SQLite sizes (default 10k,1M)")
+    run_parser.add_argument('--students', type=int, default=5000, help="Students in newly seeded databases")
+    run_parser.add_argument('--db-dir', default=DEFAULT_DB_DIR, help="Where seeded SQLite databases are kept")
+    run_parser.add_argument('--url', help="Test an already running server instead of starting one")
+    run_parser.add_argument('--routes', nargs='+', help="Only these paths")
+    run_parser.add_argument('--concurrency', type=int, default=8, help="Concurrent logged-in clients")
+    run_parser.add_argument('--duration', type=float, default=15.0, help="Seconds per route")
+    run_parser.add_argument('--requests', type=int, help="Stop a route after this many requests")
+    run_parser.add_argument('--warmup', type=int, default=1, help="Untimed requests per client before each route")
+    run_parser.add_argument('--threads', type=int, default=int(os.environ.get('APP_THREADS', 8)),
+                            help="Waitress threads (APP_THREADS)")
+    run_parser.add_argument('--student-id', help="Student to log in as (default: the most recently marked)")
+    run_parser.add_argument('--admin-id', default='admin1')
+    run_parser.add_argument('--admin-password', default='admin1')
+    run_parser.add_argument('--json', help="Write the report to this JSON file")
+    args = parser.parse_args()
+
+    if args.command == 'seed':
+        seed(args.rows, args.students, args.days, args.append, args.seed)
+        return
+
+    report = run(args)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,23 @@
+import argparse
 import tkinter as tk
 
+import sampling_profiler
+
 # Import the UI module (database import is handled within the module)
 try:
-    from student_attendance_ui import FancyApp
+    from student_attendance_ui import FancyApp, create_tables
 except ImportError as e:
     print(f"Error importing required modules: {e}")
     print("Please make sure all dependencies are installed.")
     exit(1)
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Face attendance desktop application.")
+    sampling_profiler.add_arguments(parser)
+    sampling_profiler.start_from_args(parser.parse_args())
+
+    # The schema is brought up to date here rather than when the database module is imported
+    create_tables()
     root = tk.Tk()
     app = FancyApp(root)
     root.mainloop()
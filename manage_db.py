@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Maintenance commands for the configured attendance database.
+
+Usage:
+    python manage_db.py migrate                          # create any missing tables and indexes
+    python manage_db.py rebuild-rollup                   # regenerate the daily rollup from the attendance log
+    python manage_db.py rebuild-rollup --since 2024-09-01
+"""
+
+import argparse
+import time
+
+
+def migrate(args):
+    from database_sql import DB_TYPE, create_tables
+
+    start = time.perf_counter()
+    create_tables()
+    print(f"Schema of the {DB_TYPE} database is up to date ({time.perf_counter() - start:.1f}s)")
+
+
+def rebuild_rollup(args):
+    from database_sql import rebuild_attendance_rollup
+
+    start = time.perf_counter()
+    count = rebuild_attendance_rollup(since=args.since)
+    scope = f"from {args.since}" if args.since else "for all dates"
+    print(f"Rebuilt the daily attendance rollup {scope}: {count} student-days in {time.perf_counter() - start:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Attendance database maintenance.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    schema = commands.add_parser('migrate', help="Create missing tables and indexes (safe to run repeatedly)")
+    schema.set_defaults(handler=migrate)
+
+    rollup = commands.add_parser('rebuild-rollup', help="Regenerate attendance_daily from the attendance log")
+    rollup.add_argument('--since', metavar='YYYY-MM-DD', help="Only rebuild dates from this day on")
+    rollup.set_defaults(handler=rebuild_rollup)
+
+    args = parser.parse_args()
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,390 @@
+"""
+Low-overhead timing for web requests, database calls and recognition stages.
+
+Counters and histograms live in one in-process registry and are exported in
+the Prometheus text format (`/metrics` in the web app, or `serve()` for the
+command-line recognizer). Database functions decorated with `@timed` report
+the time spent inside the driver (execute and fetch) separately from the
+Python around it, which is mostly row conversion, and the number of rows
+fetched. Each web request is split the same way into database, conversion,
+template rendering and other time.
+
+Calls and requests slower than SLOW_QUERY_MS / SLOW_REQUEST_MS are logged as
+one JSON object per line on the 'attendance.slow' logger. SQL parameters are
+never logged.
+"""
+
+import functools
+import json
+import logging
+import os
+import threading
+import time
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SLOW_QUERY_SECONDS = float(os.environ.get('SLOW_QUERY_MS', 250)) / 1000
+SLOW_REQUEST_SECONDS = float(os.environ.get('SLOW_REQUEST_MS', 1000)) / 1000
+# Longest SQL text kept for the slow log
+STATEMENT_LOG_CHARS = 300
+REQUEST_PHASES = ('db', 'convert', 'render', 'other')
+
+slow_log = logging.getLogger('attendance.slow')
+_local = threading.local()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    """A monotonically increasing value per label combination."""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(labels[name] for name in self.labels), 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labels, key)} {value}"
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count per label combination."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # key -> [per-bucket counts..., +Inf count, sum]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            entry[index] += 1
+            entry[-1] += value
+
+    def count(self, **labels):
+        entry = self._values.get(tuple(labels[name] for name in self.labels))
+        return sum(entry[:-1]) if entry else 0
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(entry)) for key, entry in self._values.items()]
+        for key, entry in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), entry[:-1]):
+                cumulative += count
+                le = f'le="{bound}"'
+                yield f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labels, key)} {entry[-1]}"
+            yield f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def counter(self, name, documentation, labels=()):
+        metric = Counter(name, documentation, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, documentation, labels, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        for collect in self.collectors:
+            lines.extend(collect())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.counter('http_requests_total', "HTTP requests handled.", ('route', 'method', 'status'))
+HTTP_DURATION = REGISTRY.histogram('http_request_duration_seconds', "Time to handle an HTTP request.", ('route', 'method'))
+HTTP_PHASE = REGISTRY.histogram('http_request_phase_seconds',
+                                "Request time spent in database calls, row conversion, template rendering and the rest.",
+                                ('route', 'phase'))
+DB_QUERY = REGISTRY.histogram('db_query_seconds', "Time spent in the database driver (execute and fetch).", ('function',))
+DB_CONVERT = REGISTRY.histogram('db_convert_seconds', "Time spent in Python around the driver, mostly row conversion.",
+                                ('function',))
+DB_ROWS = REGISTRY.counter('db_rows_fetched_total', "Rows fetched from the database.", ('function',))
+DB_SLOW = REGISTRY.counter('db_slow_calls_total', "Database calls slower than SLOW_QUERY_MS.", ('function',))
+RESPONSE_CACHE = REGISTRY.counter('response_cache_requests_total',
+                                  "Requests for cached pages, by whether the response cache had them (hit) or not (miss).",
+                                  ('route', 'result'))
+RECOGNITION_STAGE = REGISTRY.histogram('recognition_stage_seconds', "Time per frame spent in each recognition stage.",
+                                       ('stage',))
+
+
+def _process_metrics():
+    yield "# HELP process_cpu_seconds_total User and system CPU time of this process."
+    yield "# TYPE process_cpu_seconds_total counter"
+    yield f"process_cpu_seconds_total {time.process_time()}"
+    try:
+        with open('/proc/self/statm') as f:
+            rss = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return
+    yield "# HELP process_resident_memory_bytes Resident memory of this process."
+    yield "# TYPE process_resident_memory_bytes gauge"
+    yield f"process_resident_memory_bytes {rss}"
+
+
+REGISTRY.collectors.append(_process_metrics)
+
+
+def render():
+    return REGISTRY.render()
+
+
+# --- Database calls --- #
+def _calls():
+    calls = getattr(_local, 'calls', None)
+    if calls is None:
+        calls = _local.calls = []
+    return calls
+
+
+class _TimedCursor:
+    """Adds the time spent in execute/fetch calls to the innermost @timed call of this thread."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def _record(self, seconds, rows=0, statement=None):
+        calls = getattr(_local, 'calls', None)
+        if calls:
+            frame = calls[-1]
+            frame['query'] += seconds
+            frame['rows'] += rows
+            if statement is not None:
+                frame['statement'] = statement
+        else:
+            phases = getattr(_local, 'request', None)
+            if phases is not None:
+                phases['db'] += seconds
+
+    def execute(self, statement, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self._cursor.execute(statement, *args, **kwargs)
+        finally:
+            self._record(time.perf_counter() - start, statement=statement)
+
+    def executemany(self, statement, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self._cursor.executemany(statement, *args, **kwargs)
+        finally:
+            self._record(time.perf_counter() - start, statement=statement)
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = self._cursor.fetchone()
+        self._record(time.perf_counter() - start, rows=row is not None)
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        start = time.perf_counter()
+        rows = self._cursor.fetchmany(*args, **kwargs)
+        self._record(time.perf_counter() - start, rows=len(rows))
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = self._cursor.fetchall()
+        self._record(time.perf_counter() - start, rows=len(rows))
+        return rows
+
+
+class _TimedConnection:
+    """Connection wrapper whose cursors are timed."""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._conn.__exit__(*exc)
+
+    def cursor(self, *args, **kwargs):
+        return _TimedCursor(self._conn.cursor(*args, **kwargs))
+
+
+def instrument_connection(conn):
+    return _TimedConnection(conn)
+
+
+def timed(func):
+    """Record driver time, conversion time and rows fetched for a database function."""
+    name = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        calls = _calls()
+        frame = {'query': 0.0, 'children': 0.0, 'rows': 0, 'statement': None}
+        calls.append(frame)
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            total = time.perf_counter() - start
+            calls.pop()
+            # Nested @timed calls report their own time; only count ours here
+            convert = max(0.0, total - frame['query'] - frame['children'])
+            if calls:
+                calls[-1]['children'] += total
+            phases = getattr(_local, 'request', None)
+            if phases is not None:
+                phases['db'] += frame['query']
+                phases['convert'] += convert
+            DB_QUERY.observe(frame['query'], function=name)
+            DB_CONVERT.observe(convert, function=name)
+            if frame['rows']:
+                DB_ROWS.inc(frame['rows'], function=name)
+            if total >= SLOW_QUERY_SECONDS:
+                DB_SLOW.inc(function=name)
+                statement = ' '.join((frame['statement'] or '').split())[:STATEMENT_LOG_CHARS]
+                slow_log.warning(json.dumps({
+                    'event': 'slow_query', 'function': name, 'total_ms': round(total * 1000, 1),
+                    'query_ms': round(frame['query'] * 1000, 1), 'convert_ms': round(convert * 1000, 1),
+                    'rows': frame['rows'], 'statement': statement,
+                }))
+    return wrapper
+
+
+# --- Flask --- #
+def init_app(app):
+    """Time every request of a Flask app, split into database, conversion, rendering and other time."""
+    from flask import before_render_template, request, template_rendered
+
+    @app.before_request
+    def start_request_timer():
+        _local.request = dict.fromkeys(('db', 'convert', 'render'), 0.0)
+        _local.request_start = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        phases = getattr(_local, 'request', None)
+        if phases is None:
+            return response
+        total = time.perf_counter() - _local.request_start
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        HTTP_REQUESTS.inc(route=route, method=request.method, status=response.status_code)
+        HTTP_DURATION.observe(total, route=route, method=request.method)
+        phases['other'] = max(0.0, total - phases['db'] - phases['convert'] - phases['render'])
+        for phase in REQUEST_PHASES:
+            HTTP_PHASE.observe(phases[phase], route=route, phase=phase)
+        if total >= SLOW_REQUEST_SECONDS:
+            slow_log.warning(json.dumps({
+                'event': 'slow_request', 'route': route, 'method': request.method,
+                'status': response.status_code, 'total_ms': round(total * 1000, 1),
+                **{f"{phase}_ms": round(phases[phase] * 1000, 1) for phase in REQUEST_PHASES},
+            }))
+        return response
+
+    @app.teardown_request
+    def clear_request_timer(exc):
+        _local.request = None
+
+    def template_started(sender, template, context, **extra):
+        _local.render_start = time.perf_counter()
+
+    def template_finished(sender, template, context, **extra):
+        phases = getattr(_local, 'request', None)
+        if phases is not None and getattr(_local, 'render_start', None) is not None:
+            phases['render'] += time.perf_counter() - _local.render_start
+            _local.render_start = None
+
+    before_render_template.connect(template_started, app, weak=False)
+    template_rendered.connect(template_finished, app, weak=False)
+
+
+# --- Standalone exporter --- #
+def serve(port, host='0.0.0.0'):
+    """Expose /metrics on its own port from a background thread (for processes without Flask, or one per worker).
+
+    Like the web app's /metrics, it requires `Authorization: Bearer $METRICS_TOKEN` if that is set.
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            token = os.environ.get('METRICS_TOKEN')
+            if token and self.headers.get('Authorization') != f"Bearer {token}":
+                self.send_error(401)
+                return
+            body = render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True, name='metrics-exporter').start()
+    return server
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Headless face recognition pipeline: detect -> quality gate -> encode -> match -> attendance.
+
+The desktop camera, the command-line recognizer below and
+recognition_benchmark.py all run frames through RecognitionPipeline, which
+returns what it found in each frame together with the time spent in every
+stage.
+
+Usage (recognize from a webcam or video file without the desktop UI):
+    python recognition.py --camera 0
+    python recognition.py --video lecture.mp4 --shared
+"""
+
+import argparse
+import time
+from datetime import date
+
+import metrics
+import sampling_profiler
+from database_sql import create_tables, get_all_students, mark_attendance_db
+
+STAGES = ('detect', 'quality', 'encode', 'match', 'attendance')
+# Seconds between checks for gallery changes in the command-line recognizer
+GALLERY_POLL_SECONDS = 2.0
+# A student the database turned away under the 12-hour rule is asked about again after this long,
+# not on every frame, so they can still be marked once their last mark is old enough
+DUPLICATE_RECHECK_SECONDS = 300
+
+
+class RecognitionPipeline:
+    """Runs frames through detection, the quality gate, encoding, matching and attendance marking."""
+
+    def __init__(self, gallery, gate=None, auto_enrich=False, mark_attendance=mark_attendance_db,
+                 face_recognition=None):
+        if face_recognition is None:
+            import face_recognition
+        self.face_recognition = face_recognition
+        self.gallery = gallery
+        self.gate = gate
+        self.auto_enrich = auto_enrich
+        self.mark_attendance = mark_attendance
+        # Students marked by this pipeline today, so the database is not asked again until tomorrow,
+        # and when the database last reported each of today's duplicates
+        self.seen_date = None
+        self.seen = set()
+        self.duplicates = {}
+
+    def process(self, rgb):
+        """Recognize the faces in one RGB frame.
+
+        Returns a dict with 'faces' (location, student_id, name, distance and
+        status: 'unknown', 'marked', 'duplicate' or 'seen' - already marked or
+        turned away today, without asking the database again), 'skipped'
+        ((location, reason) pairs rejected by the quality gate) and 'timings'
+        (seconds per stage).
+        """
+        fr = self.face_recognition
+        timings = dict.fromkeys(STAGES, 0.0)
+
+        start = time.perf_counter()
+        locations = fr.face_locations(rgb)
+        timings['detect'] = time.perf_counter() - start
+
+        skipped = []
+        if self.gate is not None:
+            start = time.perf_counter()
+            locations, skipped = self.gate.filter(rgb, locations, fr)
+            timings['quality'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        encodings = fr.face_encodings(rgb, locations) if locations else []
+        timings['encode'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        matches = self.gallery.match(encodings)
+        if self.auto_enrich:
+            for encoding, (student_id, distance) in zip(encodings, matches):
+                if student_id is not None:
+                    self.gallery.enrich(student_id, encoding, distance)
+        timings['match'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        if self.seen_date != date.today():
+            self.seen_date = date.today()
+            self.seen.clear()
+            self.duplicates.clear()
+        faces = []
+        for location, (student_id, distance) in zip(locations, matches):
+            if student_id is None:
+                status, name = 'unknown', None
+            else:
+                name = self.gallery.name(student_id)
+                if student_id in self.seen or (student_id in self.duplicates and
+                                               time.monotonic() - self.duplicates[student_id] < DUPLICATE_RECHECK_SECONDS):
+                    status = 'seen'
+                elif self.mark_attendance(student_id):
+                    self.seen.add(student_id)
+                    self.duplicates.pop(student_id, None)
+                    status = 'marked'
+                else:
+                    self.duplicates[student_id] = time.monotonic()
+                    status = 'duplicate'
+            faces.append({'location': location, 'student_id': student_id, 'name': name,
+                          'distance': distance, 'status': status})
+        timings['attendance'] = time.perf_counter() - start
+
+        for stage, seconds in timings.items():
+            metrics.RECOGNITION_STAGE.observe(seconds, stage=stage)
+        return {'faces': faces, 'skipped': skipped, 'timings': timings}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run face recognition attendance without the desktop UI.")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--camera', type=int, default=0, help="Camera index (default 0)")
+    source.add_argument('--video', help="Video file to read instead of a camera")
+    parser.add_argument('--mode', choices=('min', 'centroid'), default='min')
+    parser.add_argument('--shared', action='store_true',
+                        help="Attach to the gallery published by 'face_gallery.py --publish' instead of loading it")
+    parser.add_argument('--no-quality-gate', action='store_true')
+    parser.add_argument('--liveness', action='store_true', help="Require a blink before recognizing a face")
+    parser.add_argument('--metrics-port', type=int, help="Serve Prometheus metrics on this port")
+    sampling_profiler.add_arguments(parser)
+    args = parser.parse_args()
+
+    sampling_profiler.start_from_args(args)
+    create_tables()
+
+    if args.metrics_port:
+        metrics.serve(args.metrics_port)
+
+    import cv2
+    from face_gallery import SharedGallery, apply_gallery_changes, load_gallery
+    from face_quality import QualityGate
+
+    if args.shared:
+        gallery = SharedGallery(mode=args.mode)
+    else:
+        gallery, errors = load_gallery(get_all_students(), mode=args.mode)
+        for error in errors:
+            print(error)
+    print(f"Gallery ready: {len(gallery)} templates")
+    gate = None if args.no_quality_gate else QualityGate(liveness=args.liveness)
+    pipeline = RecognitionPipeline(gallery, gate=gate)
+
+    cap = cv2.VideoCapture(args.video if args.video else args.camera)
+    if not cap.isOpened():
+        raise SystemExit(f"Cannot open {args.video or f'camera {args.camera}'}")
+    last_poll = time.monotonic()
+    try:
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            result = pipeline.process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+            for face in result['faces']:
+                if face['status'] in ('marked', 'duplicate'):
+                    print(f"{time.strftime('%H:%M:%S')} {face['status']}: {face['name']} ({face['student_id']})")
+            if not args.shared and time.monotonic() - last_poll >= GALLERY_POLL_SECONDS:
+                last_poll = time.monotonic()
+                apply_gallery_changes(gallery)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        cap.release()
+        if gate is not None:
+            print(gate.summary())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+"""
+Benchmark the recognition pipeline on recorded frames.
+
+Frames from a video file or a directory of images are replayed through
+RecognitionPipeline (detect -> quality gate -> encode -> match ->
+attendance) against a gallery made of the enrolled students, photos from a
+directory, and/or synthetic distractor identities. The report covers
+per-stage latency percentiles, end-to-end frames per second, CPU and memory
+use, quality-gate skips and, given ground truth, identification accuracy.
+It is written as JSON so runs can be compared between releases.
+
+Ground truth is a CSV with `frame` (file name or frame index) and
+`student_id` columns, where an empty ID or `unknown` means nobody enrolled
+is in the frame, or `--expect` for a recording of a single person.
+
+Attendance is not written to the database unless --mark-attendance is given.
+
+Usage:
+    python recognition_benchmark.py --video lecture.mp4 --synthetic 10000 --json run.json
+    python recognition_benchmark.py --frames frames/ --labels labels.csv --no-db --enroll-dir faces/
+    python recognition_benchmark.py --video clip.mp4 --expect 81710000 --compare baseline.json
+"""
+
+import argparse
+import csv
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from embedding_benchmark import synthetic_population
+from face_gallery import STORAGE_DTYPES, FaceGallery, encode_photo, load_gallery
+from recognition import STAGES, RecognitionPipeline
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+PERCENTILES = (50, 90, 95, 99)
+UNKNOWN_LABELS = ('', 'unknown', 'none')
+
+
+def iter_frames(video=None, frames_dir=None, max_frames=None, stride=1, scale=1.0):
+    """Yield (index, name, rgb_frame) from a video file or an image directory."""
+    def resized(rgb):
+        if scale == 1.0:
+            return rgb
+        import cv2
+        return cv2.resize(rgb, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+    count = 0
+    if video:
+        import cv2
+        cap = cv2.VideoCapture(video)
+        if not cap.isOpened():
+            raise SystemExit(f"Cannot open video {video}")
+        index = 0
+        try:
+            while max_frames is None or count < max_frames:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                if index % stride == 0:
+                    yield index, str(index), resized(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+                    count += 1
+                index += 1
+        finally:
+            cap.release()
+    else:
+        from PIL import Image
+        names = sorted(n for n in os.listdir(frames_dir) if n.lower().endswith(IMAGE_EXTENSIONS))
+        for index, name in enumerate(names[::stride][:max_frames]):
+            with Image.open(os.path.join(frames_dir, name)) as img:
+                yield index * stride, name, resized(np.asarray(img.convert('RGB')))
+
+
+def load_labels(path):
+    """Map frame name or index (as a string) to the expected student ID, or None for nobody enrolled."""
+    labels = {}
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        for row in csv.DictReader(f):
+            student_id = (row.get('student_id') or '').strip()
+            labels[row['frame'].strip()] = None if student_id.lower() in UNKNOWN_LABELS else student_id
+    return labels
+
+
+def enroll_directory(gallery, path):
+    """Add `<student_id>.jpg` or `<student_id>/*.jpg` photos to an in-memory gallery."""
+    added = 0
+    for entry in sorted(os.listdir(path)):
+        full = os.path.join(path, entry)
+        if os.path.isdir(full):
+            student_id = entry
+            photos = [os.path.join(full, n) for n in sorted(os.listdir(full)) if n.lower().endswith(IMAGE_EXTENSIONS)]
+        elif entry.lower().endswith(IMAGE_EXTENSIONS):
+            student_id, photos = os.path.splitext(entry)[0], [full]
+        else:
+            continue
+        for photo in photos:
+            try:
+                with open(photo, 'rb') as f:
+                    gallery.add(student_id, encode_photo(f.read()))
+                added += 1
+            except ValueError as e:
+                print(f"{photo}: skipped - {e}")
+        gallery.names.setdefault(student_id, student_id)
+    return added
+
+
+def build_gallery(args):
+    if args.no_db:
+        gallery = FaceGallery(mode=args.mode, dtype=args.dtype)
+    else:
+        from database_sql import create_tables, get_all_students
+        create_tables()
+        gallery, errors = load_gallery(get_all_students(), mode=args.mode, dtype=args.dtype)
+        for error in errors:
+            print(error)
+    real_identities = len(gallery.names)
+    if args.enroll_dir:
+        enroll_directory(gallery, args.enroll_dir)
+        real_identities = len(gallery.names)
+    if args.synthetic:
+        rng = np.random.default_rng(args.seed)
+        _, vectors, owners = synthetic_population(args.synthetic, args.templates, rng)
+        for vector, owner in zip(vectors, owners):
+            gallery.add(f"synthetic-{owner}", vector)
+    return gallery, real_identities
+
+
+def latency_summary(samples):
+    values = np.asarray(samples) * 1000.0
+    if not len(values):
+        return {'count': 0}
+    summary = {'count': int(len(values)), 'mean': float(values.mean()), 'max': float(values.max())}
+    for p in PERCENTILES:
+        summary[f"p{p}"] = float(np.percentile(values, p))
+    return summary
+
+
+def _peak_rss_bytes():
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, 'peak_wset', None) or info.rss
+    except ImportError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'git_commit': commit,
+    }
+
+
+def run(args):
+    from face_quality import QualityGate
+
+    gallery, real_identities = build_gallery(args)
+    gate = None if args.no_quality_gate else QualityGate(liveness=args.liveness)
+    if args.mark_attendance:
+        from database_sql import mark_attendance_db as mark_attendance
+    else:
+        # Dry run: the first sighting of a student counts as a new mark
+        mark_attendance = lambda student_id: True
+    pipeline = RecognitionPipeline(gallery, gate=gate, mark_attendance=mark_attendance)
+    labels = load_labels(args.labels) if args.labels else {}
+
+    latencies = {stage: [] for stage in ('read',) + STAGES + ('total',)}
+    faces = {'detected': 0, 'encoded': 0, 'recognized': 0, 'unknown': 0}
+    accuracy = {'labelled_frames': 0, 'correct': 0, 'missed': 0, 'false_accepts': 0,
+                'true_rejects': 0, 'enrolled_frames': 0, 'stranger_frames': 0}
+    frames = 0
+
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    read_start = time.perf_counter()
+    for index, name, rgb in iter_frames(args.video, args.frames, args.max_frames, args.stride, args.scale):
+        latencies['read'].append(time.perf_counter() - read_start)
+        result = pipeline.process(rgb)
+        frames += 1
+        for stage, seconds in result['timings'].items():
+            latencies[stage].append(seconds)
+        latencies['total'].append(sum(result['timings'].values()))
+
+        faces['detected'] += len(result['faces']) + len(result['skipped'])
+        faces['encoded'] += len(result['faces'])
+        recognized = {face['student_id'] for face in result['faces'] if face['student_id'] is not None}
+        faces['recognized'] += sum(1 for face in result['faces'] if face['student_id'] is not None)
+        faces['unknown'] += sum(1 for face in result['faces'] if face['student_id'] is None)
+
+        if args.expect or name in labels or str(index) in labels:
+            expected = args.expect or labels.get(name, labels.get(str(index)))
+            accuracy['labelled_frames'] += 1
+            if expected is None:
+                accuracy['stranger_frames'] += 1
+                if recognized:
+                    accuracy['false_accepts'] += 1
+                else:
+                    accuracy['true_rejects'] += 1
+            else:
+                accuracy['enrolled_frames'] += 1
+                if expected in recognized:
+                    accuracy['correct'] += 1
+                else:
+                    accuracy['missed'] += 1
+                if recognized - {expected}:
+                    accuracy['false_accepts'] += 1
+        read_start = time.perf_counter()
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+
+    if accuracy['labelled_frames']:
+        accuracy['identification_rate'] = (accuracy['correct'] / accuracy['enrolled_frames']
+                                           if accuracy['enrolled_frames'] else None)
+        accuracy['false_accept_rate'] = accuracy['false_accepts'] / accuracy['labelled_frames']
+
+    return {
+        'format': 1,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'environment': _environment(),
+        'config': {
+            'source': args.video or args.frames,
+            'max_frames': args.max_frames,
+            'stride': args.stride,
+            'scale': args.scale,
+            'quality_gate': gate is not None,
+            'liveness': args.liveness,
+        },
+        'gallery': {
+            'mode': args.mode,
+            'dtype': args.dtype,
+            'templates': len(gallery),
+            'real_identities': real_identities,
+            'synthetic_identities': args.synthetic,
+            'memory_bytes': gallery.nbytes,
+        },
+        'frames': frames,
+        'wall_seconds': wall,
+        'fps': frames / wall if wall else 0.0,
+        'latency_ms': {stage: latency_summary(samples) for stage, samples in latencies.items()},
+        'cpu': {'seconds': cpu, 'utilization': cpu / wall if wall else 0.0},
+        'memory': {'peak_rss_bytes': _peak_rss_bytes()},
+        'faces': faces,
+        'quality': gate.stats() if gate is not None else None,
+        'accuracy': accuracy if accuracy['labelled_frames'] else None,
+    }
+
+
+def _compare_rows(report):
+    rows = [('fps', report['fps'], True)]
+    for stage, summary in report['latency_ms'].items():
+        for key in ('p50', 'p95', 'p99'):
+            if key in summary:
+                rows.append((f"{stage} {key} ms", summary[key], False))
+    rows.append(('cpu utilization', report['cpu']['utilization'], False))
+    if report['memory']['peak_rss_bytes']:
+        rows.append(('peak rss MB', report['memory']['peak_rss_bytes'] / 2**20, False))
+    if report.get('accuracy'):
+        for key, higher_is_better in (('identification_rate', True), ('false_accept_rate', False)):
+            if report['accuracy'].get(key) is not None:
+                rows.append((key.replace('_', ' '), report['accuracy'][key], higher_is_better))
+    return rows
+
+
+def print_report(report, baseline=None):
+    print(f"{report['frames']} frames in {report['wall_seconds']:.1f}s = {report['fps']:.2f} fps, "
+          f"CPU {report['cpu']['utilization'] * 100:.0f}%, gallery {report['gallery']['templates']} templates")
+    print(f"{'stage':<12} {'p50':>9} {'p90':>9} {'p95':>9} {'p99':>9} {'max':>9}  (ms)")
+    for stage, s in report['latency_ms'].items():
+        if s['count']:
+            print(f"{stage:<12} {s['p50']:>9.2f} {s['p90']:>9.2f} {s['p95']:>9.2f} {s['p99']:>9.2f} {s['max']:>9.2f}")
+    if report['quality']:
+        print(f"Quality gate: {report['quality']}")
+    if report['accuracy']:
+        a = report['accuracy']
+        print(f"Accuracy: identification {a.get('identification_rate')}, false accepts {a.get('false_accept_rate')} "
+              f"over {a['labelled_frames']} labelled frames")
+
+    if baseline:
+        print(f"\nCompared with {baseline.get('timestamp')} ({baseline['environment'].get('git_commit')}):")
+        previous = {name: value for name, value, _ in _compare_rows(baseline)}
+        for name, value, higher_is_better in _compare_rows(report):
+            if name not in previous or not previous[name]:
+                continue
+            change = (value - previous[name]) / abs(previous[name])
+            better = change > 0 if higher_is_better else change < 0
+            marker = '' if abs(change) < 0.05 else (' better' if better else ' WORSE')
+            print(f"  {name:<28} {previous[name]:>10.3f} -> {value:>10.3f}  {change:+7.1%}{marker}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark recognition on recorded frames.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--video', help="Video file to replay")
+    source.add_argument('--frames', help="Directory of frame images, replayed in name order")
+    parser.add_argument('--max-frames', type=int)
+    parser.add_argument('--stride', type=int, default=1, help="Use every Nth frame")
+    parser.add_argument('--scale', type=float, default=1.0, help="Resize frames by this factor before detection")
+    parser.add_argument('--labels', help="CSV of frame,student_id ground truth")
+    parser.add_argument('--expect', help="Student ID expected in every frame")
+    parser.add_argument('--no-db', action='store_true', help="Do not load enrolled students from the database")
+    parser.add_argument('--enroll-dir', help="Photos named <student_id>.jpg (or <student_id>/*.jpg) to enroll in memory")
+    parser.add_argument('--synthetic', type=int, default=0, help="Synthetic distractor identities to add")
+    parser.add_argument('--templates', type=int, default=3, help="Templates per synthetic identity")
+    parser.add_argument('--mode', choices=('min', 'centroid'), default='min')
+    parser.add_argument('--dtype', choices=STORAGE_DTYPES, default='float32')
+    parser.add_argument('--no-quality-gate', action='store_true')
+    parser.add_argument('--liveness', action='store_true')
+    parser.add_argument('--mark-attendance', action='store_true', help="Write attendance to the configured database")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help="Write the report to this JSON file")
+    parser.add_argument('--compare', help="Previous JSON report to compare against")
+    args = parser.parse_args()
+
+    report = run(args)
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
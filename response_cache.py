@@ -0,0 +1,123 @@
+"""
+Stores for rendered responses, shared by the cached pages of the web app.
+
+Pages are keyed on everything that went into them, including a data
+version that every write to students or attendance bumps, so entries are
+never invalidated explicitly: a write simply makes new keys, and stale
+entries age out.
+
+The store is chosen with the RESPONSE_CACHE environment variable:
+
+- `memory` (default): an LRU dictionary inside this process.
+- `sqlite`: a SQLite file (RESPONSE_CACHE_FILE) that every server process
+  on the host reads and fills, so several Waitress processes render each
+  page version once between them.
+- `off`: no caching.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_KIND = os.environ.get('RESPONSE_CACHE', 'memory').lower()
+CACHE_FILE = os.environ.get('RESPONSE_CACHE_FILE', os.path.join(SCRIPT_DIR, "response_cache.db"))
+MAX_ENTRIES = int(os.environ.get('RESPONSE_CACHE_ENTRIES', 256))
+# The shared store is trimmed back to MAX_ENTRIES after this many writes
+PRUNE_EVERY = 32
+
+
+class MemoryCache:
+    """Least-recently-used responses of this process."""
+
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """(body, content type) stored under `key`, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, body, content_type):
+        with self._lock:
+            self._entries[key] = (body, content_type)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteCache:
+    """Responses in a SQLite file shared by every process that opens it; the oldest are dropped first."""
+
+    def __init__(self, path=CACHE_FILE, max_entries=MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+        conn = sqlite3.connect(self.path, timeout=5)
+        # WAL lets readers in other processes carry on while one of them writes
+        conn.execute("PRAGMA journal_mode=WAL")
+        with conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    body BLOB NOT NULL,
+                    content_type TEXT NOT NULL,
+                    stored REAL NOT NULL
+                )
+            ''')
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_stored ON responses (stored)")
+        conn.close()
+
+    def _connection(self):
+        # sqlite3 connections may not be shared between threads, nor used on both sides of a fork()
+        pid, conn = getattr(self._local, 'conn', (None, None))
+        if pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5)
+            self._local.conn = (os.getpid(), conn)
+        return conn
+
+    def get(self, key):
+        """(body, content type) stored under `key`, or None."""
+        row = self._connection().execute("SELECT body, content_type FROM responses WHERE key = ?", (key,)).fetchone()
+        return (bytes(row[0]), row[1]) if row else None
+
+    def set(self, key, body, content_type):
+        conn = self._connection()
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, body, content_type, stored) VALUES (?, ?, ?, ?)",
+                    (key, body, content_type, time.time())
+                )
+                self._writes += 1
+                if self._writes % PRUNE_EVERY == 0:
+                    conn.execute(
+                        "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY stored DESC LIMIT -1 OFFSET ?)",
+                        (self.max_entries,)
+                    )
+        except sqlite3.OperationalError:
+            # Another process holds the write lock; the page is simply rendered again next time
+            pass
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+
+def from_env():
+    """The store configured by RESPONSE_CACHE, or None when caching is off."""
+    if CACHE_KIND == 'off':
+        return None
+    if CACHE_KIND == 'sqlite':
+        return SQLiteCache()
+    return MemoryCache()
@@ -1,28 +1,265 @@
-from waitress import serve
-from app import app
+from waitress import create_server, serve, wasyncore
+import argparse
 import os
 import logging
+import signal
+import socket
+import sys
+import threading
+import time
+
+import metrics
+import sampling_profiler
 
 # Set up basic logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Seconds a stopping worker gets to finish the requests it is serving (live streams are cut off after this)
+GRACEFUL_SECONDS = float(os.environ.get('APP_GRACEFUL_SECONDS', 30))
+# Handed to the master re-executed by a reload: its listening socket and the workers still running the old code
+LISTEN_FD_ENV = 'APP_LISTEN_FD'
+OLD_WORKERS_ENV = 'APP_OLD_WORKERS'
+# A worker that dies sooner than this after starting is replaced only after the same pause
+RESPAWN_SECONDS = 1.0
+LISTEN_BACKLOG = 1024
+# A worker retries its metrics port this often while the worker it replaces still holds it
+METRICS_BIND_RETRY_SECONDS = 0.5
+
+def load_app(workers):
+    """Bring the schema up to date and import the application.
+
+    With several workers they share one page cache unless RESPONSE_CACHE
+    says otherwise.
+    """
+    if workers > 1:
+        os.environ.setdefault('RESPONSE_CACHE', 'sqlite')
+    # Imported here so the cache choice above is seen when app.py creates its page cache
+    import app
+    # Once per start (and per reload), in the master, rather than on every import of the database module
+    app.create_tables()
+    return app
+
+def listening_socket(host, port):
+    """The socket inherited from the master before a reload, or a new one bound to host:port."""
+    fd = os.environ.pop(LISTEN_FD_ENV, None)
+    if fd is not None:
+        return socket.socket(fileno=int(fd))
+    return socket.create_server((host, port), backlog=LISTEN_BACKLOG)
+
+def serve_worker_metrics(host, port, exporters):
+    """Export this worker's metrics on `port` once it is free (during a reload, the old worker in this slot holds it)."""
+    while True:
+        try:
+            exporters.append(metrics.serve(port, host=host))
+            return
+        except OSError:
+            time.sleep(METRICS_BIND_RETRY_SECONDS)
+
+def run_worker(application, sock, threads, args, slot):
+    """Serve requests from the shared socket until SIGTERM, then finish the requests in progress and exit."""
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(signum))
+    # Ctrl+C and reloads are for the master, which stops its workers with SIGTERM
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    sampling_profiler.start_from_args(args)
+    exporters = []
+    if args.metrics_port:
+        threading.Thread(target=serve_worker_metrics, args=(args.metrics_host, args.metrics_port + slot, exporters),
+                         daemon=True, name='metrics-bind').start()
+
+    server = create_server(application, sockets=[sock], threads=threads)
+    while not stopping:
+        wasyncore.loop(timeout=1.0, map=server._map, count=1)
+
+    # Hand the metrics port to the worker replacing this one
+    for exporter in exporters:
+        exporter.shutdown()
+        exporter.server_close()
+    # Stop accepting; the socket stays open in the master and the other workers
+    wasyncore.dispatcher.close(server)
+    dispatcher = server.task_dispatcher
+    deadline = time.monotonic() + GRACEFUL_SECONDS
+    while time.monotonic() < deadline and (dispatcher.active_count or dispatcher.queue or busy_channels(server)):
+        wasyncore.loop(timeout=0.2, map=server._map, count=1)
+    dispatcher.shutdown(timeout=1)
+
+def busy_channels(server):
+    """Whether a connection is mid-request, has output to send or was just accepted; idle keep-alives don't count."""
+    now = time.time()
+    return any(channel.total_outbufs_len or channel.requests or channel.request is not None
+               or now - channel.last_activity < 1.0
+               for channel in server.active_channels.values())
+
+def spawn_worker(application, sock, threads, args, slot):
+    pid = os.fork()
+    if pid == 0:
+        status = 1
+        try:
+            run_worker(application, sock, threads, args, slot)
+            status = 0
+        except Exception:
+            logging.exception("Worker %s failed", os.getpid())
+        finally:
+            # Never fall back into the master's loop
+            os._exit(status)
+    return pid
+
+def exited(pid):
+    """Reap worker `pid` if it has exited."""
+    try:
+        return os.waitpid(pid, os.WNOHANG)[0] != 0
+    except ChildProcessError:
+        return True
+
+def stop_workers(pids, timeout):
+    """SIGTERM `pids` and wait for them to exit, killing any still running after `timeout` seconds."""
+    for pid in pids:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    deadline = time.monotonic() + timeout
+    remaining = set(pids)
+    while remaining and time.monotonic() < deadline:
+        remaining = {pid for pid in remaining if not exited(pid)}
+        time.sleep(0.1)
+    for pid in remaining:
+        logging.warning("Worker %s did not stop in time; killing it", pid)
+        os.kill(pid, signal.SIGKILL)
+        exited(pid)
+
+def run_prefork(host, port, threads, workers, args):
+    """Master process: load the app once, then fork `workers` processes that serve one shared socket.
+
+    Workers inherit everything loaded here (the app, the attendance
+    snapshot) copy-on-write instead of each building their own. A dead
+    worker is replaced. SIGHUP reloads the code without refusing
+    connections: the master re-executes itself on the same socket, starts
+    new workers, then lets the old ones finish their requests. SIGTERM or
+    Ctrl+C stops the workers gracefully and exits.
+    """
+    requested = []
+    signal.signal(signal.SIGHUP, lambda signum, frame: requested.append('reload'))
+    signal.signal(signal.SIGTERM, lambda signum, frame: requested.append('stop'))
+    signal.signal(signal.SIGINT, lambda signum, frame: requested.append('stop'))
+
+    sock = listening_socket(host, port)
+    old_workers = [int(pid) for pid in os.environ.pop(OLD_WORKERS_ENV, '').split(',') if pid]
+    try:
+        app_module = load_app(workers)
+        # Load the attendance snapshot before forking so the workers share it
+        loaded = app_module.get_attendance_log().refresh()
+        logging.info("Preloaded %d attendance records", loaded)
+    except Exception:
+        if not old_workers:
+            raise
+        # Leave the previous workers serving; the next SIGHUP tries again
+        logging.exception("Reload failed; the previous workers keep running")
+        app_module = None
+
+    # Running workers (pid -> start time) and old ones finishing their requests (pid -> kill deadline)
+    children = {}
+    draining = {}
+    # Worker number of each running worker (pid -> slot), which picks its metrics port
+    slots = {}
+    if app_module is None:
+        children = {pid: time.monotonic() for pid in old_workers}
+        old_workers = []
+    logging.info("Master %s serving http://%s:%s with %d workers x %d threads", os.getpid(), host, port, workers, threads)
+    while not requested:
+        while app_module is not None and len(children) < workers:
+            slot = min(set(range(workers)) - set(slots.values()))
+            pid = spawn_worker(app_module.app, sock, threads, args, slot)
+            children[pid] = time.monotonic()
+            slots[pid] = slot
+            logging.info("Started worker %s%s", pid,
+                         f" (metrics on port {args.metrics_port + slot})" if args.metrics_port else "")
+        if old_workers:
+            # The new workers are accepting; the old ones finish what they were doing
+            for pid in old_workers:
+                os.kill(pid, signal.SIGTERM)
+                draining[pid] = time.monotonic() + GRACEFUL_SECONDS + 5
+            old_workers = []
+        time.sleep(0.5)
+        try:
+            while True:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+                if pid == 0:
+                    break
+                if draining.pop(pid, None) is not None:
+                    logging.info("Worker %s of the previous code stopped", pid)
+                slots.pop(pid, None)
+                started = children.pop(pid, None)
+                if started is not None:
+                    logging.warning("Worker %s exited with status %s; replacing it", pid, os.waitstatus_to_exitcode(status))
+                    if time.monotonic() - started < RESPAWN_SECONDS:
+                        time.sleep(RESPAWN_SECONDS)
+        except ChildProcessError:
+            pass
+        for pid, deadline in list(draining.items()):
+            if time.monotonic() > deadline:
+                logging.warning("Worker %s did not stop in time; killing it", pid)
+                os.kill(pid, signal.SIGKILL)
+                del draining[pid]
+
+    if requested[0] == 'reload':
+        logging.info("Reloading: starting new workers before stopping %d old ones", len(children) + len(old_workers))
+        os.set_inheritable(sock.fileno(), True)
+        os.environ[LISTEN_FD_ENV] = str(sock.fileno())
+        # Workers not yet told to stop (a reload can arrive before the last one finished)
+        os.environ[OLD_WORKERS_ENV] = ','.join(str(pid) for pid in list(children) + old_workers)
+        # An ignored signal stays ignored across exec, so another SIGHUP cannot kill the master while it starts
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.execv(sys.executable, [sys.executable] + sys.argv)
+    logging.info("Stopping %d workers", len(children) + len(old_workers) + len(draining))
+    stop_workers(list(children) + old_workers + list(draining), GRACEFUL_SECONDS + 5)
+
 def run_app():
     """
     Runs the Flask application using the Waitress production server,
     configured via environment variables.
     """
+    parser = argparse.ArgumentParser(description="Run the web application with Waitress.")
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('APP_WORKERS', 1)),
+                        help="Worker processes sharing the port (default: APP_WORKERS or 1); SIGHUP reloads them. "
+                             "Each worker keeps its own metrics, so /metrics on the app port answers for whichever "
+                             "worker takes the request and restarts from zero on a reload; use --metrics-port")
+    parser.add_argument('--metrics-port', type=int,
+                        default=int(os.environ['APP_METRICS_PORT']) if os.environ.get('APP_METRICS_PORT') else None,
+                        help="Serve each worker's /metrics on its own port: this one plus the worker number "
+                             "(default: APP_METRICS_PORT; a single process uses just this port)")
+    parser.add_argument('--metrics-host', default=os.environ.get('APP_METRICS_HOST', '127.0.0.1'),
+                        help="Address for the --metrics-port exporters (default: APP_METRICS_HOST or 127.0.0.1)")
+    sampling_profiler.add_arguments(parser)
+    args = parser.parse_args()
+
     # Use environment variables for configuration with sensible defaults
     host = os.environ.get('APP_HOST', '0.0.0.0')
     port = int(os.environ.get('APP_PORT', 8080))
     threads = int(os.environ.get('APP_THREADS', 8))
+    workers = max(1, args.workers)
+    if workers > 1 and not hasattr(os, 'fork'):
+        logging.warning("Worker processes need fork(); running a single process on this platform.")
+        workers = 1
 
     logging.info("--- Starting CognAttendance Production Server ---")
     logging.info(f"Host: {host}")
     logging.info(f"Port: {port}")
+    logging.info(f"Worker Processes: {workers}")
     logging.info(f"Worker Threads: {threads}")
     logging.info("Access the application at http://127.0.0.1:%s or your local IP.", port)
     logging.info("Press Ctrl+C to stop the server.")
-    serve(app, host=host, port=port, threads=threads)
+    if workers > 1:
+        run_prefork(host, port, threads, workers, args)
+        return
+    app_module = load_app(workers)
+    sampling_profiler.start_from_args(args)
+    if args.metrics_port:
+        metrics.serve(args.metrics_port, host=args.metrics_host)
+    serve(app_module.app, host=host, port=port, threads=threads)
 
 if __name__ == "__main__":
-    run_app()
\ No newline at end of file
+    run_app()
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Sampling profiler that can be switched on in a running process.
+
+A background thread looks at the Python stack of every other thread a few
+hundred times per second. Where the OS exposes per-thread CPU clocks
+(Linux), only threads that used CPU since the previous sample are recorded,
+so idle Waitress workers and the Tk main loop do not drown out the busy
+ones. The result is written as collapsed stacks (one `thread;outer;...;inner
+count` line per stack, readable by flamegraph.pl and speedscope) and a JSON
+summary of the busiest functions per thread.
+
+The web app profiles itself from /admin/profile. run_production.py,
+recognition.py and main.py take --profile SECONDS to profile the start-up
+period, and on POSIX profile for PROFILE_SECONDS whenever they receive
+SIGUSR1 (`kill -USR1 <pid>`).
+
+Usage (summarise a saved profile):
+    python sampling_profiler.py profiles/20240101-120000-1234.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(SCRIPT_DIR, 'profiles'))
+# Length of a profile started by SIGUSR1
+PROFILE_SECONDS = float(os.environ.get('PROFILE_SECONDS', 30))
+DEFAULT_INTERVAL = 0.005
+MAX_SECONDS = 300
+MAX_STACK_DEPTH = 128
+# Without per-thread CPU clocks, stacks whose innermost frame is in one of
+# these files are counted as waiting rather than working
+IDLE_FILES = ('threading.py', 'selectors.py', 'queue.py', 'socket.py', 'socketserver.py', 'ssl.py')
+TOP_FUNCTIONS = 15
+
+log = logging.getLogger(__name__)
+# Only one profile at a time per process
+_running = threading.Lock()
+
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _thread_cpu_clock(ident):
+    try:
+        return time.pthread_getcpuclockid(ident)
+    except (AttributeError, OSError, OverflowError):
+        return None
+
+
+class Profile:
+    """Stack sample counts per thread from one profiling run."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.started = time.time()
+        self.seconds = 0.0
+        self.ticks = 0
+        self.cpu_sampling = False
+        # (thread name, (outermost frame, ..., innermost frame)) -> samples
+        self.stacks = Counter()
+        self.idle = Counter()
+        self.cpu_seconds = defaultdict(float)
+
+    def collapsed(self):
+        """Collapsed stack text for flamegraph.pl / speedscope, one line per distinct stack."""
+        return ''.join(f"{thread};{';'.join(frames)} {count}\n"
+                       for (thread, frames), count in self.stacks.most_common())
+
+    def summary(self, top=TOP_FUNCTIONS):
+        """Per-thread samples and CPU time, with the functions most often running (self) and on the stack (total)."""
+        threads = {}
+        for (thread, frames), count in self.stacks.items():
+            entry = threads.setdefault(thread, {'samples': 0, 'self': Counter(), 'total': Counter()})
+            entry['samples'] += count
+            entry['self'][frames[-1]] += count
+            for frame in set(frames):
+                entry['total'][frame] += count
+        summary = []
+        for thread in sorted(set(threads) | set(self.idle) | set(self.cpu_seconds),
+                             key=lambda name: -threads.get(name, {'samples': 0})['samples']):
+            entry = threads.get(thread, {'samples': 0, 'self': Counter(), 'total': Counter()})
+            summary.append({
+                'thread': thread,
+                'samples': entry['samples'],
+                'share': entry['samples'] / self.ticks if self.ticks else 0.0,
+                'idle_samples': self.idle[thread],
+                'cpu_seconds': round(self.cpu_seconds[thread], 3) if self.cpu_sampling else None,
+                'top_self': entry['self'].most_common(top),
+                'top_total': entry['total'].most_common(top),
+            })
+        return {
+            'pid': os.getpid(),
+            'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started)),
+            'seconds': round(self.seconds, 3),
+            'interval': self.interval,
+            'ticks': self.ticks,
+            'cpu_sampling': self.cpu_sampling,
+            'threads': summary,
+        }
+
+    def save(self, directory=PROFILE_DIR):
+        """Write `<time>-<pid>.collapsed` and `.json` to `directory`; returns both paths."""
+        os.makedirs(directory, exist_ok=True)
+        base = os.path.join(directory, f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(self.started))}-{os.getpid()}")
+        with open(base + '.collapsed', 'w', encoding='utf-8') as f:
+            f.write(self.collapsed())
+        with open(base + '.json', 'w', encoding='utf-8') as f:
+            json.dump(self.summary(), f, indent=2)
+        return base + '.collapsed', base + '.json'
+
+
+class SamplingProfiler:
+    """Samples the stacks of all other threads from a background thread until stopped."""
+
+    def __init__(self, interval=DEFAULT_INTERVAL):
+        self.interval = interval
+        self.profile = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if not _running.acquire(blocking=False):
+            raise RuntimeError("A profile is already running in this process")
+        self.profile = Profile(self.interval)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop sampling and return the Profile."""
+        self._stop.set()
+        self._thread.join()
+        _running.release()
+        return self.profile
+
+    def _run(self):
+        profile = self.profile
+        own = threading.get_ident()
+        clocks, last_cpu, names = {}, {}, {}
+        started = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            if len(names) != len(frames) or any(ident not in names for ident in frames):
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+            profile.ticks += 1
+            for ident, frame in frames.items():
+                if ident == own:
+                    continue
+                name = names.get(ident, str(ident))
+                if ident not in clocks:
+                    clocks[ident] = _thread_cpu_clock(ident)
+                clock = clocks[ident]
+                if clock is not None:
+                    profile.cpu_sampling = True
+                    try:
+                        cpu = time.clock_gettime(clock)
+                    except OSError:
+                        continue  # thread exited
+                    busy = cpu > last_cpu.get(ident, cpu)
+                    if ident in last_cpu:
+                        profile.cpu_seconds[name] += cpu - last_cpu[ident]
+                    last_cpu[ident] = cpu
+                else:
+                    busy = os.path.basename(frame.f_code.co_filename) not in IDLE_FILES
+                if not busy:
+                    profile.idle[name] += 1
+                    continue
+                stack = []
+                while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                    stack.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                profile.stacks[(name, tuple(reversed(stack)))] += 1
+        profile.seconds = time.perf_counter() - started
+
+
+def profile(seconds, interval=DEFAULT_INTERVAL):
+    """Profile this process for `seconds` (at most MAX_SECONDS) and return the Profile."""
+    profiler = SamplingProfiler(interval).start()
+    try:
+        time.sleep(min(seconds, MAX_SECONDS))
+    finally:
+        result = profiler.stop()
+    return result
+
+
+def profile_in_background(seconds, interval=DEFAULT_INTERVAL, directory=PROFILE_DIR, done=None):
+    """Profile for `seconds` without blocking the caller, then save the result and log where it went.
+
+    `done`, if given, is called from the profiling thread with the saved
+    (collapsed, summary) paths, or None if another profile was running.
+    """
+    def run():
+        paths = None
+        try:
+            log.info("Profiling for %g seconds", seconds)
+            paths = profile(seconds, interval).save(directory)
+            log.info("Profile written to %s and %s", *paths)
+        except RuntimeError as e:
+            log.warning("Profile not started: %s", e)
+        if done is not None:
+            done(paths)
+
+    thread = threading.Thread(target=run, name='profile-timer', daemon=True)
+    thread.start()
+    return thread
+
+
+def install_signal_handler(seconds=PROFILE_SECONDS, interval=DEFAULT_INTERVAL):
+    """Profile for `seconds` whenever the process receives SIGUSR1. Returns False where there is no SIGUSR1."""
+    if not hasattr(signal, 'SIGUSR1') or threading.current_thread() is not threading.main_thread():
+        return False
+    signal.signal(signal.SIGUSR1, lambda signum, frame: profile_in_background(seconds, interval))
+    return True
+
+
+def add_arguments(parser):
+    """Add --profile and --profile-interval to a command-line parser."""
+    parser.add_argument('--profile', type=float, metavar='SECONDS',
+                        help="Profile the first SECONDS after start-up (SIGUSR1 profiles again later)")
+    parser.add_argument('--profile-interval', type=float, default=DEFAULT_INTERVAL * 1000, metavar='MS',
+                        help="Sampling interval in milliseconds")
+
+
+def start_from_args(args):
+    """Install the SIGUSR1 handler and start the start-up profile requested by add_arguments' options."""
+    interval = args.profile_interval / 1000
+    install_signal_handler(interval=interval)
+    if args.profile:
+        profile_in_background(args.profile, interval)
+
+
+def print_summary(summary, top=10):
+    print(f"pid {summary['pid']}, {summary['seconds']}s from {summary['started']}, {summary['ticks']} samples"
+          + ("" if summary['cpu_sampling'] else " (no per-thread CPU clocks; idle detection is approximate)"))
+    for thread in summary['threads']:
+        cpu = f", CPU {thread['cpu_seconds']:.2f}s" if thread['cpu_seconds'] is not None else ""
+        print(f"\n{thread['thread']}: busy in {thread['share']:.0%} of samples{cpu}")
+        for frame, count in thread['top_self'][:top]:
+            print(f"  {count:>7}  {frame}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print the per-thread summary of a saved profile.")
+    parser.add_argument('summary', help="A .json file written next to the .collapsed stacks")
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+    with open(args.summary, encoding='utf-8') as f:
+        print_summary(json.load(f), args.top)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Search-as-you-type helpers for the desktop app.
+
+NgramIndex answers "which texts contain this substring" from posting lists
+of every 3-character substring, so a query only verifies the texts that
+share its rarest trigram instead of scanning them all. Shorter queries
+match most texts anyway and are answered by a scan. Building the index for
+a large roster takes seconds, so callers build it off the Tk thread.
+
+DebouncedSearch runs a search function on a worker thread once typing has
+paused for `delay_ms`. A new query supersedes any that has not finished:
+its result is dropped rather than drawn. Results are handed back to the Tk
+thread through after(), the only thread allowed to touch widgets.
+"""
+
+import queue
+import threading
+from array import array
+
+NGRAM = 3
+# Separates the fields of one text so a query never matches across two of them
+FIELD_SEPARATOR = '\x00'
+DEBOUNCE_MS = 250
+RESULT_POLL_MS = 30
+
+
+class NgramIndex:
+    """Substring index over a list of texts (each text may join several fields)."""
+
+    def __init__(self, texts, n=NGRAM):
+        self.n = n
+        self.texts = [text.lower() for text in texts]
+        # Positions in ascending order, as 4-byte ints rather than a set of int objects per gram
+        postings = {}
+        for position, text in enumerate(self.texts):
+            for gram in {text[start:start + n] for start in range(len(text) - n + 1)}:
+                if FIELD_SEPARATOR not in gram:
+                    postings.setdefault(gram, array('i')).append(position)
+        self._postings = postings
+
+    @classmethod
+    def of_fields(cls, rows, fields, n=NGRAM):
+        """Index dicts by several fields, e.g. a student's name and ID."""
+        return cls([FIELD_SEPARATOR.join(str(row.get(field) or '') for field in fields) for row in rows], n)
+
+    def search(self, query):
+        """Positions of the texts containing `query` (case-insensitive), in index order."""
+        query = query.strip().lower()
+        if not query:
+            return list(range(len(self.texts)))
+        if len(query) < self.n:
+            return [position for position, text in enumerate(self.texts) if query in text]
+        if len(query) == self.n:
+            return list(self._postings.get(query, ()))
+        rarest = min((self._postings.get(query[i:i + self.n], ()) for i in range(len(query) - self.n + 1)), key=len)
+        return [position for position in rarest if query in self.texts[position]]
+
+
+class DebouncedSearch:
+    """Runs `search(query)` off the Tk thread after a pause in typing and calls `show(query, result)` on it.
+
+    `show` gets the exception instead of a result if the search raised.
+    """
+
+    def __init__(self, widget, search, show, delay_ms=DEBOUNCE_MS):
+        self.widget = widget
+        self.search = search
+        self.show = show
+        self.delay_ms = delay_ms
+        self._timer = None
+        self._sequence = 0
+        self._requests = queue.Queue()
+        self._results = queue.Queue()
+        self._polling = False
+        threading.Thread(target=self._work, name='search', daemon=True).start()
+
+    def request(self, query):
+        """Search for `query` once nothing else has been typed for `delay_ms`."""
+        if self._timer is not None:
+            self.widget.after_cancel(self._timer)
+        self._timer = self.widget.after(self.delay_ms, self.now, query)
+
+    def now(self, query):
+        """Search for `query` straight away, superseding any search still pending or running."""
+        if self._timer is not None:
+            self.widget.after_cancel(self._timer)
+            self._timer = None
+        self._sequence += 1
+        self._requests.put((self._sequence, query))
+        if not self._polling:
+            self._polling = True
+            self.widget.after(RESULT_POLL_MS, self._poll)
+
+    def _work(self):
+        while True:
+            sequence, query = self._requests.get()
+            # Skip straight to the newest query if more arrived meanwhile
+            while not self._requests.empty():
+                sequence, query = self._requests.get()
+            if sequence != self._sequence:
+                continue
+            try:
+                result = self.search(query)
+            except Exception as e:
+                result = e
+            self._results.put((sequence, query, result))
+
+    def _poll(self):
+        latest = None
+        while not self._results.empty():
+            latest = self._results.get()
+        if latest is not None and latest[0] == self._sequence:
+            self._polling = False
+            self.show(latest[1], latest[2])
+            return
+        self.widget.after(RESULT_POLL_MS, self._poll)
@@ -4,19 +4,28 @@ warnings.filterwarnings("ignore", category=UserWarning)
 import tkinter as tk
 from tkinter import messagebox, scrolledtext, ttk, filedialog
 import os
-import webbrowser
+import queue
+import threading
+
+import numpy as np
+
+import face_store
+import sampling_profiler
+from attendance_snapshot import AttendanceSnapshot
+from search_index import DebouncedSearch, NgramIndex
+from virtual_treeview import VirtualTreeview
 
 try:
     # Try to use the new SQL database module first
     from database_sql import (
         get_all_students, get_student_by_id, add_student, delete_student_by_id,
-        get_attendance, mark_attendance_db, delete_attendance_by_id, get_next_student_id, KNOWN_FACES_DIR
+        mark_attendance_db, delete_attendance_by_id, get_next_student_id, KNOWN_FACES_DIR, create_tables
     )
 except ImportError:
     # Fallback to the original SQLite database module
     from database import (
         get_all_students, get_student_by_id, add_student, delete_student_by_id,
-        get_attendance, mark_attendance_db, delete_attendance_by_id, get_next_student_id, KNOWN_FACES_DIR
+        mark_attendance_db, delete_attendance_by_id, get_next_student_id, KNOWN_FACES_DIR, create_tables
     )
 
 # --- Optional heavy deps (cv2, face_recognition, PIL) ---
@@ -33,6 +42,15 @@ def _lazy_imports():
             f"Install with: pip install opencv-python face_recognition pillow\n\nDetails: {e}"
         )
 
+# How often the live camera checks the database for gallery changes
+GALLERY_POLL_MS = 2000
+# How often the Tk thread looks for the result of a gallery check running on its worker thread
+GALLERY_RESULT_POLL_MS = 100
+# How often the attendance tab picks up records marked by other processes
+ATTENDANCE_POLL_MS = 3000
+# Length of a profile started from the settings panel
+PROFILE_SECONDS = 30
+
 # Ensure the known_faces directory exists
 os.makedirs(KNOWN_FACES_DIR, exist_ok=True)
 
@@ -68,10 +86,16 @@ class FancyApp:
 
         self.avatar = None
         self.avatar_label = None
+        self.student_view = None
         self.student_table = None
         self.attendance_columns = ("ID", "Name", "Date", "Time")
+        self.attendance_view = None
         self.attendance_table = None
         self.combo_camera = None
+        self.match_mode_var = tk.StringVar(value='min')
+        self.auto_enrich_var = tk.BooleanVar(value=False)
+        self.quality_gate_var = tk.BooleanVar(value=True)
+        self.liveness_var = tk.BooleanVar(value=False)
         self.btn_settings = None
         self.left_panel = None
         self.center_panel = None
@@ -81,16 +105,32 @@ class FancyApp:
         self.student_search_var = tk.StringVar()
         self.attendance_search_var = tk.StringVar()
         self.all_students_data = []
-        self.all_attendance_data = []
+        # Students matching the current search, in table order
+        self.student_rows = []
+        # Columnar copy of the attendance log, caught up incrementally before each load
+        self.attendance_log = AttendanceSnapshot()
+        # Snapshot positions of the rows in the attendance table, and the search that chose them
+        self.attendance_positions = np.empty(0, dtype=np.int64)
+        self.attendance_query = None
+        self.attendance_generation = None
+        # Length of the snapshot when the rows in the table were chosen
+        self.attendance_seen = 0
+        # (students, their NgramIndex or None until it is built); replaced under the lock
+        self.student_search_data = ([], None)
+        self.student_index_lock = threading.Lock()
+        # Searches run on a worker thread once typing pauses
+        self.student_search = DebouncedSearch(master, self.find_students, self.show_students)
+        self.attendance_search = DebouncedSearch(master, self.find_attendance, self.show_attendance)
 
         self.setup_styles()
         self.create_widgets()
 
         self.load_students()
         self.load_attendance()
+        self.master.after(ATTENDANCE_POLL_MS, self.poll_attendance)
 
         # Check if the database is empty and guide the user
-        if not self.student_table.get_children():
+        if not self.all_students_data:
             self.show_status("Welcome! Your database is empty. Add students to begin.", "accent")
 
     def setup_styles(self):
@@ -208,6 +248,7 @@ class FancyApp:
         search_entry = ttk.Entry(top_bar, textvariable=self.student_search_var, width=40, font=self.fonts["main"])
         search_entry.pack(side="left", padx=(0, 5), fill="x", expand=True)
         search_entry.bind("<Return>", self.search_students)
+        self.student_search_var.trace_add("write", lambda *_: self.student_search.request(self.student_search_var.get()))
 
         ttk.Button(top_bar, text="🔍 Search", style="Soft.TButton", command=self.search_students).pack(side="left", padx=5)
         
@@ -219,14 +260,13 @@ class FancyApp:
         table_frame = ttk.Frame(parent)
         table_frame.pack(fill="both", expand=True, padx=10, pady=10)
         cols = ("ID", "Name", "Faculty", "Email", "Address", "DOB")
-        self.student_table = ttk.Treeview(table_frame, columns=cols, show="headings", selectmode="browse")
+        # Like the attendance table, only the rows on screen are Treeview items
+        self.student_view = VirtualTreeview(table_frame, cols, selectmode="browse")
+        self.student_table = self.student_view.tree
         for c in cols:
             self.student_table.heading(c, text=c)
             self.student_table.column(c, width=140, anchor="w")
-        self.student_table.pack(side="left", fill="both", expand=True)
-        sb = ttk.Scrollbar(table_frame, orient="vertical", command=self.student_table.yview)
-        self.student_table.configure(yscrollcommand=sb.set)
-        sb.pack(side="right", fill="y")
+        self.student_view.pack(fill="both", expand=True)
         self.student_table.bind("<<TreeviewSelect>>", self.on_table_select)
 
 
@@ -238,6 +278,7 @@ class FancyApp:
         search_entry = ttk.Entry(top_bar, textvariable=self.attendance_search_var, width=40, font=self.fonts["main"])
         search_entry.pack(side="left", padx=(0, 5), fill="x", expand=True)
         search_entry.bind("<Return>", self.search_attendance)
+        self.attendance_search_var.trace_add("write", lambda *_: self.attendance_search.request(self.attendance_search_var.get()))
 
         ttk.Button(top_bar, text="🔍 Search", style="Soft.TButton", command=self.search_attendance).pack(side="left", padx=5)
         ttk.Button(top_bar, text="🗑️ Delete Selected", style="Soft.TButton", command=self.delete_selected_attendance).pack(side="right", padx=5)
@@ -246,14 +287,13 @@ class FancyApp:
         # Table
         att_frame = ttk.Frame(parent)
         att_frame.pack(fill="both", expand=True, padx=10, pady=10)
-        self.attendance_table = ttk.Treeview(att_frame, columns=self.attendance_columns, show="headings")
+        # Only the rows on screen exist as Treeview items; the rest are fetched while scrolling
+        self.attendance_view = VirtualTreeview(att_frame, self.attendance_columns)
+        self.attendance_table = self.attendance_view.tree
         for c, w in zip(self.attendance_columns, (150, 220, 150, 150)):
             self.attendance_table.heading(c, text=c)
             self.attendance_table.column(c, width=w, anchor="w")
-        self.attendance_table.pack(side="left", fill="both", expand=True)
-        asb = ttk.Scrollbar(att_frame, orient="vertical", command=self.attendance_table.yview)
-        self.attendance_table.configure(yscrollcommand=asb.set)
-        asb.pack(side="right", fill="y")
+        self.attendance_view.pack(fill="both", expand=True)
 
     def build_settings(self, parent):
         parent.configure(style="Card.TFrame")
@@ -267,10 +307,28 @@ class FancyApp:
         self.combo_camera.set('0')
         self.combo_camera.pack(fill="x", padx=10, pady=(0, 10))
 
+        match_frame = tk.LabelFrame(parent, text="Face Matching", background=self.colors["card"], foreground=self.colors["text"], font=self.fonts["bold"], relief="solid", borderwidth=1, bd=1)
+        match_frame.pack(fill="x", padx=20, pady=10, ipady=5)
+        tk.Label(match_frame, text="Match against (min: closest photo, centroid: average)",
+                 background=self.colors["card"], foreground=self.colors["muted"]).pack(anchor="w", padx=10)
+        ttk.Combobox(match_frame, textvariable=self.match_mode_var, values=['min', 'centroid'], state="readonly",
+                     font=self.fonts["main"]).pack(fill="x", padx=10, pady=(0, 6))
+        tk.Checkbutton(match_frame, text="Learn from confident live captures", variable=self.auto_enrich_var,
+                       background=self.colors["card"], foreground=self.colors["text"],
+                       selectcolor=self.colors["bg"], activebackground=self.colors["card"]).pack(anchor="w", padx=10)
+        tk.Checkbutton(match_frame, text="Skip small, blurry and turned faces", variable=self.quality_gate_var,
+                       background=self.colors["card"], foreground=self.colors["text"],
+                       selectcolor=self.colors["bg"], activebackground=self.colors["card"]).pack(anchor="w", padx=10)
+        tk.Checkbutton(match_frame, text="Also require a blink (liveness)", variable=self.liveness_var,
+                       background=self.colors["card"], foreground=self.colors["text"],
+                       selectcolor=self.colors["bg"], activebackground=self.colors["card"]).pack(anchor="w", padx=10)
+
         util = tk.LabelFrame(parent, text="Utilities", background=self.colors["card"], foreground=self.colors["text"], font=self.fonts["bold"], relief="solid", borderwidth=1, bd=1)
         util.pack(fill="x", padx=20, pady=10, ipady=5)
         ttk.Button(util, text="🌐 Open Web App", style="Soft.TButton",
                    command=self.open_web_app).pack(fill="x", padx=10, pady=6)
+        ttk.Button(util, text=f"⏱ Profile {PROFILE_SECONDS} seconds", style="Soft.TButton",
+                   command=self.start_profile).pack(fill="x", padx=10, pady=6)
 
     def animate_settings_panel(self, reverse=False):
         if reverse: # Close panel
@@ -303,8 +361,25 @@ class FancyApp:
 
     @staticmethod
     def open_web_app():
+        import webbrowser
         webbrowser.open("http://127.0.0.1:5000")
 
+    def start_profile(self):
+        """Sample what the application is doing (e.g. during a camera session) and save a flamegraph profile."""
+        result = []
+        sampling_profiler.profile_in_background(PROFILE_SECONDS, done=result.append)
+        self.show_status(f"Profiling for {PROFILE_SECONDS} seconds...", "accent")
+
+        def wait_for_profile():
+            if not result:
+                self.master.after(500, wait_for_profile)
+            elif result[0] is None:
+                self.show_status("A profile is already running.", "warning")
+            else:
+                self.show_status(f"Profile saved to {result[0][0]}", "success")
+
+        self.master.after(500, wait_for_profile)
+
     def show_status(self, message, level="info"):
         self.status_label.config(text=f" {message}")
         if level == "info":
@@ -320,37 +395,58 @@ class FancyApp:
 
     # ===================== Behaviors =====================
     def load_students(self, query=None):
-        for item in self.student_table.get_children():
-            self.student_table.delete(item)
-        
-        if not self.all_students_data or query is None:
-            self.all_students_data = get_all_students()
-
-        students_to_display = self.all_students_data
+        students = get_all_students()
+        self.all_students_data = students
+        # Replaced as a pair, never modified, so the search thread can use them while a reload happens
+        with self.student_index_lock:
+            self.student_search_data = (students, None)
+        # Indexing a large roster takes seconds; searches scan the list until it is ready
+        threading.Thread(target=self.index_students, args=(students,), name='student-index', daemon=True).start()
         if query:
-            query = query.lower()
-            students_to_display = [s for s in self.all_students_data if query in s.get('name', '').lower() or query in s.get('id', '').lower()]
-
-        for student in students_to_display:
-            values = (
-                student.get('id', ''),
-                student.get('name', ''),
-                student.get('faculty', ''),
-                student.get('email', ''),
-                student.get('address', ''),
-                student.get('dob', '')
-            )
-            self.student_table.insert("", "end", values=values)
-        
+            self.student_search.now(query)
+        else:
+            self.show_students(query, students)
+
+    def index_students(self, students):
+        index = NgramIndex.of_fields(students, ('name', 'id'))
+        with self.student_index_lock:
+            # A reload while indexing has made this list stale
+            if self.student_search_data[0] is students:
+                self.student_search_data = (students, index)
+
+    def find_students(self, query):
+        students, index = self.student_search_data
+        if index is not None:
+            return [students[i] for i in index.search(query)]
+        query = query.strip().lower()
+        return [student for student in students
+                if query in str(student.get('name') or '').lower() or query in str(student.get('id') or '').lower()]
+
+    def show_students(self, query, students_to_display):
+        if isinstance(students_to_display, Exception):
+            self.show_status(f"Search failed: {students_to_display}", "error")
+            return
+        self.student_rows = students_to_display
+        self.student_view.set_rows(len(students_to_display), self.fetch_student_rows)
+
         if query:
             self.show_status(f"Found {len(students_to_display)} students matching '{query}'.", "info")
         else:
             self.show_status(f"Loaded {len(students_to_display)} students.", "info")
 
 
+    def fetch_student_rows(self, offset, count):
+        return [(student['id'], (
+            student.get('id', ''),
+            student.get('name', ''),
+            student.get('faculty', ''),
+            student.get('email', ''),
+            student.get('address', ''),
+            student.get('dob', '')
+        )) for student in self.student_rows[offset:offset + count]]
+
     def search_students(self, _event=None):
-        query = self.student_search_var.get()
-        self.load_students(query=query)
+        self.student_search.now(self.student_search_var.get())
 
     def on_table_select(self, _event=None):
         sel = self.student_table.selection()
@@ -374,10 +470,13 @@ class FancyApp:
 
         try:
             _, _, Image, ImageTk = _lazy_imports()  # noqa
-            img_path = os.path.join(KNOWN_FACES_DIR, f"{student_id}.jpg")
-            if os.path.exists(img_path):
+            # The ingest pipeline pre-renders a 256x256 avatar; only legacy
+            # images without one are resized here.
+            img_path = face_store.student_image_path(student, 'avatar')
+            if img_path:
                 img = Image.open(img_path)
-                img = img.resize((256, 256), Image.Resampling.LANCZOS)
+                if img.size != (256, 256):
+                    img = img.resize((256, 256), Image.Resampling.LANCZOS)
                 imgtk = ImageTk.PhotoImage(image=img)
                 self.avatar.config(image=imgtk)
                 self.avatar.image = imgtk
@@ -390,34 +489,62 @@ class FancyApp:
             self.avatar.image = None
 
     def load_attendance(self, query=None):
-        for i in self.attendance_table.get_children():
-            self.attendance_table.delete(i)
-        
-        if not self.all_attendance_data or query is None:
-            self.all_attendance_data = get_attendance()
+        self.attendance_log.refresh()
+        self.show_attendance(query, self.find_attendance(query))
 
-        records_to_display = self.all_attendance_data
-        if query:
-            query = query.lower()
-            records_to_display = [r for r in self.all_attendance_data if query in r.get('name', '').lower() or query in r.get('student_id', '').lower() or query in r.get('date', '')]
-
-        for rec in records_to_display:
-            values = (
-                rec.get('student_id', ''),
-                rec.get('name', ''),
-                rec.get('date', ''),
-                rec.get('time', '')
-            )
-            self.attendance_table.insert("", "end", iid=rec.get('id'), values=values)
+    def find_attendance(self, query):
+        # Rows appended while this runs are left to show_new_attendance
+        generation, count = self.attendance_log.generation, len(self.attendance_log)
+        return generation, count, self.attendance_log.select(query, upto=count)
+
+    def show_attendance(self, query, result):
+        if isinstance(result, Exception):
+            self.show_status(f"Search failed: {result}", "error")
+            return
+        generation, count, positions = result
+        if generation != self.attendance_log.generation:
+            # The snapshot was reloaded during the search, so the positions are stale
+            self.load_attendance(query)
+            return
+        self.attendance_query = query
+        self.attendance_positions = positions
+        self.attendance_generation = generation
+        self.attendance_seen = count
+        self.attendance_view.set_rows(len(positions), self.fetch_attendance_rows)
+        self.show_new_attendance(refresh=False)
         
         if query:
-            self.show_status(f"Found {len(records_to_display)} attendance records matching '{query}'.", "info")
+            self.show_status(f"Found {len(self.attendance_positions)} attendance records matching '{query}'.", "info")
         else:
-            self.show_status(f"Loaded {len(records_to_display)} attendance records.", "info")
+            self.show_status(f"Loaded {len(self.attendance_positions)} attendance records.", "info")
+
+    def fetch_attendance_rows(self, offset, count):
+        records = self.attendance_log.records(self.attendance_positions[offset:offset + count])
+        return [(rec['id'], (rec['student_id'], rec['name'], rec['date'], rec['time'])) for rec in records]
+
+    def show_new_attendance(self, refresh=True):
+        """Add just-marked records to the top of the attendance table without reloading it."""
+        if refresh:
+            self.attendance_log.refresh()
+        if self.attendance_log.generation != self.attendance_generation:
+            self.load_attendance(self.attendance_query)
+            return
+        count = len(self.attendance_log)
+        added = self.attendance_log.select(self.attendance_query, positions=range(self.attendance_seen, count))
+        self.attendance_seen = count
+        self.attendance_positions = np.concatenate([added, self.attendance_positions])
+        self.attendance_view.insert_top(len(added))
+
+    def poll_attendance(self):
+        """Show records marked elsewhere (the web app, recognition.py) as they arrive."""
+        try:
+            self.show_new_attendance()
+        except Exception as e:
+            self.show_status(f"Could not check for new attendance: {e}", "error")
+        self.master.after(ATTENDANCE_POLL_MS, self.poll_attendance)
 
     def search_attendance(self, _event=None):
-        query = self.attendance_search_var.get()
-        self.load_attendance(query=query)
+        self.attendance_search.now(self.attendance_search_var.get())
 
     def delete_selected_attendance(self):
         sel = self.attendance_table.selection()
@@ -429,7 +556,7 @@ class FancyApp:
             return
 
         if delete_attendance_by_id(att_id):
-            self.all_attendance_data = [] # Force reload
+            self.attendance_log.remove([int(att_id)])
             self.load_attendance()
             self.show_status("Attendance record deleted.", "success")
         else:
@@ -457,8 +584,6 @@ class FancyApp:
         try:
             delete_student_by_id(student_id)
             self.show_status(f"Student {name} deleted.", "success")
-            self.all_students_data = [] # Force reload
-            self.all_attendance_data = []
             self.load_students()
             self.load_attendance()
         except Exception as e:
@@ -478,27 +603,20 @@ class FancyApp:
             messagebox.showerror("No Students Registered", "There are no students in the database. Please register a student first.")
             return
 
-        known_encodings = []
-        known_ids = []
-        loading_errors = []
-        for student_data in students:
-            student_id = student_data.get('id')
-            img_path = os.path.join(KNOWN_FACES_DIR, f"{student_id}.jpg")
-            if os.path.exists(img_path):
-                try:
-                    img = face_recognition.load_image_file(img_path)
-                    face_encs = face_recognition.face_encodings(img)
-                    if face_encs:
-                        known_encodings.append(face_encs[0])
-                        known_ids.append(student_id)
-                    else:
-                        loading_errors.append(f"No face detected for ID: {student_id}")
-                except Exception as e:
-                    loading_errors.append(f"Error with image for ID {student_id}: {e}")
-            else:
-                loading_errors.append(f"Image not found for ID: {student_id}")
+        from face_gallery import apply_gallery_updates, load_gallery, read_gallery_changes
+        from recognition import RecognitionPipeline
 
-        if not known_encodings:
+        # Templates stored at enrollment are used as-is; only students without
+        # any have their photo encoded (and stored) here.
+        gallery, loading_errors = load_gallery(students, mode=self.match_mode_var.get())
+        gate = None
+        if self.quality_gate_var.get():
+            from face_quality import QualityGate
+            gate = QualityGate(liveness=self.liveness_var.get())
+        pipeline = RecognitionPipeline(gallery, gate=gate, auto_enrich=self.auto_enrich_var.get(),
+                                       mark_attendance=mark_attendance_db, face_recognition=face_recognition)
+
+        if not len(gallery):
             error_details = "\n".join(loading_errors)
             messagebox.showerror(
                 "No Faces Loaded",
@@ -547,10 +665,49 @@ class FancyApp:
                                 font=self.fonts["bold"])
         status_label.pack(pady=10)
 
+        quality_label = tk.Label(video_frame, text="", background=self.colors["card"], fg=self.colors["muted"],
+                                 font=self.fonts["main"])
+        quality_label.pack()
+
         stop_btn = ttk.Button(video_frame, text="Stop", style="Soft.TButton", command=cam_window.destroy)
         stop_btn.pack(pady=10)
 
-        seen_today = set()
+
+        gallery_results = queue.Queue()
+
+        def read_changes(change_id):
+            try:
+                gallery_results.put(read_gallery_changes(change_id))
+            except Exception as e:
+                gallery_results.put(e)
+
+        def poll_gallery():
+            # Pick up students registered, edited or deleted elsewhere (e.g. the web app). Reading the
+            # changes, and encoding photos that have no template yet, happens off the Tk thread.
+            if not cam_window.winfo_exists():
+                return
+            threading.Thread(target=read_changes, args=(gallery.change_id,), name='gallery-poll', daemon=True).start()
+            cam_window.after(GALLERY_RESULT_POLL_MS, show_gallery_changes)
+
+        def show_gallery_changes():
+            if not cam_window.winfo_exists():
+                return
+            try:
+                result = gallery_results.get_nowait()
+            except queue.Empty:
+                cam_window.after(GALLERY_RESULT_POLL_MS, show_gallery_changes)
+                return
+            if isinstance(result, Exception):
+                status_label.config(text=f"Could not refresh faces: {result}", fg=self.colors["red"])
+            else:
+                change_id, updates, errors = result
+                changed = apply_gallery_updates(gallery, change_id, updates)
+                if changed:
+                    message = f"Face gallery updated ({len(changed)} student(s))"
+                    if errors:
+                        message += f"; {len(errors)} without a usable photo"
+                    status_label.config(text=message, fg=self.colors["accent"])
+            cam_window.after(GALLERY_POLL_MS, poll_gallery)
 
         def update_frame():
             nonlocal cap
@@ -561,40 +718,33 @@ class FancyApp:
             if not ret:
                 status_label.config(text="Camera error.")
                 return
-            rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            face_locations = face_recognition.face_locations(rgb)
-            face_encodings = face_recognition.face_encodings(rgb, face_locations)
-
-            for enc, loc in zip(face_encodings, face_locations):
-                matches = face_recognition.compare_faces(known_encodings, enc)
-
-                if True in matches:
-                    first_match_index = matches.index(True)
-                    sid = known_ids[first_match_index]
-                    current_student = get_student_by_id(sid)
-                    name = current_student.get('name', 'Unknown')
-
-                    if sid in seen_today:
+            result = pipeline.process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+            if gate is not None:
+                quality_label.config(text=gate.summary())
+
+            for face in result['faces']:
+                y1, x2, y2, x1 = face['location']
+                sid, name = face['student_id'], face['name']
+                if sid is not None:
+                    if face['status'] == 'seen':
                         status_label.config(text=f"Already marked: {name} ({sid})", fg=self.colors["accent"])
+                    elif face['status'] == 'marked':
+                        self.show_new_attendance()
+                        status_label.config(text=f"Attendance marked: {name} ({sid})", fg=self.colors["green"])
                     else:
-                        new_row = mark_attendance_db(sid)
-                        if new_row:
-                            seen_today.add(sid)
-                            self.all_attendance_data = [] # Force reload
-                            self.load_attendance()
-                            status_label.config(text=f"Attendance marked: {name} ({sid})", fg=self.colors["green"])
-                        else:
-                            status_label.config(text=f"Duplicate (12h rule): {name} ({sid})", fg=self.colors["muted"])
-
-                    y1, x2, y2, x1 = loc
+                        status_label.config(text=f"Duplicate (12h rule): {name} ({sid})", fg=self.colors["muted"])
+
                     cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
                     cv2.putText(frame, name, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 255, 0), 2)
                 else:
-                    y1, x2, y2, x1 = loc
                     cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 0, 255), 2)
                     cv2.putText(frame, "Not Registered. Please Register.", (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
                     status_label.config(text="Unknown face detected. Please register.", fg=self.colors["red"])
 
+            for (y1, x2, y2, x1), reason in result['skipped']:
+                cv2.rectangle(frame, (x1, y1), (x2, y2), (160, 160, 160), 1)
+                cv2.putText(frame, reason.replace('_', ' '), (x1, y1 - 8), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (160, 160, 160), 1)
+
             disp = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
             disp = cv2.resize(disp, (860, 540))
             imgtk = ImageTk.PhotoImage(Image.fromarray(disp))
@@ -608,9 +758,11 @@ class FancyApp:
                 cv2.destroyAllWindows()
 
         update_frame()
+        cam_window.after(GALLERY_POLL_MS, poll_gallery)
 
 # ---- launch ----
 if __name__ == "__main__":
+    create_tables()
     root = tk.Tk()
     app = FancyApp(root)
     root.mainloop()
\ No newline at end of file
@@ -0,0 +1,145 @@
+"""
+A ttk.Treeview that only holds the rows currently on screen.
+
+Tk keeps every inserted item as a widget-side record, so filling a
+Treeview with a million attendance rows takes minutes and hundreds of MB.
+VirtualTreeview instead knows just the row count and a `fetch(offset,
+count)` callback; it materializes the visible rows, asks for more in pages
+as the user scrolls, and keeps a few recent pages so scrolling back is free.
+
+Rows are (iid, values) pairs. Selections are plain Treeview item IDs, so
+callers use `tree.selection()` as before.
+"""
+
+from collections import OrderedDict
+from tkinter import ttk
+
+# Rows fetched per callback and how many such pages are kept
+PAGE_ROWS = 200
+CACHED_PAGES = 8
+WHEEL_ROWS = 3
+
+
+class VirtualTreeview(ttk.Frame):
+    """A Treeview plus scrollbar over `total` rows supplied by a fetch(offset, count) callback."""
+
+    def __init__(self, parent, columns, fetch=None, total=0, **tree_options):
+        super().__init__(parent)
+        self.tree = ttk.Treeview(self, columns=columns, show="headings", **tree_options)
+        self.tree.pack(side="left", fill="both", expand=True)
+        self.scrollbar = ttk.Scrollbar(self, orient="vertical", command=self._on_scrollbar)
+        self.scrollbar.pack(side="right", fill="y")
+
+        self.fetch = fetch
+        self.total = total
+        self.offset = 0
+        self._visible = 1
+        self._pages = OrderedDict()
+
+        self.tree.bind("<Configure>", self._on_resize)
+        self.tree.bind("<MouseWheel>", self._on_wheel)
+        self.tree.bind("<Button-4>", lambda _e: self.scroll(-WHEEL_ROWS) or "break")
+        self.tree.bind("<Button-5>", lambda _e: self.scroll(WHEEL_ROWS) or "break")
+        for key, step in (("<Up>", -1), ("<Down>", 1), ("<Prior>", None), ("<Next>", None)):
+            self.tree.bind(key, lambda e, step=step: self._on_key(e, step))
+        self.tree.bind("<Home>", lambda _e: self.scroll_to(0) or "break")
+        self.tree.bind("<End>", lambda _e: self.scroll_to(self.total) or "break")
+
+    # --- Data --- #
+    def set_rows(self, total, fetch):
+        """Show a new result set from the top."""
+        self.total, self.fetch, self.offset = total, fetch, 0
+        self._pages.clear()
+        self.refresh()
+
+    def insert_top(self, count):
+        """`count` rows were added in front of the current ones; keep the rows on screen where they are."""
+        if count <= 0:
+            return
+        self.total += count
+        self._pages.clear()
+        if self.offset:
+            self.offset += count
+        self.refresh()
+
+    def _rows(self, start, stop):
+        rows = []
+        for page in range(start // PAGE_ROWS, (stop - 1) // PAGE_ROWS + 1):
+            if page in self._pages:
+                self._pages.move_to_end(page)
+            else:
+                self._pages[page] = self.fetch(page * PAGE_ROWS, PAGE_ROWS)
+                if len(self._pages) > CACHED_PAGES:
+                    self._pages.popitem(last=False)
+            base = page * PAGE_ROWS
+            rows.extend(self._pages[page][max(start - base, 0):stop - base])
+        return rows
+
+    def refresh(self):
+        """Redraw the visible rows (after a scroll, resize or data change)."""
+        self.offset = max(0, min(self.offset, self.total - self._visible))
+        stop = min(self.offset + self._visible, self.total)
+        rows = self._rows(self.offset, stop) if self.fetch and stop > self.offset else []
+        selected = set(self.tree.selection())
+        self.tree.delete(*self.tree.get_children())
+        for iid, values in rows:
+            self.tree.insert("", "end", iid=iid, values=values)
+        self.tree.selection_set([iid for iid, _ in rows if str(iid) in selected])
+        if self.total:
+            self.scrollbar.set(self.offset / self.total, stop / self.total)
+        else:
+            self.scrollbar.set(0, 1)
+
+    # --- Scrolling --- #
+    def scroll(self, rows):
+        self.scroll_to(self.offset + rows)
+
+    def scroll_to(self, offset):
+        offset = max(0, min(offset, self.total - self._visible))
+        if offset != self.offset:
+            self.offset = offset
+            self.refresh()
+
+    def _on_scrollbar(self, action, amount, unit=None):
+        if action == "moveto":
+            self.scroll_to(int(float(amount) * self.total))
+        elif action == "scroll":
+            self.scroll(int(amount) * (self._visible if unit == "pages" else 1))
+
+    def _on_wheel(self, event):
+        # Windows reports multiples of 120 per notch, macOS small deltas
+        notches = event.delta // 120 if abs(event.delta) >= 120 else (1 if event.delta > 0 else -1)
+        self.scroll(-notches * WHEEL_ROWS)
+        return "break"
+
+    def _on_key(self, event, step):
+        """Arrow and page keys move past the visible window instead of stopping at its edge."""
+        items = self.tree.get_children()
+        if step is None:
+            self.scroll(self._visible if event.keysym == "Next" else -self._visible)
+            return "break"
+        focus = self.tree.focus()
+        if not items or focus not in items:
+            return None
+        index = items.index(focus) + step
+        if 0 <= index < len(items):
+            return None  # Treeview moves within the window itself
+        self.scroll(step)
+        items = self.tree.get_children()
+        if items:
+            item = items[0] if step < 0 else items[-1]
+            self.tree.focus(item)
+            self.tree.selection_set(item)
+        return "break"
+
+    def _on_resize(self, event):
+        row_height = int(ttk.Style().lookup("Treeview", "rowheight") or 20)
+        items = self.tree.get_children()
+        # The heading's height is where the first row starts
+        bbox = self.tree.bbox(items[0]) if items else None
+        heading = bbox[1] if bbox else row_height
+        visible = max(1, (event.height - heading) // row_height)
+        if visible != self._visible:
+            self._visible = visible
+            self.refresh()
+